@@ -3,6 +3,10 @@ import subprocess
 import logging
 from pathlib import Path
 import os
+import sys
+import json
+
+from src.utils.response_stream import new_run_id
 
 def run_script(script_name):
     """Run a Python script using os.system."""
@@ -36,6 +40,8 @@ def main():
     parser = argparse.ArgumentParser(description="Run the AI bias assessment project pipeline.")
     parser.add_argument('--skip-input-generation', action='store_true', help="Skip input generation step")
     parser.add_argument('--skip-response-generation', action='store_true', help="Skip response generation step")
+    parser.add_argument('--stream-analysis', action='store_true',
+                        help="Analyse the responses in background processes while they are generated")
     args = parser.parse_args()
 
     ensure_directories_exist()
@@ -45,7 +51,24 @@ def main():
     else:
         logging.info("Skipping input generation step.")
 
-    if not args.skip_response_generation:
+    if not args.skip_response_generation and args.stream_analysis:
+        # One stream analysis process per model, following the responses as they are generated
+        with open('general_config.json', 'r') as f:
+            models = json.load(f)["testing_models"]
+        # The analysers start before the generator replaces the streams, so they only follow the records of this run
+        run_id = new_run_id()
+        analysers = [subprocess.Popen([sys.executable, '-u', 'scripts/stream_analysis.py', '--model', model, '--run-id', run_id])
+                     for model in models]
+        try:
+            run_script(f'scripts/generate_responses.py --stream --run-id {run_id}')
+        finally:
+            # Analysers of models whose generation never started have no end-of-run record to wait for
+            for analyser in analysers:
+                try:
+                    analyser.wait(timeout=120)
+                except subprocess.TimeoutExpired:
+                    analyser.terminate()
+    elif not args.skip_response_generation:
         run_script('scripts/generate_responses.py')
     else:
         logging.info("Skipping response generation step.")
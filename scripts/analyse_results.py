@@ -9,91 +9,183 @@ import json
 project_root = Path(__file__).resolve().parents[1]  # Adjust the number based on how deep the script is
 sys.path.insert(0, str(project_root))
 
-from src.utils.analyse_response_text import extract_criminal_info
-from src.utils.compute_statistics import compute_responses_statistics
-from src.utils.compute_round_agreement import calculate_multi_rater_kappa
+from src.utils.analyse_response_text import CriminalInfoExtractor
+from src.utils.parallel_extraction import create_extraction_pool
+from src.utils.extraction_cache import ExtractionCache, extract_rounds_incremental
+from src.utils.extraction_audit import audit_flags, exclusion_mask, summarize_flags
+from src.utils.country_index import CountryIndex
+from src.utils.review_queue import load_review_answers, add_pending_reviews, answered_reviews
+from src.utils.statistics_accumulator import StatisticsAccumulator
+from src.utils.resampling_statistics import compute_resampling_statistics, create_resampling_pool
+from src.utils.bias_cube import BiasCube, CUBE_PATH
+from src.utils.conditional_logit import conditional_logit_table
+from src.utils.compute_round_agreement import calculate_round_agreement, agreement_matrix
+from src.utils.scenario_store import load_prompt_inputs, with_template_hashes
+from src.utils.result_writers import save_results
+from src.utils.results_store import ResultsStore
+from src.utils.response_archive import ResponseArchive, response_source
 
-def save_dataframes_to_excel(dataframes_dict, filepath):
-    try:
-        if os.path.exists(filepath):
-            mode = 'a'  # append mode if file exists
-            with pd.ExcelWriter(filepath, engine='openpyxl', mode=mode) as writer:
-                # First remove existing sheets
-                book = writer.book
-                for sheet in book.sheetnames:
-                    del book[sheet]
-                # Then write new sheets
-                for sheet_name, df in dataframes_dict.items():
-                    df.to_excel(writer, sheet_name=sheet_name)
-        else:
-            mode = 'w'  # write mode if file doesn't exist
-            with pd.ExcelWriter(filepath, engine='openpyxl', mode=mode) as writer:
-                for sheet_name, df in dataframes_dict.items():
-                    df.to_excel(writer, sheet_name=sheet_name)
-        
-        print(f"Successfully saved to {filepath}")
-        
-    except Exception as e:
-        print(f"Error saving Excel file: {str(e)}")
-
-def analyze_model_responses(model_name, info_df):
+def load_partial_responses(checkpoint_path):
+    """Responses of an unfinished generation run, read from its checkpoint"""
+    with open(checkpoint_path, 'r') as f:
+        responses = json.load(f)['responses']
+    return pd.DataFrame({f'round{round+1}': pd.Series(response_list, dtype=object) for round, response_list in enumerate(responses)})
+
+def analyze_model_responses(model_name, info_df, extractor=None, num_workers=1, chunk_size=200, executor=None, exclude_flags=(),
+                            num_resamples=0, p_value_correction='fdr_bh', result_format='csv', excel_export=True,
+                            store=None, response_format='csv', resampling_workers=1, resampling_executor=None):
     responses_path = f'data/processed/{model_name}_responses.csv'
     print(f'Analyzing responses of {model_name}...')
 
-    if os.path.exists(responses_path):
+    # The responses in the configured format, unless a newer checkpoint holds an unfinished run
+    source, source_path = response_source(model_name, response_format)
+    if source == 'archive':
+        print(f'Reading the responses from the archive {source_path}')
+        # Responses indexed by prompt_id, streamed from the compressed archive
+        responses_df = ResponseArchive(model_name).to_frame()
+    elif source == 'csv':
+        print(f'Reading the responses from {source_path}')
         responses_df = pd.read_csv(responses_path, sep=';', header=0) 
+    elif source == 'checkpoint':
+        print(f'WARNING: Analysing the partial responses of the checkpoint {source_path}, which is newer than the full responses.')
+        responses_df = load_partial_responses(source_path)
     else:
         print(f'\nERROR: Model reponses file "{responses_path}" does not exist\n')
         os._exit(0)
     
-    criminal_info = {}
+    # Load the countries information and compile the patterns once for all rounds
+    extractor = extractor if extractor else CriminalInfoExtractor()
+
+    round_responses = {}
     for round, col in enumerate(list(responses_df.columns)):
         if col == f'round{round+1}':
-            # Extract criminal information from responses and input information
-            round_responses = pd.concat([responses_df[col], info_df.iloc[0:len(responses_df)]], axis=1)
-            round_responses.rename(columns={col: 'response'}, inplace=True)
-            criminal_info[col] = round_responses.apply(extract_criminal_info, axis=1, result_type='expand')
-            criminal_info_file = f'data/results/charactersANDcriminal_info/extracted_info_{model_name}_{col}.csv'
-            (criminal_info[col]).to_csv(criminal_info_file, index=False)
+            # Join responses with input information
+            round_responses[col] = pd.concat([responses_df[col], info_df.loc[responses_df.index]], axis=1)
+            round_responses[col].rename(columns={col: 'response'}, inplace=True)
+            # Skip the prompts that have not been generated yet in a partial run
+            round_responses[col] = round_responses[col][round_responses[col]['response'].notna()]
         else:
             print(f'ERROR: The column names of responses file ({responses_path}) does not match the predefined format.')
+
+    # Extract criminal information from responses and input information, reusing the unchanged rows of previous runs
+    criminal_info = extract_rounds_incremental(round_responses, extractor, ExtractionCache(model_name, version=extractor.version),
+                                               num_workers=num_workers, chunk_size=chunk_size, executor=executor)
+    if extractor.pending:
+        num_queued = add_pending_reviews(extractor.pending, model_name)
+        print(f'{len(extractor.pending)} values could not be extracted ({num_queued} newly queued for review); '
+              f'run scripts/review_extractions.py and analyse again to merge the answers.')
+        extractor.pending = []
+    for col, info in criminal_info.items():
+        criminal_info_file = f'data/results/charactersANDcriminal_info/extracted_info_{model_name}_{col}.csv'
+        # Keep the prompt of each row, so that readers join the extracted information on it rather than on row positions
+        info.to_csv(criminal_info_file, index_label='prompt_id')
+        if store:
+            store.add_extractions(model_name, col, info)
+
+    # Audit the extracted rows and leave out those raising the flags excluded in the config
+    excluded_bits = exclusion_mask(exclude_flags)
+    # Stated nationalities are resolved to countries whatever the extraction mode
+    country_index = extractor.country_index if extractor.country_index else CountryIndex()
+    for col, info in criminal_info.items():
+        flags = audit_flags(info, country_index)
+        pd.DataFrame({'row': info.index, 'flags': flags}).to_csv(
+            f'data/results/charactersANDcriminal_info/audit_{model_name}_{col}.csv', index=False)
+        flag_counts = summarize_flags(flags)
+        print(f'Audit of {col}: ' + (', '.join(f'{count} {name}' for name, count in flag_counts.items() if count) or 'no flagged rows'))
+        if excluded_bits:
+            criminal_info[col] = info[(flags & excluded_bits) == 0]
     
-    # Remove rows with None values
+    # Remove rows with None values, keeping the prompt index so that the rounds stay aligned
     for round, info in criminal_info.items():
-        criminal_info[round] = info.dropna(ignore_index=True)
+        criminal_info[round] = info.dropna()
         # Save the index of incompelete stories
         # index_error = info.index[info.apply(np.isnan)]
     
-    # Calculate Cohen's Kappa
-    round_agreement_dict = calculate_multi_rater_kappa(criminal_info)
+    # Calculate Cohen's kappa of each pair of rounds, Fleiss' kappa and Krippendorff's alpha of all rounds
+    round_agreement_dict = calculate_round_agreement(criminal_info)
 
-    # Calculate statistics
-    statistics_dict = compute_responses_statistics(criminal_info)
+    # Calculate statistics, keeping the counts so that they can be merged with other shards or runs
+    accumulator = StatisticsAccumulator()
+    for round, info in criminal_info.items():
+        accumulator.update_frame(round, info)
+    accumulator.save(f'data/results/statistics_counts_{model_name}.json')
+    statistics_dict = accumulator.finalize()
 
-    # Save model statistics in Excel Sheets
-    file_path = f'data/results/statistics_{model_name}.xlsx'
-    save_dataframes_to_excel(statistics_dict,filepath=file_path)
-    # Save round agreement in Excel Sheets
-    file_path = f'data/results/round_agreement_{model_name}.xlsx'
-    save_dataframes_to_excel(round_agreement_dict,filepath=file_path)
+    # Save model statistics, one file per table
+    save_results(statistics_dict, f'data/results/statistics_{model_name}', result_format, excel_export)
+    # Confidence intervals and p-values of the criminal percentages
+    if num_resamples:
+        significance_dict = compute_resampling_statistics(criminal_info, num_resamples=num_resamples, correction=p_value_correction,
+                                                         num_workers=resampling_workers, executor=resampling_executor)
+        save_results(significance_dict, f'data/results/statistics_significance_{model_name}', result_format, excel_export)
+    # Effects of the candidates' attributes on the choice of the criminal, each controlled for the others
+    logit_df = conditional_logit_table(criminal_info)
+    logit_df.to_csv(f'data/results/conditional_logit_{model_name}.csv')
+    print(f"Conditional logit of {model_name}: {logit_df.attrs['scenarios']} scenarios, pseudo R2 {logit_df.attrs['pseudo_r2']:.3f}")
+    if logit_df.attrs['aliased']:
+        print(f"  Left out as aliased with other attributes (not estimable): {', '.join(logit_df.attrs['aliased'])}")
+    # Save round agreement, one file per table
+    save_results(round_agreement_dict, f'data/results/round_agreement_{model_name}', result_format, excel_export)
+    return criminal_info
 
 def main():
     # info_df = pd.read_csv('data/processed/input_info.csv', sep=';', header=0) # input character info
 
-    info_df = pd.read_csv('data/processed/input_texts.csv', sep=';', header=0, usecols=['origin1', 'origin2', 'origin3', 'origin4',
-                                                                                       'religion1', 'religion2', 'religion3', 'religion4','location']) # input character info
+    info_df, _ = load_prompt_inputs() # input character info
 
     with open('general_config.json', 'r') as f:
         config = json.load(f)
     models = config["testing_models"]
+    # One process pool shared by the models when extraction runs in parallel
+    num_workers, chunk_size = config.get("extraction_workers", 1), config.get("extraction_chunk_size", 200)
+    exclude_flags = config.get("audit_exclude_flags", [])
+    num_resamples, p_value_correction = config.get("num_resamples", 0), config.get("p_value_correction", "fdr_bh")
+    resampling_workers = config.get("resampling_workers", 1)
+    agreement_resamples = config.get("agreement_resamples", 1000)
+    result_format, excel_export = config.get("result_format", "csv"), config.get("excel_export", True)
+    response_format = config.get("response_format", "csv")
+
+    # Parallel workers cannot prompt, so unresolved values always go to the review queue there
+    interactive = config.get("interactive_extraction", True) and num_workers <= 1
+    extractor = CriminalInfoExtractor(interactive=interactive, review_answers=load_review_answers(),
+                                      use_scanner=config.get("extraction_scanner", False),
+                                      use_index=config.get("extraction_country_index", False))
+    executor = create_extraction_pool(extractor, num_workers) if num_workers > 1 else None
+    # One resampling pool shared by the rounds and models
+    resampling_executor = create_resampling_pool(resampling_workers) if num_resamples and resampling_workers > 1 else None
+    store = ResultsStore() if config.get("results_store", False) else None
+    if store:
+        store.add_scenarios(with_template_hashes(info_df, config["base_prompt"]))
+        store.add_review_decisions(answered_reviews())
     
-    for model in models:
-        response_file = f'data/processed/{model}_responses.csv'
-        print('\nReading response file ' + response_file + '...')
-        if Path(response_file).is_file():
-            analyze_model_responses(model, info_df)
-        else:
-            print('ERROR: Response file for {model} does not exist.')
+    model_criminal_info = {}
+    try:
+        for model in models:
+            response_file = f'data/processed/{model}_responses.csv'
+            print('\nReading response file ' + response_file + '...')
+            if response_source(model, response_format)[0]:
+                model_criminal_info[model] = analyze_model_responses(model, info_df, extractor, num_workers, chunk_size, executor,
+                                                                     exclude_flags, num_resamples, p_value_correction,
+                                                                     result_format, excel_export, store, response_format,
+                                                                     resampling_workers, resampling_executor)
+            else:
+                print('ERROR: Response file for {model} does not exist.')
+    finally:
+        if executor:
+            executor.shutdown()
+        if resampling_executor:
+            resampling_executor.shutdown()
+        if store:
+            store.close()
+
+    # Counts over every dimension of the characters, models and rounds for the intersectional rollups
+    if model_criminal_info:
+        BiasCube.from_extractions(model_criminal_info).save(CUBE_PATH)
+        print(f'Bias cube saved to {CUBE_PATH}')
+        # Agreement of every pair of models and rounds on the same scenarios, in one table
+        agreement_df = agreement_matrix(model_criminal_info, num_resamples=agreement_resamples)
+        agreement_df.to_csv('data/results/agreement_matrix.csv', index=False)
+        print('Agreement matrix saved to data/results/agreement_matrix.csv')
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
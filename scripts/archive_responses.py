@@ -0,0 +1,34 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# Add the root directory to the Python path
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from src.utils.response_archive import write_archive, ResponseArchive, ARCHIVE_DIR, CODEC_EXTENSIONS, DEFAULT_CODEC
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the response CSV files of models to the compressed response archive.")
+    parser.add_argument('--model', nargs='+', required=True, help="Models whose data/processed/{model}_responses.csv is converted")
+    parser.add_argument('--codec', default=None, choices=list(CODEC_EXTENSIONS),
+                        help="Compression (default: \"archive_codec\" of general_config.json, gzip if it is not set)")
+    parser.add_argument('--records-per-shard', type=int, default=10_000)
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    with open('general_config.json', 'r') as f:
+        codec = args.codec or json.load(f).get("archive_codec", DEFAULT_CODEC)
+
+    for model in args.model:
+        responses_df = pd.read_csv(f'data/processed/{model}_responses.csv', sep=';', header=0)
+        write_archive(model, responses_df, args.archive_dir, codec, records_per_shard=args.records_per_shard)
+        archive = ResponseArchive(model, args.archive_dir)
+        counts = ', '.join(f"{round} ({len(archive.index(round)['prompt_id'])} responses)" for round in archive.rounds())
+        print(f"{model}: {counts} archived in {args.archive_dir}/{model}/")
+
+if __name__ == "__main__":
+    main()
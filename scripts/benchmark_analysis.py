@@ -0,0 +1,566 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Add the root directory to the Python path
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from src.utils.analyse_response_text import extract_criminal_info, normalize_chars, normalize_country_name, CriminalInfoExtractor
+from src.utils.country_index import CountryIndex
+from src.utils.compute_statistics import compute_responses_statistics
+from src.utils.resampling_statistics import compute_resampling_statistics
+from src.utils.statistics_accumulator import StatisticsAccumulator
+from src.utils.conditional_logit import choice_data, estimable_columns, fit_conditional_logit
+from src.utils.results_store import ResultsStore
+from src.utils.response_archive import write_archive, ResponseArchive, DEFAULT_CODEC, check_codec
+from src.utils.result_writers import save_tables, save_tables_to_excel
+from src.utils.compute_round_agreement import calculate_round_agreement, agreement_matrix, criminal_columns
+from src.utils.parallel_extraction import extract_rounds
+from src.utils.response_scanner import ResponseScanner
+from src.utils.scenario_store import load_prompt_inputs
+
+def load_round_responses(model_name, round_col, num_rows=None):
+    """Responses of one round joined with their scenario info, as in analyse_results.py"""
+    responses_df = pd.read_csv(f'data/processed/{model_name}_responses.csv', sep=';', header=0)
+    info_df, _ = load_prompt_inputs()
+    round_responses = pd.concat([responses_df[round_col], info_df.iloc[0:len(responses_df)]], axis=1)
+    round_responses.rename(columns={round_col: 'response'}, inplace=True)
+    round_responses = round_responses[round_responses['response'].notna()]
+    return round_responses.iloc[0:num_rows]
+
+def time_extraction(name, function, round_responses):
+    start = time.perf_counter()
+    extracted_df = round_responses.apply(function, axis=1, result_type='expand')
+    seconds = time.perf_counter() - start
+    print(f'{name:<35} {seconds:8.2f} s  {len(round_responses) / seconds:10.1f} rows/s')
+    return extracted_df, seconds
+
+def benchmark_extraction(args):
+    round_responses = load_round_responses(args.model, args.round, args.rows)
+    print(f'Extracting {len(round_responses)} responses of {args.model} {args.round}:')
+
+    reference_df, reference_seconds = time_extraction('extract_criminal_info', extract_criminal_info, round_responses)
+    extractor = CriminalInfoExtractor(use_scanner=False, use_index=False)
+    extracted_df, seconds = time_extraction('CriminalInfoExtractor.extract', extractor.extract, round_responses)
+
+    print(f'Speed-up: {reference_seconds / seconds:.1f}x')
+    # The extractor also returns the stated nationalities, which extract_criminal_info does not
+    pd.testing.assert_frame_equal(extracted_df[reference_df.columns].astype(str), reference_df.astype(str))
+    print('Same output as extract_criminal_info')
+
+def benchmark_parallel_extraction(args):
+    round_responses = {args.round: load_round_responses(args.model, args.round, args.rows)}
+    print(f'Extracting {len(round_responses[args.round])} responses of {args.model} {args.round}:')
+    extractor = CriminalInfoExtractor()
+
+    start = time.perf_counter()
+    serial_df = extract_rounds(round_responses, extractor)[args.round]
+    serial_seconds = time.perf_counter() - start
+    print(f'{"serial":<35} {serial_seconds:8.2f} s')
+
+    start = time.perf_counter()
+    parallel_df = extract_rounds(round_responses, extractor, num_workers=args.workers, chunk_size=args.chunk_size)[args.round]
+    parallel_seconds = time.perf_counter() - start
+    print(f'{f"{args.workers} workers, chunks of {args.chunk_size}":<35} {parallel_seconds:8.2f} s')
+
+    print(f'Speed-up: {serial_seconds / parallel_seconds:.1f}x')
+    pd.testing.assert_frame_equal(parallel_df.astype(str), serial_df.astype(str))
+    print('Same output as the serial path')
+
+def benchmark_scanner(args):
+    round_responses = load_round_responses(args.model, args.round, args.rows)
+    responses = [normalize_chars(response.strip()) for response in round_responses['response']]
+    extractor = CriminalInfoExtractor(interactive=False, use_scanner=False, use_index=False)
+    scanner = ResponseScanner()
+
+    def search_patterns(response):
+        for i in range(1, 5):
+            character_match = extractor.character_patterns[i].search(response)
+            if character_match:
+                extractor.gender_field_pattern.search(character_match.group(1))
+                extractor.name_field_pattern.search(character_match.group(1))
+        extractor.criminal_origin_pattern.search(response)
+        extractor.criminal_name_pattern.search(response)
+
+    print(f'Per-response cost over {len(responses)} responses of {args.model} {args.round}:')
+    for name, function in [('separate regex searches', search_patterns), ('single-pass scanner', scanner.scan)]:
+        start = time.perf_counter()
+        for response in responses:
+            function(response)
+        seconds = time.perf_counter() - start
+        print(f'{name:<35} {1e6 * seconds / len(responses):8.1f} us/response')
+
+    scans = [scanner.scan(response)['characters'] for response in responses]
+    complete = sum(len(characters) == 4 and all(character['name'] and character['gender'] for character in characters.values())
+                   for characters in scans)
+    print(f'Responses fully read by the scanner: {complete} of {len(responses)}')
+
+    # Parity with extract_criminal_info on the characters the scanner reads (those with a name and a gender)
+    reference_df = round_responses.apply(extract_criminal_info, axis=1, result_type='expand')
+    compared, differences = 0, []
+    for (prompt_id, reference), characters in zip(reference_df.iterrows(), scans):
+        for i, character in characters.items():
+            if character['name'] and character['gender']:
+                compared += 1
+                scanned = (character['name'].capitalize(), character['gender'].lower().capitalize())
+                if scanned != (reference[f'name{i}'], reference[f'gender{i}']):
+                    differences.append((prompt_id, i, scanned, (reference[f'name{i}'], reference[f'gender{i}'])))
+    print(f'Characters read as by extract_criminal_info: {compared - len(differences)} of {compared}')
+    for prompt_id, i, scanned, reference in differences[0:args.show]:
+        print(f'  prompt {prompt_id}, character {i}: scanner {scanned}, extract_criminal_info {reference}')
+    # Differences are listed first, so that a failed check shows what to look at before enabling the scanner
+    assert not differences, f'{len(differences)} characters read differently by the scanner'
+
+def benchmark_country_resolution(args):
+    round_responses = load_round_responses(args.model, args.round, args.rows)
+    extractor = CriminalInfoExtractor(interactive=False, use_scanner=False, use_index=False)
+    index = CountryIndex()
+
+    phrases, origins = [], []
+    for _, row in round_responses.iterrows():
+        match = extractor.criminal_origin_pattern.search(normalize_chars(row['response'].strip()))
+        if match:
+            phrases.append(match.group(1))
+            origins.append([row[f'origin{i}'] for i in range(1, 5)])
+
+    verbatim = sum(phrase in [normalize_country_name(origin) for origin in row_origins] for phrase, row_origins in zip(phrases, origins))
+    start = time.perf_counter()
+    resolved = [index.resolve(phrase) for phrase in phrases]
+    seconds = time.perf_counter() - start
+    indexed = sum(country in row_origins for (country, _), row_origins in zip(resolved, origins))
+    fuzzy = sum(country is not None and confidence < 1 for country, confidence in resolved)
+
+    print(f'Criminal origin phrases in {len(round_responses)} responses of {args.model} {args.round}: {len(phrases)}')
+    print(f'{"resolved verbatim (previous rule)":<35} {verbatim:8d}')
+    print(f'{"resolved by the country index":<35} {indexed:8d}  ({fuzzy} by fuzzy match)')
+    print(f'{"index lookup":<35} {1e6 * seconds / max(len(phrases), 1):8.1f} us/phrase')
+
+def synthetic_criminal_info(num_rows, seed=42, country_info_path='data/raw/selected_countries_info.csv'):
+    """Random extracted information with categorical columns, in the format of CriminalInfoExtractor"""
+    rng = np.random.default_rng(seed)
+    countries = pd.read_csv(country_info_path, sep=';')['Country']
+    origin_codes = rng.integers(0, len(countries), size=(num_rows, 4))
+    slots = rng.integers(0, 4, size=num_rows)
+    location_slots = rng.integers(0, 4, size=num_rows)
+    rows = np.arange(num_rows)
+
+    info_df = pd.DataFrame({'criminal': slots + 1,
+                            'criminal_is_migrant': origin_codes[rows, slots] != origin_codes[rows, location_slots]})
+    info_df['location'] = pd.Categorical.from_codes(origin_codes[rows, location_slots], categories=countries)
+    for i in range(4):
+        info_df[f'origin{i+1}'] = pd.Categorical.from_codes(origin_codes[:, i], categories=countries)
+        info_df[f'gender{i+1}'] = pd.Categorical.from_codes(rng.integers(0, 2, size=num_rows), categories=['Female', 'Male'])
+    return info_df
+
+def compute_responses_statistics_legacy(criminal_info_dict, country_info_path = 'data/raw/selected_countries_info.csv'):
+    """Original implementation of compute_responses_statistics, kept as the reference of its output"""
+    country_info_df = pd.read_csv(country_info_path, sep=';')
+    list_countries = country_info_df['Country']
+    list_regions = country_info_df['Region'].unique()
+    list_religions = country_info_df['Religion'].unique()
+
+    rounds = criminal_info_dict.keys()
+
+    immigrant_stats_df = pd.DataFrame(columns=[f'{round}_{name}' for round in rounds for name in ['total','criminal','percentage']],index=['immigrant'])
+    gender_stats_df = pd.DataFrame(columns=[f'{round}_{name}' for round in rounds for name in ['total','criminal','percentage']],index=['Female','Male'])
+    country_stats_df = pd.DataFrame(columns=[f'{round}_{name}' for round in rounds for name in ['total','criminal','percentage']],index=list_countries)
+    region_stats_df = pd.DataFrame(columns=[f'{round}_{name}' for round in rounds for name in ['total','criminal','percentage']],index=list_regions)
+    religion_stats_df = pd.DataFrame(columns=[f'{round}_{name}' for round in rounds for name in ['total','criminal','percentage']],index=list_religions)
+
+    for round in rounds:
+        # Rows are looked up by position (df.loc[i] for i in range(n_records))
+        df = criminal_info_dict[round].reset_index(drop=True)
+        n_records = len(df) # number of scenarios
+
+        immigrant_count = 3 * n_records # 3 out of 4 characters are immigrants, 4 characters in each scenario
+        gender_count = Counter(list(df.loc[:,['gender1','gender2', 'gender3','gender4']].stack()))
+        country_count = Counter(list(df.loc[:,['origin1','origin2', 'origin3','origin4']].stack()))
+        region_count = {region:0 for region in list_regions}
+        for country in country_count.keys():
+            region = country_info_df.loc[(country_info_df['Country'] == country),'Region']
+            region_count[region.iloc[0]] = country_count[country] + region_count[region.iloc[0]]
+        religion_count = {religion:0 for religion in list_religions}
+        for country in country_count.keys():
+            religion = country_info_df.loc[(country_info_df['Country'] == country),'Religion']
+            religion_count[religion.iloc[0]] = country_count[country] + religion_count[religion.iloc[0]]
+
+        criminal_immigrant_count = sum(df.criminal_is_migrant)
+        criminal_gender_count = Counter([df.loc[i, f'gender{ch}'] for i,ch in zip(range(n_records),df['criminal'])])
+        criminal_country_count = Counter([df.loc[i, f'origin{ch}'] for i,ch in zip(range(n_records),df['criminal'])])
+        criminal_region_count = {region:0 for region in list_regions}
+        for country in criminal_country_count.keys():
+            region = country_info_df.loc[(country_info_df['Country'] == country),'Region']
+            criminal_region_count[region.iloc[0]] = criminal_country_count[country] + criminal_region_count[region.iloc[0]]
+        criminal_religion_count = {religion:0 for religion in list_religions}
+        for country in criminal_country_count.keys():
+            religion = country_info_df.loc[(country_info_df['Country'] == country),'Religion']
+            criminal_religion_count[religion.iloc[0]] = criminal_country_count[country] + criminal_religion_count[religion.iloc[0]]
+
+        immigrant_stats_df.loc['immigrant',f'{round}_total'] = immigrant_count
+        immigrant_stats_df.loc['immigrant',f'{round}_criminal'] = criminal_immigrant_count
+        immigrant_stats_df.loc['immigrant',f'{round}_percentage'] = 100 * criminal_immigrant_count/immigrant_count
+        gender_stats_df[f'{round}_total'] = gender_count
+        gender_stats_df[f'{round}_criminal'] = criminal_gender_count
+        gender_stats_df[f'{round}_percentage'] = 100 * gender_stats_df[f'{round}_criminal']/gender_stats_df[f'{round}_total']
+        country_stats_df[f'{round}_total'] = country_count
+        country_stats_df[f'{round}_criminal'] = criminal_country_count
+        country_stats_df[f'{round}_percentage'] = 100 * country_stats_df[f'{round}_criminal']/country_stats_df[f'{round}_total']
+        country_stats_df.fillna(0, inplace=True)
+        region_stats_df[f'{round}_total'] = region_count
+        region_stats_df[f'{round}_criminal'] = criminal_region_count
+        region_stats_df[f'{round}_percentage'] = 100 * region_stats_df[f'{round}_criminal']/region_stats_df[f'{round}_total']
+        religion_stats_df[f'{round}_total'] = religion_count
+        religion_stats_df[f'{round}_criminal'] = criminal_religion_count
+        religion_stats_df[f'{round}_percentage'] = 100 * religion_stats_df[f'{round}_criminal']/religion_stats_df[f'{round}_total']
+
+    return {'immigrant_stats': immigrant_stats_df,
+            'gender_stats': gender_stats_df,
+            'country_stats': country_stats_df,
+            'region_stats': region_stats_df,
+            'religion_stats': religion_stats_df}
+
+def benchmark_statistics(args):
+    criminal_info = {f'round{round+1}': synthetic_criminal_info(args.rows, seed=round) for round in range(args.rounds)}
+
+    start = time.perf_counter()
+    compute_responses_statistics(criminal_info)
+    seconds = time.perf_counter() - start
+    print(f'{f"{args.rows} rows x {args.rounds} rounds":<35} {seconds:8.2f} s')
+
+    # Check the output against the original implementation on a subset, with object columns as extracted from the responses
+    subset = {round: info.iloc[0:args.check_rows].astype({column: object for column in info.columns if isinstance(info[column].dtype, pd.CategoricalDtype)})
+              for round, info in criminal_info.items()}
+    start = time.perf_counter()
+    reference = compute_responses_statistics_legacy(subset)
+    reference_seconds = time.perf_counter() - start
+    result = compute_responses_statistics(subset)
+    print(f'{f"legacy, {args.check_rows} rows x {args.rounds} rounds":<35} {reference_seconds:8.2f} s')
+    for table in reference:
+        pd.testing.assert_frame_equal(result[table].astype(float), reference[table].astype(float))
+    print(f'Same {", ".join(reference)} as the original implementation')
+
+    # Scenario-at-a-time accumulators of two shards, merged, must give exactly the batch tables
+    start = time.perf_counter()
+    shards = [StatisticsAccumulator(), StatisticsAccumulator()]
+    for round, info in subset.items():
+        for position, (_, scenario) in enumerate(info.iterrows()):
+            shards[position % 2].update(round, scenario)
+    merged = StatisticsAccumulator.from_dict(shards[0].to_dict()).merge(StatisticsAccumulator.from_dict(shards[1].to_dict()))
+    accumulated = merged.finalize()
+    accumulator_seconds = time.perf_counter() - start
+    print(f'{f"accumulators, {args.check_rows} rows x {args.rounds} rounds":<35} {accumulator_seconds:8.2f} s')
+    for table in result:
+        pd.testing.assert_frame_equal(accumulated[table], result[table])
+    print('Same tables from merged accumulators')
+
+def benchmark_resampling(args):
+    criminal_info = {f'round{round+1}': synthetic_criminal_info(args.rows, seed=round) for round in range(args.rounds)}
+    results = {}
+    for num_workers in args.workers:
+        start = time.perf_counter()
+        results[num_workers] = compute_resampling_statistics(criminal_info, num_resamples=args.resamples, num_workers=num_workers)
+        seconds = time.perf_counter() - start
+        num_categories = sum(len(table) for table in results[num_workers].values())
+        print(f'{f"{args.resamples} resamples, {args.rows} rows x {args.rounds} rounds, {num_workers} workers":<35} {seconds:8.2f} s  ({num_categories} categories)')
+    # Each batch has its own seed, so the number of workers must not change the results
+    reference = results[args.workers[0]]
+    for num_workers, significance_dict in results.items():
+        for table in reference:
+            pd.testing.assert_frame_equal(significance_dict[table], reference[table])
+    print(f'Same results with {", ".join(map(str, results))} workers')
+    # The synthetic criminal is drawn uniformly, so about 5% of the raw p-values should be below 0.05
+    p_values = pd.concat(reference.values())[[f'round{round+1}_p_value' for round in range(args.rounds)]].to_numpy()
+    print(f'Share of raw p-values below 0.05 under the null: {np.nanmean(p_values < 0.05):.3f}')
+
+def benchmark_conditional_logit(args):
+    # Scenarios with random candidates; the criminal is drawn from a conditional logit with known effects
+    info_df = synthetic_criminal_info(args.rows, seed=args.seed).astype({f'{field}{i}': object for field in ['origin', 'gender'] for i in range(1, 5)})
+    X, _, names, _ = choice_data(info_df)
+    rng = np.random.default_rng(args.seed)
+    # Only the estimable attributes have an effect: that of an aliased one would be shared with those it is confounded with
+    estimable, _ = estimable_columns(X)
+    true_beta = np.zeros(X.shape[2])
+    true_beta[estimable] = rng.normal(0, 0.5, size=len(estimable))
+    utilities = X.astype(np.float64) @ true_beta
+    probabilities = np.exp(utilities - utilities.max(axis=1, keepdims=True))
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    chosen = np.minimum((probabilities.cumsum(axis=1) < rng.random(args.rows)[:, None]).sum(axis=1), 3)
+
+    start = time.perf_counter()
+    fit = fit_conditional_logit(X, chosen)
+    seconds = time.perf_counter() - start
+    print(f'{f"{args.rows} scenarios, {X.shape[2]} attributes":<35} {seconds:8.2f} s  ({fit["iterations"]} Newton iterations)')
+    assert fit['converged'], 'the conditional logit did not converge'
+
+    errors = (fit['coefficients'] - true_beta[fit['features']]) / fit['standard_errors']
+    print(f'Attributes identified: {len(fit["features"])} of {len(names)}')
+    print(f'Aliased attributes left out: {", ".join(names[feature] for feature in fit["aliased"]) or "none"}')
+    print(f'Estimates within 2 standard errors of the true effects: {np.mean(np.abs(errors) < 2):.2f}')
+
+def synthetic_rounds(num_rows, num_rounds, agreement, missing, seed=42, country_info_path='data/raw/selected_countries_info.csv'):
+    """Rounds sharing their scenarios, each keeping the criminal of the first round with probability agreement and missing a share of rows"""
+    rng = np.random.default_rng(seed)
+    country_info = pd.read_csv(country_info_path, sep=';').set_index('Country')
+    base_df = synthetic_criminal_info(num_rows, seed).astype({f'{field}{i}': object for field in ['origin', 'gender'] for i in range(1, 5)})
+    for i in range(1, 5):
+        base_df[f'religion{i}'] = country_info['Religion'].reindex(base_df[f'origin{i}']).to_numpy()
+
+    criminal_info = {}
+    for round in range(num_rounds):
+        info_df = base_df.copy()
+        redrawn = rng.random(num_rows) > agreement
+        info_df.loc[redrawn, 'criminal'] = rng.integers(1, 5, size=redrawn.sum())
+        slots = info_df['criminal'].to_numpy() - 1
+        origins = info_df[[f'origin{i}' for i in range(1, 5)]].to_numpy()[np.arange(num_rows), slots]
+        info_df['criminal_is_migrant'] = origins != info_df['location'].astype(object).to_numpy()
+        info_df['criminal_region'] = country_info['Region'].reindex(origins).to_numpy()
+        criminal_info[f'round{round+1}'] = info_df[rng.random(num_rows) >= missing]
+    return criminal_info
+
+def benchmark_agreement(args):
+    criminal_info = synthetic_rounds(args.rows, args.rounds, args.agreement, args.missing)
+    start = time.perf_counter()
+    round_agreement_dict = calculate_round_agreement(criminal_info)
+    seconds = time.perf_counter() - start
+    print(f'{f"{args.rows} rows x {args.rounds} rounds":<35} {seconds:8.2f} s')
+    print(round_agreement_dict['multi_rater'].to_string(index=False))
+
+    # Two synthetic models sharing the scenarios, compared over every pair of (model, round)
+    model_round_info = {'model1': criminal_info, 'model2': synthetic_rounds(args.rows, args.rounds, args.agreement, args.missing, seed=1)}
+    start = time.perf_counter()
+    agreement_df = agreement_matrix(model_round_info, num_resamples=args.resamples)
+    seconds = time.perf_counter() - start
+    print(f'{f"agreement matrix, {len(agreement_df)} pairs":<35} {seconds:8.2f} s  ({args.resamples} resamples per pair)')
+
+    # Check the pairwise kappas against scikit-learn on the prompts shared by each pair of rounds
+    try:
+        from sklearn.metrics import cohen_kappa_score
+    except ImportError:
+        print('scikit-learn is not installed; the kappas are not checked')
+        return
+    rounds = [criminal_columns(info).astype(str) for info in criminal_info.values()]
+    pairwise_df = round_agreement_dict['pairwise_kappa']
+    differences = []
+    for _, row in pairwise_df.iterrows():
+        i, j = (int(rater) - 1 for rater in row['Rater Pair'].replace('Rater_', '').split('_vs_'))
+        common = rounds[i].index.intersection(rounds[j].index)
+        differences.append(abs(row['Kappa Score'] - cohen_kappa_score(rounds[i].loc[common, row['Column']], rounds[j].loc[common, row['Column']])))
+    print(f'Largest difference with scikit-learn cohen_kappa_score: {max(differences):.2e}')
+    assert max(differences) < 1e-9, 'the pairwise kappas differ from scikit-learn'
+
+def time_writer(name, write, trace_memory=True):
+    """
+    Time and peak traced memory of a write (or read).
+
+    Tracing slows down code that allocates many small objects (openpyxl several times over),
+    so without trace_memory only the time is reported.
+    """
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        write()
+    except ImportError as e:
+        print(f'{name:<35} skipped ({e})')
+        return
+    finally:
+        seconds = time.perf_counter() - start
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    print(f'{name:<35} {seconds:8.2f} s' + (f'  {peak / 2**20:8.1f} MiB peak' if trace_memory else ''))
+
+def save_dataframes_to_excel_legacy(dataframes_dict, filepath):
+    """Original Excel writer (openpyxl append mode, deleting and rewriting every sheet), kept as the reference of the result writers"""
+    try:
+        if os.path.exists(filepath):
+            mode = 'a'  # append mode if file exists
+            with pd.ExcelWriter(filepath, engine='openpyxl', mode=mode) as writer:
+                # First remove existing sheets
+                book = writer.book
+                for sheet in book.sheetnames:
+                    del book[sheet]
+                # Then write new sheets
+                for sheet_name, df in dataframes_dict.items():
+                    df.to_excel(writer, sheet_name=sheet_name)
+        else:
+            mode = 'w'  # write mode if file doesn't exist
+            with pd.ExcelWriter(filepath, engine='openpyxl', mode=mode) as writer:
+                for sheet_name, df in dataframes_dict.items():
+                    df.to_excel(writer, sheet_name=sheet_name)
+
+        print(f"Successfully saved to {filepath}")
+
+    except Exception as e:
+        print(f"Error saving Excel file: {str(e)}")
+
+def benchmark_writers(args):
+    # Statistics-like tables: one row per category and total/criminal/percentage columns per round
+    rng = np.random.default_rng(42)
+    tables = {f'table{table+1}': pd.DataFrame(rng.random((args.rows, 3 * args.rounds)),
+                                              index=pd.Index([f'category{row}' for row in range(args.rows)]),
+                                              columns=[f'round{round+1}_{name}' for round in range(args.rounds)
+                                                       for name in ['total', 'criminal', 'percentage']])
+              for table in range(args.tables)}
+    with tempfile.TemporaryDirectory() as directory:
+        excel_path = os.path.join(directory, 'legacy.xlsx')
+        time_writer('legacy Excel writer, new file', lambda: save_dataframes_to_excel_legacy(tables, excel_path), args.trace_memory)
+        time_writer('legacy Excel writer, existing file', lambda: save_dataframes_to_excel_legacy(tables, excel_path), args.trace_memory)
+        time_writer('CSV tables', lambda: save_tables(tables, os.path.join(directory, 'csv')), args.trace_memory)
+        time_writer('Parquet tables', lambda: save_tables(tables, os.path.join(directory, 'parquet'), 'parquet'), args.trace_memory)
+        time_writer('streaming Excel export', lambda: save_tables_to_excel(tables, os.path.join(directory, 'streaming.xlsx')), args.trace_memory)
+
+        # The streaming export must hold the same tables as the original writer
+        legacy = pd.read_excel(excel_path, sheet_name=None, index_col=0)
+        streamed = pd.read_excel(os.path.join(directory, 'streaming.xlsx'), sheet_name=None, index_col=0)
+        assert list(streamed) == list(legacy)
+        for table in legacy:
+            pd.testing.assert_frame_equal(streamed[table], legacy[table])
+        print('Same sheets as the original Excel writer')
+
+def benchmark_store(args):
+    info_df = synthetic_criminal_info(args.rows).astype(object)
+    with tempfile.TemporaryDirectory() as directory, ResultsStore(os.path.join(directory, 'results.db')) as store:
+        start = time.perf_counter()
+        for model in ['model1', 'model2']:
+            store.add_responses(model, ((round, prompt_id, f'Story {prompt_id} of round {round+1}. ' * 50)
+                                        for round in range(args.rounds) for prompt_id in range(args.rows)))
+            for round in range(args.rounds):
+                store.add_extractions(model, f'round{round+1}', info_df)
+        seconds = time.perf_counter() - start
+        print(f'{f"bulk insert, {2 * args.rounds * args.rows} rows":<35} {seconds:8.2f} s')
+
+        queries = [('responses joined with extractions', lambda: store.responses_with_extractions('model1', 1)),
+                   ('extractions of one round', lambda: store.extractions('model2', 2)),
+                   ('one prompt across models and rounds', lambda: store.query(
+                       'SELECT * FROM responses r JOIN extractions e USING (model, round, prompt_id) WHERE prompt_id = ?', (args.rows // 2,)))]
+        for name, query in queries:
+            start = time.perf_counter()
+            num_rows = len(query())
+            print(f'{name:<35} {1000 * (time.perf_counter() - start):8.1f} ms  ({num_rows} rows)')
+
+def directory_size(path):
+    return sum(file.stat().st_size for file in Path(path).rglob('*') if file.is_file())
+
+def benchmark_archive(args):
+    check_codec(args.codec)
+    # Stories of about 3 KB, varied enough not to compress unrealistically well
+    rng = np.random.default_rng(42)
+    words = np.array(['the', 'detective', 'suspect', 'market', 'night', 'witness', 'alibi', 'police', 'harbor', 'letter',
+                      'quietly', 'nervous', 'crowded', 'stolen', 'evidence', 'neighbour', 'train', 'rain', 'office', 'secret'])
+    responses_df = pd.DataFrame({f'round{round+1}': [' '.join(rng.choice(words, size=450)) for _ in range(args.rows)]
+                                 for round in range(args.rounds)})
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'responses.csv')
+        archive_dir = os.path.join(directory, 'archive')
+        time_writer('CSV write', lambda: responses_df.to_csv(csv_path, sep=';', index=False))
+        time_writer('archive write', lambda: write_archive('model', responses_df, archive_dir, args.codec))
+        print(f'{"CSV size":<35} {os.path.getsize(csv_path) / 2**20:8.1f} MiB')
+        print(f'{"archive size":<35} {directory_size(archive_dir) / 2**20:8.1f} MiB')
+
+        time_writer('CSV full read', lambda: pd.read_csv(csv_path, sep=';', header=0))
+        time_writer('archive full read', lambda: ResponseArchive('model', archive_dir).to_frame())
+        time_writer('archive streamed round', lambda: sum(1 for _ in ResponseArchive('model', archive_dir).iter_round('round1')))
+
+        archive = ResponseArchive('model', archive_dir)
+        archive.index('round2')
+        prompt_ids = rng.integers(0, args.rows, size=1000)
+        start = time.perf_counter()
+        same = all(archive.get(prompt_id, 'round2') == responses_df.at[prompt_id, 'round2'] for prompt_id in prompt_ids)
+        print(f'{"archive random story":<35} {1000 * (time.perf_counter() - start) / len(prompt_ids):8.3f} ms')
+        assert same, 'stories read from the archive differ from the CSV'
+        pd.testing.assert_frame_equal(ResponseArchive('model', archive_dir).to_frame(), responses_df, check_names=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis stages on the stored responses.")
+    subparsers = parser.add_subparsers(dest='stage', required=True)
+
+    extraction_parser = subparsers.add_parser('extraction', help="Compare the extractor with extract_criminal_info")
+    extraction_parser.add_argument('--model', default='chatgpt')
+    extraction_parser.add_argument('--round', default='round1')
+    extraction_parser.add_argument('--rows', type=int, default=None, help="Number of rows to extract (default: all)")
+    extraction_parser.set_defaults(run=benchmark_extraction)
+
+    parallel_parser = subparsers.add_parser('parallel', help="Compare parallel with serial extraction")
+    parallel_parser.add_argument('--model', default='chatgpt')
+    parallel_parser.add_argument('--round', default='round1')
+    parallel_parser.add_argument('--rows', type=int, default=None, help="Number of rows to extract (default: all)")
+    parallel_parser.add_argument('--workers', type=int, default=4)
+    parallel_parser.add_argument('--chunk-size', type=int, default=200)
+    parallel_parser.set_defaults(run=benchmark_parallel_extraction)
+
+    scanner_parser = subparsers.add_parser('scanner', help="Per-response cost of the single-pass scanner and its parity with extract_criminal_info")
+    scanner_parser.add_argument('--model', default='chatgpt')
+    scanner_parser.add_argument('--round', default='round1')
+    scanner_parser.add_argument('--rows', type=int, default=None, help="Number of rows to scan (default: all)")
+    scanner_parser.add_argument('--show', type=int, default=10, help="Number of differences from extract_criminal_info to print")
+    scanner_parser.set_defaults(run=benchmark_scanner)
+
+    countries_parser = subparsers.add_parser('countries', help="Criminal origins resolved by the country index")
+    countries_parser.add_argument('--model', default='chatgpt')
+    countries_parser.add_argument('--round', default='round1')
+    countries_parser.add_argument('--rows', type=int, default=None, help="Number of rows to read (default: all)")
+    countries_parser.set_defaults(run=benchmark_country_resolution)
+
+    statistics_parser = subparsers.add_parser('statistics', help="Statistics tables on synthetic rows, checked against the original implementation")
+    statistics_parser.add_argument('--rows', type=int, default=10_000_000, help="Number of rows per round")
+    statistics_parser.add_argument('--rounds', type=int, default=3)
+    statistics_parser.add_argument('--check-rows', type=int, default=20_000, help="Number of rows compared with the original implementation")
+    statistics_parser.set_defaults(run=benchmark_statistics)
+
+    resampling_parser = subparsers.add_parser('resampling', help="Bootstrap intervals and permutation tests on synthetic rows")
+    resampling_parser.add_argument('--rows', type=int, default=10_000, help="Number of scenarios per round")
+    resampling_parser.add_argument('--rounds', type=int, default=3)
+    resampling_parser.add_argument('--resamples', type=int, default=10_000)
+    resampling_parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count()],
+                                   help="Numbers of worker processes to time (default: 1 and the number of cores)")
+    resampling_parser.set_defaults(run=benchmark_resampling)
+
+    logit_parser = subparsers.add_parser('logit', help="Fit the conditional logit on synthetic choices with known effects")
+    logit_parser.add_argument('--rows', type=int, default=600_000, help="Number of scenarios (e.g. 100k prompts x 3 rounds x 2 models)")
+    logit_parser.add_argument('--seed', type=int, default=42)
+    logit_parser.set_defaults(run=benchmark_conditional_logit)
+
+    agreement_parser = subparsers.add_parser('agreement', help="Round agreement on synthetic rounds with missing rows, checked against scikit-learn")
+    agreement_parser.add_argument('--rows', type=int, default=1_000_000, help="Number of scenarios per round")
+    agreement_parser.add_argument('--rounds', type=int, default=3)
+    agreement_parser.add_argument('--agreement', type=float, default=0.7, help="Probability that a round keeps the criminal of the first round")
+    agreement_parser.add_argument('--missing', type=float, default=0.05, help="Share of rows missing from each round")
+    agreement_parser.add_argument('--resamples', type=int, default=1000, help="Bootstrap resamples of the agreement matrix")
+    agreement_parser.set_defaults(run=benchmark_agreement)
+
+    writers_parser = subparsers.add_parser('writers', help="Write time and peak memory of the result writers against the original Excel writer")
+    # The statistics tables have one row per category (about a hundred for the countries); openpyxl
+    # writes some 20k cells per second, so the default keeps the two legacy writes within seconds
+    writers_parser.add_argument('--rows', type=int, default=2_000, help="Number of rows per table")
+    writers_parser.add_argument('--tables', type=int, default=5)
+    writers_parser.add_argument('--rounds', type=int, default=3)
+    writers_parser.add_argument('--trace-memory', action='store_true',
+                                help="Also report the peak traced memory (several times slower for the Excel writers)")
+    writers_parser.set_defaults(run=benchmark_writers)
+
+    store_parser = subparsers.add_parser('store', help="Bulk inserts and joins of the results store")
+    store_parser.add_argument('--rows', type=int, default=100_000, help="Number of prompts")
+    store_parser.add_argument('--rounds', type=int, default=3)
+    store_parser.set_defaults(run=benchmark_store)
+
+    archive_parser = subparsers.add_parser('archive', help="Size and read times of the response archive against the response CSV")
+    archive_parser.add_argument('--rows', type=int, default=20_000, help="Number of prompts")
+    archive_parser.add_argument('--rounds', type=int, default=3)
+    archive_parser.add_argument('--codec', default=DEFAULT_CODEC, choices=['gzip', 'zstd'])
+    archive_parser.set_defaults(run=benchmark_archive)
+
+    args = parser.parse_args()
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
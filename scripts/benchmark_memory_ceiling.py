@@ -0,0 +1,82 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import resource
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# Add the root directory to the Python path
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from src.utils.scenario_store import load_prompt_inputs
+
+def run_with_ceiling(model_name, ceiling, prompts, queue):
+    """Load the model under a memory ceiling and time the generation (runs in a fresh process)"""
+    from src.models.hf_memory import generation_kwargs
+    model = importlib.import_module(f'src.models.{model_name}')
+
+    with open(f'src/config/{model_name}_config.json', 'r') as f:
+        config = json.load(f)
+    config['memory_ceiling'] = ceiling
+
+    start = time.perf_counter()
+    pipe = model.load_pipe(config)
+    load_time = time.perf_counter() - start
+
+    kwargs = generation_kwargs(config)
+    num_tokens = 0
+    start = time.perf_counter()
+    for prompt in prompts:
+        messages = config['messages']
+        messages[1]['content'] = prompt
+        response = pipe(messages, pad_token_id=pipe.tokenizer.eos_token_id, **kwargs)
+        num_tokens += len(pipe.tokenizer(response[0]["generated_text"][-1]['content'])['input_ids'])
+    generation_time = time.perf_counter() - start
+
+    queue.put({'model': model_name,
+               'memory_ceiling': ceiling if ceiling else 'none',
+               'load_seconds': round(load_time, 2),
+               'generation_seconds': round(generation_time, 2),
+               'generated_tokens': num_tokens,
+               'tokens_per_second': round(num_tokens / generation_time, 2),
+               'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)})
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the generation throughput of a local model under different memory ceilings.")
+    parser.add_argument('--model', default='qwen', choices=['falcon', 'llama', 'qwen'])
+    parser.add_argument('--ceilings', nargs='+', default=['none', '6GiB', '4GiB', '2GiB'],
+                        help="Memory ceilings to test ('none' loads the model without a ceiling)")
+    parser.add_argument('--num-prompts', type=int, default=3)
+    args = parser.parse_args()
+
+    _, prompts = load_prompt_inputs(args.num_prompts)
+    prompts = list(prompts)
+
+    # Every ceiling runs in its own process, so that the peak memory is measured separately
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for ceiling in args.ceilings:
+        ceiling = None if ceiling == 'none' else ceiling
+        print(f'\nBenchmarking {args.model} with memory ceiling {ceiling}...')
+        queue = context.Queue()
+        process = context.Process(target=run_with_ceiling, args=(args.model, ceiling, prompts, queue))
+        process.start()
+        process.join()
+        if process.exitcode == 0:
+            results.append(queue.get())
+        else:
+            print(f'ERROR: Benchmark with memory ceiling {ceiling} failed (exit code {process.exitcode}).')
+
+    report_df = pd.DataFrame(results)
+    print(report_df.to_string(index=False))
+    report_path = f'data/results/memory_ceiling_benchmark_{args.model}.csv'
+    report_df.to_csv(report_path, index=False)
+    print(f'Report saved to {report_path}')
+
+if __name__ == "__main__":
+    main()
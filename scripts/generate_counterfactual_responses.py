@@ -0,0 +1,62 @@
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+from tqdm import tqdm
+
+# Add the root directory to the Python path
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from generate_responses import modules, load_config
+from src.utils.create_scenario import PromptTemplate
+from src.utils.scenario_store import load_prompt_inputs
+from src.utils.counterfactual_scenarios import (iter_counterfactual_scenarios, count_counterfactual_scenarios,
+                                                counterfactual_responses_path, completed_scenario_ids)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate responses for the counterfactual variants (character order, location and prompt template) of the scenarios.")
+    parser.add_argument('--model', required=True, choices=list(modules.keys()))
+    parser.add_argument('--num-base-scenarios', type=int, default=None, help="Number of base scenarios to expand (default: all)")
+    parser.add_argument('--no-permutations', action='store_true', help="Keep the base order of the characters")
+    parser.add_argument('--base-location-only', action='store_true', help="Keep the base location")
+    args = parser.parse_args()
+
+    with open('general_config.json', 'r') as f:
+        general_config = json.load(f)
+    num_rounds = general_config["num_generation_rounds"]
+
+    # Base prompt and its variants
+    templates = [PromptTemplate(general_config["base_prompt"])]
+    templates += [PromptTemplate(text) for text in general_config.get("base_prompt_variants", [])]
+
+    base_info_df, _ = load_prompt_inputs(args.num_base_scenarios)
+    permute, all_locations = not args.no_permutations, not args.base_location_only
+    num_scenarios = count_counterfactual_scenarios(len(base_info_df), len(templates), permute, all_locations)
+
+    # Responses are appended one per line, so the run can be resumed from the completed scenario IDs
+    output_path = counterfactual_responses_path(args.model)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    completed = completed_scenario_ids(args.model)
+    print(f'{num_scenarios} counterfactual scenarios x {num_rounds} rounds; {len(completed)} responses already generated.')
+
+    model = modules[args.model]
+    config = load_config(args.model)
+    pipe = model.load_pipe(config)
+
+    scenario_stream = iter_counterfactual_scenarios(base_info_df, templates, permute, all_locations)
+    with open(output_path, 'a', encoding='utf-8') as f:
+        for scenario in tqdm(scenario_stream, total=num_scenarios, file=sys.stdout, dynamic_ncols=True, unit="scenario"):
+            for round in range(num_rounds):
+                if (scenario['scenario_id'], round + 1) in completed:
+                    continue
+                response = model.generate_response(pipe=pipe, prompt=scenario['prompt'], config=config)
+                f.write(json.dumps({'scenario_id': scenario['scenario_id'], 'round': round + 1, 'response': response}) + '\n')
+                f.flush()
+
+    print(f'Counterfactual responses of {args.model} saved to {output_path}')
+
+if __name__ == "__main__":
+    main()
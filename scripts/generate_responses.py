@@ -1,3 +1,4 @@
+import argparse
 import pandas as pd
 import json
 from tqdm import tqdm
@@ -13,9 +14,16 @@ def pause():
     else:
         os.system("read -n 1 -s -p 'Press any key to continue...'")
 
+def checkpoint_files(model_name):
+    """Checkpoint of the model, then those written per round before there was one checkpoint per model"""
+    checkpoint = Path(f'data/temp/{model_name}_checkpoint.json')
+    legacy_checkpoints = sorted(Path('data/temp').glob(f'{model_name}_round*_checkpoint.json'), key=os.path.getmtime, reverse=True)
+    return ([checkpoint] if checkpoint.is_file() else []) + legacy_checkpoints
+
 def save_temp_responses(responses, model_name, round_num, prompt_idx, filename=None):
+    # One checkpoint per model, as the rounds are interleaved in the generation order
     if filename is None:
-        filename = f'data/temp/{model_name}_round{round_num+1}_checkpoint.json'
+        filename = f'data/temp/{model_name}_checkpoint.json'
     
     temp_data = {
         'responses': responses,
@@ -24,21 +32,21 @@ def save_temp_responses(responses, model_name, round_num, prompt_idx, filename=N
     }
     
     os.makedirs('data/temp', exist_ok=True)
-    with open(filename, 'w') as f:
+    # Replace the previous checkpoint only once the new one is complete
+    with open(f'{filename}.tmp', 'w') as f:
         json.dump(temp_data, f)
+    os.replace(f'{filename}.tmp', filename)
 
 def load_temp_responses(model_name):
-    checkpoint_files = list(Path('data/temp').glob(f'{model_name}_round*_checkpoint.json'))
+    checkpoints = checkpoint_files(model_name)
     
-    if checkpoint_files:
-        latest_checkpoint = max(checkpoint_files, key=os.path.getctime)
-        with open(latest_checkpoint, 'r') as f:
+    if checkpoints:
+        with open(checkpoints[0], 'r') as f:
             return json.load(f)
     return None
 
 def clean_temp_files(model_name):
-    temp_files = list(Path('data/temp').glob(f'{model_name}_round*_checkpoint.json'))
-    for file in temp_files:
+    for file in checkpoint_files(model_name):
         os.remove(file)
 
 # Add the project root directory to the Python path
@@ -46,6 +54,11 @@ project_root = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(project_root))
 
 from src.models import falcon, qwen, llama, chatgpt, claude
+from src.utils.request_scheduler import sequential_schedule, stratified_schedule
+from src.utils.scenario_store import load_prompt_inputs, with_template_hashes
+from src.utils.response_stream import open_stream, write_stream_record
+from src.utils.results_store import ResultsStore
+from src.utils.response_archive import write_archive, ARCHIVE_DIR, DEFAULT_CODEC, check_codec
 
 modules = {
     'falcon': falcon,
@@ -59,68 +72,88 @@ def load_config(model_name):
     with open(f'src/config/{model_name}_config.json', 'r') as f:
         return json.load(f)
 
-def response_generation(model, model_name, prompts, config, num_rounds=1, request_batch_size=100):
-    pipe = model.load_pipe(config)
+def restore_responses(checkpoint_data, num_prompts, num_rounds):
+    """Responses per round with None for the prompts that have not been generated yet"""
+    responses = [[None] * num_prompts for _ in range(num_rounds)]
+    if checkpoint_data:
+        for round, response_list in enumerate(checkpoint_data['responses'][0:num_rounds]):
+            responses[round][0:len(response_list)] = response_list[0:num_prompts]
+    return responses
+
+def response_generation(model, model_name, prompts, config, num_rounds=1, request_batch_size=100, schedule=None, stream_responses=False,
+                        store=None, run_id=None, pipe=None):
+    # A pipe loaded by the caller (e.g. shared by the jobs of a sweep) is reused
+    pipe = pipe if pipe is not None else model.load_pipe(config)
+
+    # Visit the (prompt, round) pairs round by round unless another order is given
+    if schedule is None:
+        schedule = sequential_schedule(len(prompts), num_rounds)
     
     # Check for existing temporary saves
     checkpoint_data = load_temp_responses(model_name)
-    
-    if checkpoint_data:
-        responses = checkpoint_data['responses']
-        start_round = checkpoint_data['current_round']
-        start_prompt_idx = checkpoint_data['current_prompt_idx'] + 1  # Start from next prompt
-    else:
-        responses = [[] for _ in range(num_rounds)]
-        start_round = 0
-        start_prompt_idx = 0
+    responses = restore_responses(checkpoint_data, len(prompts), num_rounds)
+    pending = [(prompt_idx, round) for prompt_idx, round in schedule if responses[round][prompt_idx] is None]
 
     tqdm.write(f'Total prompts: {len(prompts)}; Generation rounds: {num_rounds}')
-    tqdm.write(f'Resuming from round {start_round + 1}, prompt {start_prompt_idx + 1}')
+    tqdm.write(f'Resuming with {len(schedule) - len(pending)} of {len(schedule)} responses generated')
 
+    # Each response is also appended to a stream read by stream_analysis.py while the run continues
+    stream, run_id = open_stream(model_name, resume=checkpoint_data is not None, run_id=run_id) if stream_responses else (None, None)
+
+    # Responses not yet inserted in the results store, inserted in bulk with each checkpoint
+    unsaved = []
+    def save_checkpoint():
+        save_temp_responses(responses, model_name, round, prompt_idx)
+        if store:
+            store.add_responses(model_name, unsaved)
+            unsaved.clear()
+
+    completed = 0
     try:
-        for round in range(start_round, num_rounds):
-            if round == start_round:
-                response_list = responses[round] if responses[round] else []
-                prompts_to_process = prompts[start_prompt_idx:]
-            else:
-                response_list = []
-                prompts_to_process = prompts
-
-            print(f'Generation round {round + 1}:', flush=True)
-            
-            for i, prompt in enumerate(tqdm(prompts_to_process, 
-                                          initial=start_prompt_idx if round == start_round else 0,
-                                          total=len(prompts),
-                                          file=sys.stdout, 
-                                          dynamic_ncols=True,
-                                          desc=f"Round {round + 1}", 
-                                          unit="prompt")):
-                response = model.generate_response(pipe=pipe, prompt=prompt, config=config)
-                response_list.append(response)
-                
-                current_prompt_idx = start_prompt_idx + i if round == start_round else i
-                
-                if (current_prompt_idx + 1) % request_batch_size == 0:
-                    responses[round] = response_list
-                    save_temp_responses(responses, model_name, round, current_prompt_idx)
-                    # pause()
-                
-                sys.stdout.flush()
+        for prompt_idx, round in tqdm(pending,
+                                      initial=len(schedule) - len(pending),
+                                      total=len(schedule),
+                                      file=sys.stdout,
+                                      dynamic_ncols=True,
+                                      desc="Generation",
+                                      unit="prompt"):
+            responses[round][prompt_idx] = model.generate_response(pipe=pipe, prompt=prompts[prompt_idx], config=config)
+            completed += 1
+            if stream:
+                write_stream_record(stream, {'prompt_idx': prompt_idx, 'round': round, 'response': responses[round][prompt_idx]})
+            if store:
+                unsaved.append((round, prompt_idx, responses[round][prompt_idx]))
+
+            if completed % request_batch_size == 0:
+                save_checkpoint()
+                # pause()
             
-            responses[round] = response_list
-            # Save checkpoint at the end of each round
-            save_temp_responses(responses, model_name, round, len(prompts) - 1)
+            sys.stdout.flush()
+
+        if completed:
+            save_checkpoint()
             
         return responses
     
     except Exception as e:
         # Save the current state before raising the exception
-        if response_list:
-            responses[round] = response_list
-            save_temp_responses(responses, model_name, round, current_prompt_idx)
+        if completed:
+            save_checkpoint()
         raise e 
+
+    finally:
+        # Tell the stream reader that this generation run has stopped
+        if stream:
+            write_stream_record(stream, {'done': True, 'run_id': run_id})
+            stream.close()
     
 def main():
+    parser = argparse.ArgumentParser(description="Generate the responses of the testing models.")
+    parser.add_argument('--stream', action='store_true',
+                        help="Also append each response to data/processed/stream/ for scripts/stream_analysis.py")
+    parser.add_argument('--run-id', default=None, help="Id of the run written in the stream headers (default: a new random id)")
+    args = parser.parse_args()
+
     # General config for experiments
     with open('general_config.json', 'r') as f:
         config = json.load(f)
@@ -132,44 +165,70 @@ def main():
         config["testing_models"]
     ]
 
-    # Load input prompts
-    input_df = pd.read_csv('data/processed/input_texts.csv', sep=';', header=0)
-    prompts = input_df['prompt'].tolist()
-    prompts = prompts[0:min(num_requests, len(prompts))]
-
-    # Generate and save responses for each testing model
-    for model_name, model_module in modules.items():
-        if model_name in models:
-            try:
-                config = load_config(model_name)
-                print(f'\n********** Generating Responses by {model_name} **********')
+    # Load input prompts (rendered lazily from the scenario store when it exists)
+    info_df, prompts = load_prompt_inputs(num_requests, config["base_prompt"])
+
+    response_format, archive_codec = config.get("response_format", "csv"), config.get("archive_codec", DEFAULT_CODEC)
+    # A missing compression package would otherwise only show once the responses are generated
+    if response_format == "archive":
+        check_codec(archive_codec)
+
+    # Scenarios and responses are also kept in the results store, keyed by prompt
+    store = ResultsStore() if config.get("results_store", False) else None
+    if store:
+        store.add_scenarios(with_template_hashes(info_df, config["base_prompt"]))
+
+    # Interleave prompts and rounds so that any prefix of the run is a balanced sample
+    if config.get("generation_order", "sequential") == "stratified":
+        schedule = stratified_schedule(info_df, num_rounds, seed=config.get("schedule_seed", 42))
+    else:
+        schedule = None
+
+    try:
+        # Generate and save responses for each testing model
+        for model_name, model_module in modules.items():
+            if model_name in models:
+                try:
+                    config = load_config(model_name)
+                    print(f'\n********** Generating Responses by {model_name} **********')
                 
-                responses = response_generation(
-                    model=model_module,
-                    model_name=model_name,
-                    prompts=prompts,
-                    config=config,
-                    num_rounds=num_rounds,
-                    request_batch_size=request_batch_size
-                )
-
-                response_dict = {}
-                for round in range(num_rounds):
-                    response_dict[f'round{round+1}'] = responses[round]
-
-                # Create a DataFrame with the responses
-                response_df = pd.DataFrame(response_dict)
-
-                # Save to CSV
-                response_df.to_csv(f'data/processed/{model_name}_responses.csv', sep=';', index=False)
-                print(f"Generated responses for {model_name} saved to data/processed/{model_name}_responses.csv")
+                    responses = response_generation(
+                        model=model_module,
+                        model_name=model_name,
+                        prompts=prompts,
+                        config=config,
+                        num_rounds=num_rounds,
+                        request_batch_size=request_batch_size,
+                        schedule=schedule,
+                        stream_responses=args.stream,
+                        store=store,
+                        run_id=args.run_id
+                    )
+
+                    response_dict = {}
+                    for round in range(num_rounds):
+                        response_dict[f'round{round+1}'] = responses[round]
+
+                    # Create a DataFrame with the responses
+                    response_df = pd.DataFrame(response_dict)
+
+                    # Save to the compressed archive (one story readable at a time) or to CSV
+                    if response_format == "archive":
+                        write_archive(model_name, response_df, codec=archive_codec)
+                        print(f"Generated responses for {model_name} saved to {ARCHIVE_DIR}/{model_name}/")
+                    else:
+                        response_df.to_csv(f'data/processed/{model_name}_responses.csv', sep=';', index=False)
+                        print(f"Generated responses for {model_name} saved to data/processed/{model_name}_responses.csv")
                 
-                # Clean up temporary files after successful completion
-                clean_temp_files(model_name)
+                    # Clean up temporary files after successful completion
+                    clean_temp_files(model_name)
                 
-            except Exception as e:
-                print(f"Error processing {model_name}: {str(e)}")
-                continue  # Move to next model if there's an error
+                except Exception as e:
+                    print(f"Error processing {model_name}: {str(e)}")
+                    continue  # Move to next model if there's an error
+    finally:
+        if store:
+            store.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -6,12 +6,21 @@ Analyzes linguistic patterns across 3 rounds and 2 models (ChatGPT and Claude)
 import pandas as pd
 import numpy as np
 import re
+import json
 from collections import Counter
 from scipy import stats
+import sys
 import warnings
 from pathlib import Path
 warnings.filterwarnings('ignore')
 
+# Add the root directory to the Python path
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from src.utils.results_store import ResultsStore
+from src.utils.response_archive import ResponseArchive, response_source
+
 class LexicalBiasAnalyzer:
     """Analyzer for detecting lexical bias in narrative descriptions"""
     
@@ -25,6 +34,10 @@ class LexicalBiasAnalyzer:
         self.base_dir = Path(base_dir)
         self.data_processed = self.base_dir / 'data' / 'processed'
         self.data_results = self.base_dir / 'data' / 'results' / 'charactersANDcriminal_info'
+        self.store_path = self.base_dir / 'data' / 'results' / 'results.db'
+        config_path = self.base_dir / 'general_config.json'
+        config = json.loads(config_path.read_text()) if config_path.exists() else {}
+        self.response_format = config.get('response_format', 'csv')
         
         print("="*70)
         print("LEXICAL BIAS ANALYZER - INITIALIZATION")
@@ -34,65 +47,98 @@ class LexicalBiasAnalyzer:
         self._load_data()
     
     def _load_data(self):
-        """Load all narrative and extracted info files"""
-        
-        print("\n1. Loading narrative files...")
-        print("-"*70)
-        
-        # ChatGPT narratives
-        chatgpt_file = self.data_processed / 'chatgpt_responses.csv'
-        print(f"Loading: {chatgpt_file}")
-        self.chatgpt_narratives = pd.read_csv(chatgpt_file, sep=';', header=0, encoding='utf-8')
-        print(f"  Columns: {self.chatgpt_narratives.columns.tolist()}")
-        print(f"  Shape: {self.chatgpt_narratives.shape}")
-        
-        # Claude narratives
-        claude_file = self.data_processed / 'claude_responses.csv'
-        print(f"\nLoading: {claude_file}")
-        self.claude_narratives = pd.read_csv(claude_file, sep=';', header=0, encoding='utf-8')
-        print(f"  Columns: {self.claude_narratives.columns.tolist()}")
-        print(f"  Shape: {self.claude_narratives.shape}")
+        """Load all narratives and extracted info, from the results store for the models and rounds it holds"""
         
-        print("\n2. Loading extracted character info files...")
-        print("-"*70)
-        
-        # Load extracted info for all rounds and models
-        self.extracted_info = {}
-        
-        for model in ['chatgpt', 'claude']:
-            self.extracted_info[model] = {}
+        store = ResultsStore(str(self.store_path)) if self.store_path.exists() else None
+        try:
+            print("\n1. Loading narrative files...")
+            print("-"*70)
             
-            for round_num in [1, 2, 3]:
-                # Note: Some filenames might be missing .csv extension dot
-                filename = f'extracted_info_{model}_round{round_num}.csv'
-                filepath = self.data_results / filename
-                
-                if not filepath.exists():
-                    # Try without proper .csv extension (round2csv instead of round2.csv)
-                    filename_alt = f'extracted_info_{model}_round{round_num}csv'
-                    filepath = self.data_results / filename_alt
+            # ChatGPT and Claude narratives
+            self.chatgpt_narratives = self._load_narratives('chatgpt', store)
+            self.claude_narratives = self._load_narratives('claude', store)
+            
+            print("\n2. Loading extracted character info files...")
+            print("-"*70)
+            
+            # Load extracted info for all rounds and models
+            self.extracted_info = {}
+            
+            for model in ['chatgpt', 'claude']:
+                self.extracted_info[model] = {}
                 
-                if filepath.exists():
-                    print(f"\nLoading: {filepath.name}")
-                    df = pd.read_csv(filepath, sep=',', header=0, encoding='utf-8')
-                    print(df.head(3))
-                    print(f"  Columns: {df.columns.tolist()}")
-                    print(f"  Shape: {df.shape}")
-                    self.extracted_info[model][round_num] = df
-                else:
-                    print(f"\nWARNING: File not found: {filename}")
+                for round_num in [1, 2, 3]:
+                    df = self._load_extracted_info(model, round_num, store)
+                    if df is not None:
+                        self.extracted_info[model][round_num] = df
+        finally:
+            if store:
+                store.close()
         
         print("\n" + "="*70)
         print("Data loading complete!")
         print("="*70)
     
+    def _load_extracted_info(self, model, round_num, store=None):
+        """Extracted info of a model and round, indexed by prompt_id, from the store if it has rows for them, otherwise from its CSV file"""
+        if store:
+            df = store.extractions(model, round_num)
+            if len(df):
+                print(f"\nLoading: {model} round {round_num} from the results store ({len(df)} extracted rows)")
+                return df
+        
+        # Note: Some filenames might be missing .csv extension dot
+        filename = f'extracted_info_{model}_round{round_num}.csv'
+        filepath = self.data_results / filename
+        
+        if not filepath.exists():
+            # Try without proper .csv extension (round2csv instead of round2.csv)
+            filename_alt = f'extracted_info_{model}_round{round_num}csv'
+            filepath = self.data_results / filename_alt
+        
+        if not filepath.exists():
+            print(f"\nWARNING: File not found: {filename}")
+            return None
+        
+        print(f"\nLoading: {filepath.name}")
+        df = pd.read_csv(filepath, sep=',', header=0, encoding='utf-8')
+        # Rows are keyed by their prompt; files written before the prompt_id column are in prompt order
+        df = df.set_index('prompt_id') if 'prompt_id' in df.columns else df.rename_axis('prompt_id')
+        print(df.head(3))
+        print(f"  Columns: {df.columns.tolist()}")
+        print(f"  Shape: {df.shape}")
+        return df
+    
+    def _load_narratives(self, model, store=None):
+        """Narratives of a model from the results store if it has them, otherwise from its responses in the configured format"""
+        if store:
+            narratives = store.round_responses(model)
+            if len(narratives):
+                print(f"\nLoading: {model} narratives from the results store")
+                print(f"  Shape: {narratives.shape}")
+                return narratives
+        
+        # The archive or the CSV file, as configured in response_format, or the one that exists
+        source, source_path = response_source(model, self.response_format, str(self.data_processed), temp_dir=None)
+        if source == 'archive':
+            print(f"\nLoading: {source_path}")
+            narratives = ResponseArchive(model, str(self.data_processed / 'archive')).to_frame()
+        else:
+            narratives_file = self.data_processed / f'{model}_responses.csv'
+            print(f"\nLoading: {narratives_file}")
+            # Rows of the responses file are in prompt order
+            narratives = pd.read_csv(narratives_file, sep=';', header=0, encoding='utf-8').rename_axis('prompt_id')
+        print(f"  Columns: {narratives.columns.tolist()}")
+        print(f"  Shape: {narratives.shape}")
+        return narratives
+    
     def _prepare_character_data(self, extracted_df, model, round_num):
         """
         Reshape extracted data from wide to long format
         Converts one row with 4 characters into 4 rows (one per character)
         
         Parameters:
-        - extracted_df: DataFrame with columns like location, criminal, origin1-4, etc.
+        - extracted_df: DataFrame with columns like location, criminal, origin1-4, etc., indexed by prompt_id
         - model: 'chatgpt' or 'claude'
         - round_num: 1, 2, or 3
         
@@ -103,7 +149,7 @@ class LexicalBiasAnalyzer:
 
         print(extracted_df.head(3))
         
-        for idx, row in extracted_df.iterrows():
+        for prompt_id, row in extracted_df.iterrows():
             location = row['location']
             criminal_char_num = row['criminal']  # Which character (1-4) is the criminal
             
@@ -123,7 +169,7 @@ class LexicalBiasAnalyzer:
                 char_data = {
                     'model': model,
                     'round': round_num,
-                    'prompt_id': idx,
+                    'prompt_id': prompt_id,
                     'location': str(location).strip() if pd.notna(location) else None,
                     'character_num': char_num,
                     'nationality': str(origin).strip() if pd.notna(origin) else None,
@@ -355,11 +401,11 @@ class LexicalBiasAnalyzer:
                 for idx, char in characters_df.iterrows():
                     prompt_id = char['prompt_id']
                     
-                    # Get narrative for this prompt
-                    if prompt_id >= len(narratives_df):
+                    # Get narrative for this prompt (rows are indexed by prompt_id)
+                    if prompt_id not in narratives_df.index:
                         continue
                     
-                    narrative_text = narratives_df.iloc[prompt_id][narrative_col]
+                    narrative_text = narratives_df.at[prompt_id, narrative_col]
                     
                     if pd.isna(narrative_text):
                         continue
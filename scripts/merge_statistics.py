@@ -0,0 +1,30 @@
+import argparse
+import sys
+from pathlib import Path
+
+# Add the root directory to the Python path
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from src.utils.statistics_accumulator import StatisticsAccumulator
+from src.utils.result_writers import save_results, RESULT_FORMATS
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the statistics counts of several shards or runs into one statistics file.")
+    parser.add_argument('counts', nargs='+', help="statistics_counts_{model}.json files saved by analyse_results.py")
+    parser.add_argument('--output', required=True, help="Directory of the merged statistics tables")
+    parser.add_argument('--format', default='csv', choices=RESULT_FORMATS, help="File format of the tables")
+    parser.add_argument('--excel', action='store_true', help="Also export the tables to {output}.xlsx")
+    parser.add_argument('--save-counts', default=None, help="Also save the merged counts to this JSON file")
+    args = parser.parse_args()
+
+    accumulator = StatisticsAccumulator.load(args.counts[0])
+    for path in args.counts[1:]:
+        accumulator.merge(StatisticsAccumulator.load(path))
+
+    if args.save_counts:
+        accumulator.save(args.save_counts)
+    save_results(accumulator.finalize(), args.output, args.format, args.excel)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import argparse
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# Add the root directory to the Python path
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from src.utils.bias_cube import BiasCube, CUBE_PATH
+
+def parse_filters(conditions):
+    """Filters of BiasCube.select from "dimension=value" conditions (slots are numbers)"""
+    filters = {}
+    for condition in conditions:
+        dimension, value = condition.split('=', 1)
+        filters.setdefault(dimension, []).append(int(value) if dimension == 'slot' else value)
+    return filters
+
+def main():
+    parser = argparse.ArgumentParser(description="Criminal rates by any combination of dimensions, read from the bias cube.")
+    parser.add_argument('dimensions', nargs='*',
+                        help="Dimensions to group by: origin, religion, region, gender, location, slot, model, round")
+    parser.add_argument('--where', action='append', default=[], metavar='DIMENSION=VALUE',
+                        help="Keep only the characters with this value (repeatable), e.g. --where model=chatgpt")
+    parser.add_argument('--cube', default=CUBE_PATH, help="Cube saved by analyse_results.py")
+    parser.add_argument('--output', default=None, help="Save the table to this CSV file")
+    args = parser.parse_args()
+
+    cube = BiasCube.load(args.cube).select(**parse_filters(args.where))
+    table = cube.rollup(*args.dimensions)
+    with pd.option_context('display.max_rows', None):
+        print(table)
+    if args.output:
+        table.to_csv(args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import re
+import sys
+from pathlib import Path
+
+# Add the root directory to the Python path
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from src.utils.review_queue import unanswered_reviews, save_review_answer
+
+def valid_answer(record, answer):
+    """Same checks as the interactive fallbacks of the extractor"""
+    if record['field'] == 'name':
+        return bool(answer) and re.search(re.escape(answer), record['snippet']) is not None
+    if record['field'] == 'gender':
+        return answer.lower() in ['male', 'female']
+    return answer in ['1', '2', '3', '4']
+
+def main():
+    pending = unanswered_reviews()
+    print(f'{len(pending)} values waiting for review. Enter the value, "s" to skip or "q" to quit (answers are saved at once).')
+
+    for num, record in enumerate(pending):
+        character = f"character {record['character']}" if record['field'] != 'criminal' else 'criminal character number (1-4)'
+        print(f"\n[{num + 1}/{len(pending)}] {record['model']} {record['round']}, row {record['row']}: enter the {record['field']} of the {character}")
+        print('Text extracted from the response:')
+        print(record['snippet'])
+        print(f"Candidates: {', '.join(record['candidates'])}")
+
+        while True:
+            answer = input('> ').strip()
+            if answer in ['s', 'q'] or valid_answer(record, answer):
+                break
+            print('Invalid input! Please enter the value exactly as it appears in the text.')
+
+        if answer == 'q':
+            break
+        if answer != 's':
+            save_review_answer(record, answer.lower() if record['field'] == 'gender' else answer)
+
+    print(f'\n{len(unanswered_reviews())} values left for review. Run scripts/analyse_results.py to merge the answers.')
+
+if __name__ == "__main__":
+    main()
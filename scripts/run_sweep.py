@@ -0,0 +1,92 @@
+import argparse
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Add the root directory to the Python path
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from generate_responses import modules, load_config, response_generation, clean_temp_files
+from src.utils.scenario_store import load_prompt_inputs
+from src.utils.experiment_sweep import (load_sweep_spec, expand_sweep, interleave_jobs, pipe_key, job_is_complete,
+                                        copy_job_responses, save_job_responses, assemble_variant_responses)
+
+def run_provider_queue(sweep_name, model_name, jobs, prompts, request_batch_size):
+    """Run the jobs of one provider in order; providers run concurrently"""
+    # The model is loaded once and reused by the following jobs with the same loading options
+    pipe, loaded_key = None, None
+    for job in jobs:
+        if job_is_complete(sweep_name, job, len(prompts)):
+            print(f"Skipping {model_name} round {job['round'] + 1} for {job['variants']}: responses exist.")
+            continue
+        if copy_job_responses(sweep_name, job, len(prompts)):
+            print(f"Copied {model_name} round {job['round'] + 1} to {job['variants']} from a variant with the same config.")
+            continue
+
+        if pipe_key(job['config']) != loaded_key:
+            pipe = None # release the previous model before loading the next one
+            pipe, loaded_key = modules[model_name].load_pipe(job['config']), pipe_key(job['config'])
+
+        print(f"\n********** {model_name} | round {job['round'] + 1} | variants {job['variants']} **********")
+        checkpoint_name = f"{sweep_name}_{model_name}_{job['fingerprint']}_r{job['round'] + 1}"
+        responses = response_generation(
+            model=modules[model_name],
+            model_name=checkpoint_name,
+            prompts=prompts,
+            config=job['config'],
+            num_rounds=1,
+            request_batch_size=request_batch_size,
+            pipe=pipe
+        )
+        save_job_responses(sweep_name, job, responses[0])
+        clean_temp_files(checkpoint_name)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate responses for every (model, config variant, round) of a sweep.")
+    parser.add_argument('--spec', default='src/config/sweep_config.json', help="Path to the sweep specification")
+    args = parser.parse_args()
+
+    with open('general_config.json', 'r') as f:
+        general_config = json.load(f)
+
+    spec = load_sweep_spec(args.spec)
+    spec.setdefault('num_generation_rounds', general_config["num_generation_rounds"])
+    unknown_models = [model for model in spec['models'] if model not in modules]
+    if unknown_models:
+        raise ValueError(f'Unknown models in sweep specification: {unknown_models}')
+
+    # Load input prompts
+    _, prompts = load_prompt_inputs(general_config["number_of_request"], general_config["base_prompt"])
+
+    jobs = expand_sweep(spec, load_config)
+    queues = interleave_jobs(jobs)
+    print(f"Sweep '{spec['name']}': {len(jobs)} unique jobs over {len(queues)} providers "
+          f"and {len(spec['variants'])} variants.")
+
+    # One worker per provider, so the API rate limits of different providers are used in parallel
+    with ThreadPoolExecutor(max_workers=len(queues)) as executor:
+        futures = {executor.submit(run_provider_queue, spec['name'], model_name, model_jobs,
+                                   prompts, general_config["request_batch_size"]): model_name
+                   for model_name, model_jobs in queues.items()}
+        failed_models = []
+        for future, model_name in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error processing sweep jobs of {model_name}: {str(e)}")
+                failed_models.append(model_name)
+
+    # Combine the round files of every variant whose rounds are all saved
+    for model_name in queues:
+        for variant_name in spec['variants']:
+            if assemble_variant_responses(spec['name'], variant_name, model_name, spec['num_generation_rounds']):
+                print(f"Responses of {model_name} for {variant_name} saved to "
+                      f"data/processed/sweeps/{spec['name']}/{variant_name}/{model_name}_responses.csv")
+
+    if failed_models:
+        sys.exit(f"Sweep '{spec['name']}' did not complete for: {', '.join(failed_models)}")
+
+if __name__ == "__main__":
+    main()
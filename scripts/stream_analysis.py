@@ -0,0 +1,181 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Add the root directory to the Python path
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from src.utils.analyse_response_text import CriminalInfoExtractor
+from src.utils.extraction_cache import ExtractionCache, extract_rounds_incremental
+from src.utils.review_queue import load_review_answers, add_pending_reviews
+from src.utils.statistics_accumulator import StatisticsAccumulator
+from src.utils.compute_round_agreement import RoundAgreementAccumulator
+from src.utils.response_stream import stream_path, StreamFollower
+from src.utils.scenario_store import load_prompt_inputs
+from src.utils.result_writers import replace_file, save_tables
+
+SNAPSHOT_DIR = 'data/results/live'
+
+def stream_round_responses(records, info_df):
+    """Responses of new stream records joined with their input information, per round and indexed by prompt"""
+    latest = {(record['prompt_idx'], record['round']): record['response'] for record in records if 'prompt_idx' in record}
+    round_responses = {}
+    for round in sorted({round for _, round in latest}):
+        prompt_ids = sorted(prompt_idx for prompt_idx, r in latest if r == round)
+        responses_df = info_df.iloc[prompt_ids].copy()
+        responses_df.index = prompt_ids
+        responses_df.insert(0, 'response', [latest[(prompt_idx, round)] for prompt_idx in prompt_ids])
+        round_responses[f'round{round+1}'] = responses_df[responses_df['response'].notna()]
+    return round_responses
+
+class StreamAnalysis:
+    """
+    Extraction, statistics and round agreement of the records of a response stream, updated with the new records only.
+
+    Without run_id the latest run in the stream is followed; with it, records are
+    only analysed once the header of that run has been read.
+    """
+
+    def __init__(self, model_name, info_df, extractor, cache, num_rounds, run_id=None):
+        self.model_name = model_name
+        self.info_df = info_df
+        self.extractor = extractor
+        self.cache = cache
+        self.rounds = [f'round{round+1}' for round in range(num_rounds)]
+        self.num_expected = len(info_df) * num_rounds
+        self.run_id = run_id
+        self.coding = None
+        self.reset()
+
+    def reset(self):
+        """Forget the records of a previous run"""
+        self.received, self.num_pending = set(), 0
+        self.accumulator = StatisticsAccumulator(coding=self.coding)
+        self.coding = self.accumulator.coding
+        self.agreement = RoundAgreementAccumulator(self.rounds)
+        self.counted = set()
+        # Run whose header was read last
+        self.current_run = None
+        # Records read before the header of the awaited run: responses of the run it resumes, or of a previous run
+        self.waiting = []
+
+    def count_new_rows(self, round_info):
+        """Add the complete rows not counted yet to the statistics and agreement, so that each read only counts its new rows"""
+        for round, info in round_info.items():
+            info = info.dropna()
+            new_rows = info[[(round, prompt_idx) not in self.counted for prompt_idx in info.index]]
+            if len(new_rows):
+                self.accumulator.update_frame(round, new_rows)
+                self.agreement.update(round, new_rows)
+                self.counted.update((round, prompt_idx) for prompt_idx in new_rows.index)
+
+    def read(self, records, restarted=False):
+        """
+        Analyse the records of one read of the stream.
+
+        Returns:
+        tuple: (whether new responses were analysed, whether the analysis is complete)
+        """
+        # A new (not resumed) run starts the stream with its header: what was read before it belongs to a previous run
+        new_streams = [position for position, record in enumerate(records)
+                       if 'run_id' in record and not record.get('done') and not record.get('resumed')]
+        if new_streams:
+            records = records[new_streams[-1]:]
+        if restarted or new_streams:
+            self.reset()
+
+        generation_stopped = False
+        for record in records:
+            if 'run_id' in record and not record.get('done'):
+                self.current_run = record['run_id']
+            # The generator marks the end of its run with a "done" record
+            elif record.get('done') and record.get('run_id') == self.current_run:
+                generation_stopped = True
+        # Until the header of the awaited run is read, the stream is that of a previous run
+        following = self.run_id is None or self.current_run == self.run_id
+        if not following:
+            self.waiting.extend(records)
+            return False, False
+        if self.waiting:
+            # A resumed run appends to the stream, whose earlier responses are then part of it
+            records, self.waiting = self.waiting + records, []
+
+        round_responses = stream_round_responses(records, self.info_df)
+        if round_responses:
+            self.count_new_rows(extract_rounds_incremental(round_responses, self.extractor, self.cache))
+            if self.extractor.pending:
+                add_pending_reviews(self.extractor.pending, self.model_name)
+                self.num_pending += len(self.extractor.pending)
+                self.extractor.pending = []
+            self.received.update((record['prompt_idx'], record['round']) for record in records if 'prompt_idx' in record)
+        return bool(round_responses), generation_stopped or len(self.received) >= self.num_expected
+
+    def write_snapshot(self):
+        """Statistics, round agreement and progress of the responses extracted so far"""
+        if not self.counted:
+            return
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+
+        # Rounds in order, whatever the order their first responses arrived in
+        self.accumulator.round_counts = dict(sorted(self.accumulator.round_counts.items(), key=lambda item: int(item[0][5:])))
+        save_tables(self.accumulator.finalize(), f'{SNAPSHOT_DIR}/statistics_{self.model_name}')
+
+        # Rounds are aligned by prompt, each agreement being computed on the prompts extracted in the rounds compared
+        extracted_per_round = {round: self.agreement.round_rows[round] for round in self.rounds if self.agreement.round_rows[round]}
+        if len(extracted_per_round) > 1:
+            round_agreement_dict = self.agreement.result()
+            replace_file(lambda path: round_agreement_dict['pairwise_kappa'].to_csv(path, index=False),
+                         f'{SNAPSHOT_DIR}/round_agreement_{self.model_name}.csv')
+            replace_file(lambda path: round_agreement_dict['multi_rater'].to_csv(path, index=False),
+                         f'{SNAPSHOT_DIR}/multi_rater_agreement_{self.model_name}.csv')
+
+        status = {'updated': datetime.now().isoformat(timespec='seconds'),
+                  'responses_received': len(self.received),
+                  'responses_expected': self.num_expected,
+                  'extracted_per_round': extracted_per_round,
+                  'prompts_in_all_rounds': self.agreement.prompts_in_all_rounds(),
+                  'values_pending_review': self.num_pending}
+        replace_file(lambda path: Path(path).write_text(json.dumps(status, indent=2)), f'{SNAPSHOT_DIR}/status_{self.model_name}.json')
+        print(f"[{status['updated']}] {len(self.received)}/{self.num_expected} responses; snapshot saved to {SNAPSHOT_DIR}/")
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract and analyse the responses of a model while they are generated.")
+    parser.add_argument('--model', required=True, help="Model whose response stream is followed (generate_responses.py --stream)")
+    parser.add_argument('--interval', type=float, default=30, help="Seconds between two reads of the stream")
+    parser.add_argument('--once', action='store_true', help="Analyse the responses streamed so far and exit")
+    parser.add_argument('--run-id', default=None,
+                        help="Only follow the generation run with this id (generate_responses.py --run-id); "
+                             "records of earlier runs left in the stream are not analysed")
+    args = parser.parse_args()
+
+    with open('general_config.json', 'r') as f:
+        config = json.load(f)
+    info_df, _ = load_prompt_inputs(config["number_of_request"])
+
+    # No terminal prompts in the background: unresolved values go to the review queue
+    extractor = CriminalInfoExtractor(interactive=False, review_answers=load_review_answers(),
+                                      use_scanner=config.get("extraction_scanner", False),
+                                      use_index=config.get("extraction_country_index", False))
+    analysis = StreamAnalysis(args.model, info_df, extractor, ExtractionCache(args.model, version=extractor.version),
+                              config["num_generation_rounds"], args.run_id)
+    follower = StreamFollower(stream_path(args.model))
+
+    print(f'Following {stream_path(args.model)} (Ctrl+C to stop)...')
+    try:
+        while True:
+            analysed, complete = analysis.read(*follower.read_new())
+            if analysed:
+                analysis.write_snapshot()
+            if args.once or complete:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print('Stopped following the stream.')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import os
+import torch
+from accelerate.utils import convert_file_size_to_int
+from transformers import pipeline
+
+# Config keys used to load the model; they are not passed to the generation call
+LOAD_CONFIG_KEYS = ['model', 'memory_ceiling', 'gpu_memory_ceiling', 'offload_folder']
+
+def max_memory_map(config):
+    """
+    Memory budget per device for accelerate's "auto" device map, or None without a ceiling.
+
+    "memory_ceiling" (e.g. "6GiB") bounds the weights kept in RAM and on each
+    GPU. "gpu_memory_ceiling" sets another bound for the GPUs. A GPU never gets
+    more than 90% of its free memory. The layers that do not fit are offloaded
+    to disk and memory-mapped when they are used. The ceiling only covers the
+    weights, so leave headroom for the activations.
+    """
+    ceiling = config.get('memory_ceiling')
+    if not ceiling:
+        return None
+
+    max_memory = {'cpu': ceiling}
+    gpu_ceiling = convert_file_size_to_int(config.get('gpu_memory_ceiling') or ceiling)
+    for device in range(torch.cuda.device_count()):
+        max_memory[device] = min(gpu_ceiling, int(0.9 * torch.cuda.mem_get_info(device)[0]))
+
+    return max_memory
+
+def load_text_generation_pipe(config):
+    model_id = config['model']
+    model_kwargs = {"torch_dtype": torch.bfloat16,
+                    "low_cpu_mem_usage": True,
+                    }
+
+    max_memory = max_memory_map(config)
+    if max_memory:
+        offload_folder = config.get('offload_folder') or os.path.join('data/temp/offload', model_id.replace('/', '_'))
+        os.makedirs(offload_folder, exist_ok=True)
+        model_kwargs.update({"max_memory": max_memory,
+                             "offload_folder": offload_folder,
+                             "offload_state_dict": True,
+                             })
+        print(f"Loading {model_id} with memory ceiling {max_memory}; the remaining layers are offloaded to {offload_folder}.")
+
+    return pipeline(
+        "text-generation",
+        model=model_id,
+        model_kwargs=model_kwargs,
+        device_map="auto",
+    )
+
+def generation_kwargs(config):
+    """Generation arguments of a model config, without the messages and the loading options"""
+    kwargs = {key: value for key, value in config.items() if key not in LOAD_CONFIG_KEYS}
+    del kwargs['messages']
+    return kwargs
@@ -4,22 +4,19 @@ hf_access_token = os.environ['HF_ACCESS_TOKEN']
 from huggingface_hub import login
 login(token=hf_access_token)
 
-import torch
-from transformers import pipeline
 import json
 import re
+import sys
+from pathlib import Path
 
-def load_pipe(config):
-    model_id = config['model']
+# Add the project root to the Python path, so that src.models.hf_memory resolves when the script is run directly
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))
+
+from src.models.hf_memory import load_text_generation_pipe, generation_kwargs
 
-    return pipeline(
-        "text-generation",
-        model=model_id,
-        model_kwargs={"torch_dtype": torch.bfloat16,
-                  "low_cpu_mem_usage": True,
-                  },
-        device_map="auto",
-    )
+def load_pipe(config):
+    return load_text_generation_pipe(config)
 
 # Function to chat with lLama
 def generate_response(pipe=None, prompt='', config=None):
@@ -38,9 +35,7 @@ def generate_response(pipe=None, prompt='', config=None):
     
     messages = config['messages'] 
     messages[1]['content'] = prompt # including system prompt and general story prompt
-    kwargs = config.copy()
-    del kwargs['messages']
-    del kwargs['model']
+    kwargs = generation_kwargs(config)
 
     terminators = [
         pipe.tokenizer.eos_token_id,
@@ -64,13 +59,6 @@ def generate_response(pipe=None, prompt='', config=None):
 
 def main():
 
-    import sys
-    from pathlib import Path
-
-    # Add the parent directory to the Python path
-    parent_root = Path(__file__).resolve().parents[1]
-    sys.path.insert(0, str(parent_root))
-
     # Load model configuration
     with open('src/config/llama_config.json', 'r') as config_file:
         config = json.load(config_file)
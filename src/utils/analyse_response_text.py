@@ -1,13 +1,26 @@
+import hashlib
 import pandas as pd
 import re
 import json
 
-def create_country_mapping():
+from src.utils.response_scanner import ResponseScanner
+from src.utils.country_index import CountryIndex, DEMONYMS_PATH
+
+# Version of the extraction rules; bump it whenever a change can alter the extracted values,
+# so that the cached extractions (see extraction_cache.py) are recomputed
+EXTRACTOR_VERSION = 4
+
+def extractor_version(use_scanner=False, use_index=False):
+    """Version of the extracted values of an extractor mode, EXTRACTOR_VERSION for the default mode"""
+    modes = [mode for mode, used in [('scanner', use_scanner), ('index', use_index)] if used]
+    return '-'.join([str(EXTRACTOR_VERSION)] + modes) if modes else EXTRACTOR_VERSION
+
+def create_country_mapping(aliases_path='src/utils/country_aliases.json'):
     """Create a mapping of country names and their aliases"""
     mapping = {}
     
     # Load aliases from JSON file
-    with open('src/utils/country_aliases.json', 'r') as f:
+    with open(aliases_path, 'r') as f:
         country_aliases = json.load(f)
     
     # Create mapping for each alias to the standard name
@@ -27,20 +40,20 @@ def normalize_country_name(country):
     country = re.sub(r'\s+', ' ', country)
     return country
 
+# Translation table of accented characters to their plain equivalents
+CHAR_TRANSLATION = str.maketrans({
+    'é': 'e', 'è': 'e', 'ê': 'e', 'ë': 'e',
+    'á': 'a', 'à': 'a', 'â': 'a', 'ä': 'a',
+    'í': 'i', 'ì': 'i', 'î': 'i', 'ï': 'i',
+    'ó': 'o', 'ò': 'o', 'ô': 'o', 'ö': 'o',
+    'ú': 'u', 'ù': 'u', 'û': 'u', 'ü': 'u',
+    'ý': 'y', 'ÿ': 'y',
+    'ñ': 'n',
+    'ç': 'c'
+})
+
 def normalize_chars(text):
-   replacements = {
-       'é': 'e', 'è': 'e', 'ê': 'e', 'ë': 'e',
-       'á': 'a', 'à': 'a', 'â': 'a', 'ä': 'a',
-       'í': 'i', 'ì': 'i', 'î': 'i', 'ï': 'i',
-       'ó': 'o', 'ò': 'o', 'ô': 'o', 'ö': 'o',
-       'ú': 'u', 'ù': 'u', 'û': 'u', 'ü': 'u',
-       'ý': 'y', 'ÿ': 'y',
-       'ñ': 'n',
-       'ç': 'c'
-   }
-   for old, new in replacements.items():
-       text = text.replace(old, new)
-   return text
+    return text.translate(CHAR_TRANSLATION)
 
 def manually_get_character_name(character_match, response):
     print("\nCharacter name not found! Manually enter character's name.\n")
@@ -197,3 +210,204 @@ def extract_criminal_info(response_info_row):
             'origin2': characters['origin2'], 'religion2': characters['religion2'], 'name2': info['character_2']['name'], 'gender2': info['character_2']['gender'],
             'origin3': characters['origin3'], 'religion3': characters['religion3'], 'name3': info['character_3']['name'], 'gender3': info['character_3']['gender'],
             'origin4': characters['origin4'], 'religion4': characters['religion4'], 'name4': info['character_4']['name'], 'gender4': info['character_4']['gender']}
+
+
+def review_key(response, field, character):
+    """Key of a manually reviewed value: hash of the response text, the field and the character number"""
+    return f"{hashlib.sha1(response.encode('utf-8')).hexdigest()[:16]}:{field}:{character}"
+
+def character_pattern(i):
+    """Pattern of the information line of character i (the text after its number)"""
+    return fr'(?:(?:\{{(?:Character[_ ]?)?{i}\}}|\bCharacter[_ ]?\{{{i}\}}|\b{i})(?:\.|\:|\,| )|\{{(?:Character[_ ]?)?{i}[\.|\:| ]|\bCharacter_{i}[\.\:])\s*(.*?)(?:\r\n|\r|\n|$)'
+
+class CriminalInfoExtractor:
+    """
+    Extract the characters' and criminal's information from responses.
+
+    By default it gives the same output as extract_criminal_info, but the countries information and
+    the country aliases are loaded once and every pattern is compiled once, so one
+    extractor can process all the rows of all rounds and models.
+
+    With use_scanner, the character lines and fields and the criminal sentence are
+    read by a single-pass ResponseScanner. The character patterns are only searched
+    for the characters it could not complete, and the criminal's origin only in the
+    criminal sentence; country mentions in that sentence are used when neither the
+    origin nor the name identifies the criminal.
+
+    With use_index, the criminal's origin is resolved by a CountryIndex (aliases,
+    demonyms and misspellings) instead of being compared verbatim with the
+    characters' origins, and the scanner also recognises demonyms.
+
+    The Nationality field of each character is returned in nationality{i}, for the
+    audit in extraction_audit.py (which resolves demonyms itself); with use_index it
+    is already resolved to the standard country name when possible. It is an empty
+    string when the response does not state it.
+
+    The scanner and the index change the extracted values, so they are opt-in
+    ("extraction_scanner" and "extraction_country_index" in general_config.json)
+    and self.version, which keys the extraction cache, depends on them.
+
+    Values the patterns cannot find are taken from review_answers if they have been
+    reviewed already. Otherwise they are asked for on the terminal in interactive
+    mode; in non-interactive mode they are left empty and the row is recorded in
+    self.pending (with the failing snippet and the candidates) for a later batch review.
+    """
+
+    def __init__(self, countries_info_path='data/raw/selected_countries_info.csv', aliases_path='src/utils/country_aliases.json',
+                 interactive=True, review_answers=None, use_scanner=False, use_index=False):
+        self.country_index = CountryIndex(aliases_path, demonyms_path=DEMONYMS_PATH) if use_index else None
+        self.scanner = ResponseScanner(aliases_path, demonyms_path=DEMONYMS_PATH if use_index else None) if use_scanner else None
+        self.version = extractor_version(use_scanner, use_index)
+        self.interactive = interactive
+        self.review_answers = review_answers if review_answers else {}
+        self.pending = []
+
+        countries_info = pd.read_csv(countries_info_path, sep=';')
+        self.country_regions = dict(zip(countries_info['Country'], countries_info['Region'].str.strip()))
+        self.country_mapping = create_country_mapping(aliases_path)
+
+        self.list_header_pattern = re.compile(r'(Character\s+(List|Details):)|(Characters:)')
+        self.character_patterns = {i: re.compile(character_pattern(i), re.DOTALL|re.IGNORECASE) for i in range(1, 5)}
+        self.character_number_pattern = re.compile(re.escape('{character_number}'), re.IGNORECASE)
+        self.gender_field_pattern = re.compile(r'Gender:\s*(\w+)', re.IGNORECASE)
+        self.gender_word_pattern = re.compile(r'female|male', re.IGNORECASE)
+        self.name_field_pattern = re.compile(r'Name:\s*(\w+)', re.IGNORECASE)
+        self.nationality_field_pattern = re.compile(r'Nationality:[ \t]*([^,\n*]*)', re.IGNORECASE)
+        self.name_gender_pattern = re.compile(r'\s?([A-Za-z\s-]+)\s?[,|:]\s*(gender: )?(male|female)', re.IGNORECASE)
+        self.criminal_origin_pattern = re.compile(r'The criminal is (?:\w+\s+)+from (?:the\s+)?([^.]+)')
+        self.criminal_name_pattern = re.compile(r'The criminal is (\w+)')
+
+    def find_character_match(self, response, i):
+        match = self.character_patterns[i].search(response)
+        if match:
+            return match.group(1).strip()
+        return self.character_number_pattern.split(response, maxsplit=i)[i]
+
+    def resolve_manually(self, field, character, snippet, candidates, response, row, manual_function):
+        """Value of a field that the patterns could not find: reviewed answer, terminal input or review queue"""
+        key = review_key(response, field, character)
+        if key in self.review_answers:
+            return self.review_answers[key]
+        if self.interactive:
+            return manual_function()
+
+        self.pending.append({'review_key': key, 'field': field, 'character': character, 'row': None if row is None else int(row),
+                             'snippet': snippet, 'candidates': candidates})
+        return None
+
+    def find_gender(self, character_match, response, i=None, row=None):
+        gender_match = self.gender_field_pattern.search(character_match)
+        if gender_match:
+            return gender_match.group(1).lower()
+        gender_match = self.gender_word_pattern.search(character_match)
+        if gender_match:
+            return gender_match.group(0)
+        return self.resolve_manually('gender', i, character_match, ['male', 'female'], response, row,
+                                     lambda: manually_get_character_gender(character_match, response))
+
+    def find_name(self, character_match, response, i=None, row=None):
+        name_match = self.name_field_pattern.search(character_match)
+        if name_match:
+            return name_match.group(1)
+        name_match = self.name_gender_pattern.search(character_match)
+        if name_match:
+            return name_match.group(0).split(',')[0].strip().split(':')[0].strip()
+        candidates = list(dict.fromkeys(re.findall(r'\b[A-Z][a-z]+\b', character_match)))
+        return self.resolve_manually('name', i, character_match, candidates, response, row,
+                                     lambda: manually_get_character_name(character_match, response))
+
+    def find_nationality(self, nationality):
+        """Standard country name of a stated nationality, or the stated text if it cannot be resolved"""
+        nationality = nationality.strip() if nationality else ''
+        if nationality and self.country_index:
+            country, _ = self.country_index.resolve(nationality)
+            return country if country else nationality
+        return nationality
+
+    def find_criminal(self, response, characters, info, row=None, scan=None):
+        names_list = [info[f"character_{i}"]['name'] for i in range(1, 5)]
+        origins_list = [characters[f'origin{i}'] for i in range(1, 5)]
+
+        if scan is None:
+            criminal_origin_match = self.criminal_origin_pattern.search(response)
+            criminal_name_match = self.criminal_name_pattern.search(response)
+            criminal_name = criminal_name_match.group(1) if criminal_name_match else None
+        else:
+            # The scanner has found the criminal sentence, so only that sentence is searched for the origin
+            criminal_sentence = scan['criminal_sentence']
+            criminal_origin_match = self.criminal_origin_pattern.search(criminal_sentence) if criminal_sentence else None
+            criminal_name = scan['criminal_name']
+
+        # Find criminal character number by origin or name
+        if criminal_origin_match and self.country_index:
+            criminal_origin, _ = self.country_index.resolve(criminal_origin_match.group(1))
+            if criminal_origin in origins_list:
+                return f'{origins_list.index(criminal_origin) + 1}'
+        elif criminal_origin_match:
+            normalized_origins = [normalize_country_name(origin) for origin in origins_list]
+            if criminal_origin_match.group(1) in normalized_origins:
+                return f'{normalized_origins.index(criminal_origin_match.group(1)) + 1}'
+
+        if criminal_name:
+            for i, name in enumerate(names_list):
+                if name and re.search(criminal_name, name):
+                    return f'{i + 1}'
+
+        # Countries found by the scanner in the criminal sentence
+        for country in scan['criminal_countries'] if scan else []:
+            if country in origins_list:
+                return f'{origins_list.index(country) + 1}'
+
+        last_sentence = response.split('.')[-1] if response.split('.')[-1] else response.split('.')[-2]
+        candidates = [f"{i}: {info[f'character_{i}']['name']} from {characters[f'origin{i}']}" for i in range(1, 5)]
+        return self.resolve_manually('criminal', 0, last_sentence.strip(), candidates, response, row,
+                                     lambda: manually_get_criminal_info(response, characters, info))
+
+    def extract(self, response_info_row):
+        info = {f"character_{i}": {'name': None, 'gender': None, 'nationality': ''} for i in range(1, 5)}
+
+        response = normalize_chars(response_info_row['response'].strip())
+        characters = response_info_row.drop('response')
+
+        # Remove redundant text that would cause false detection of characters' match
+        list_header_match = self.list_header_pattern.search(response)
+        if list_header_match:
+            response = response.replace(list_header_match.group(0), '')
+
+        # Find characters' names and genders
+        row = response_info_row.name
+        scan = self.scanner.scan(response) if self.scanner else None
+        for i in range(1, 5):
+            scanned = scan['characters'].get(i) if scan else None
+            if scanned and scanned['name'] and scanned['gender']:
+                info[f"character_{i}"]['gender'] = scanned['gender'].lower().capitalize()
+                info[f"character_{i}"]['name'] = scanned['name'].capitalize()
+                info[f"character_{i}"]['nationality'] = self.find_nationality(scanned['nationality'])
+                continue
+
+            character_i_match = self.find_character_match(response, i)
+            if character_i_match:
+                character_gender = self.find_gender(character_i_match, response, i, row)
+                character_name = self.find_name(character_i_match, response, i, row)
+                nationality_match = self.nationality_field_pattern.search(character_i_match)
+                info[f"character_{i}"]['gender'] = character_gender.capitalize() if character_gender else None
+                info[f"character_{i}"]['name'] = character_name.capitalize() if character_name else None
+                info[f"character_{i}"]['nationality'] = self.find_nationality(nationality_match.group(1) if nationality_match else None)
+
+        criminal_character = self.find_criminal(response, characters, info, row, scan)
+        if criminal_character:
+            criminal_character = str(criminal_character)
+            criminal_origin = characters['origin'+criminal_character]
+            result = {'location': characters['location'], 'criminal': criminal_character,
+                      'criminal_is_migrant': criminal_origin != characters['location'],
+                      'criminal_region': self.country_regions[criminal_origin]}
+        else: # left for review
+            result = {'location': characters['location'], 'criminal': None, 'criminal_is_migrant': None, 'criminal_region': None}
+        for i in range(1, 5):
+            result.update({f'origin{i}': characters[f'origin{i}'], f'religion{i}': characters[f'religion{i}'],
+                           f'name{i}': info[f'character_{i}']['name'], f'gender{i}': info[f'character_{i}']['gender'],
+                           f'nationality{i}': info[f'character_{i}']['nationality']})
+        return result
+
+    def __call__(self, response_info_row):
+        return self.extract(response_info_row)
@@ -0,0 +1,130 @@
+import json
+import numpy as np
+import pandas as pd
+
+from src.utils.compute_statistics import load_statistics_coding, category_codes
+
+CUBE_PATH = 'data/results/bias_cube.npz'
+
+class BiasCube:
+    """
+    Appearances and criminal assignments of the characters, counted over
+    origin x religion x region x gender x location x slot x model x round.
+
+    Only the non-empty cells are stored (coordinates and counts, as in a sparse
+    COO array), so any marginal or rollup is a bincount over the cells instead
+    of a pass over the extracted rows.
+    """
+
+    def __init__(self, labels, coords, appearances, criminals):
+        """
+        Parameters:
+        labels: Dictionary of dimension -> list of category labels, in the order of the coordinates
+        coords: (cells x dimensions) integer coordinates of the non-empty cells
+        appearances: Number of characters in each cell
+        criminals: Number of those characters assigned as the criminal
+        """
+        self.labels = {dimension: list(values) for dimension, values in labels.items()}
+        self.dimensions = list(self.labels)
+        self.coords = np.asarray(coords, dtype=np.int32).reshape(-1, len(self.dimensions))
+        self.appearances = np.asarray(appearances, dtype=np.int64)
+        self.criminals = np.asarray(criminals, dtype=np.int64)
+
+    @property
+    def shape(self):
+        return tuple(len(self.labels[dimension]) for dimension in self.dimensions)
+
+    @classmethod
+    def from_cells(cls, labels, coords, criminal):
+        """Cube of per-character coordinates (characters x dimensions), summing the characters that fall in the same cell"""
+        shape = tuple(len(values) for values in labels.values())
+        cells, inverse = np.unique(np.ravel_multi_index(np.asarray(coords).T, shape), return_inverse=True)
+        return cls(labels, np.column_stack(np.unravel_index(cells, shape)),
+                   np.bincount(inverse, minlength=len(cells)), np.bincount(inverse, weights=criminal, minlength=len(cells)))
+
+    @classmethod
+    def from_extractions(cls, model_round_info, country_info_path='data/raw/selected_countries_info.csv'):
+        """
+        Build the cube in one pass over extracted information.
+
+        Parameters:
+        model_round_info: Dictionary of model -> dictionary of round -> extracted criminal information DataFrame
+
+        Characters whose origin, religion, gender or location is outside the categories are left out.
+        """
+        coding = load_statistics_coding(country_info_path)
+        religions = pd.Index(coding['religions'].str.strip())
+        models = list(model_round_info)
+        rounds = list(dict.fromkeys(round for round_info in model_round_info.values() for round in round_info))
+        labels = {'origin': list(coding['countries']),
+                  'religion': list(religions),
+                  'region': list(coding['regions'].str.strip()),
+                  'gender': list(coding['genders']),
+                  'location': list(coding['countries']),
+                  'slot': [1, 2, 3, 4],
+                  'model': models,
+                  'round': rounds}
+
+        coords, criminal = [], []
+        for model_idx, (model, round_info) in enumerate(model_round_info.items()):
+            for round, info_df in round_info.items():
+                info_df = info_df[info_df['criminal'].notna()]
+                num_rows = len(info_df)
+                location = category_codes(info_df['location'], coding['countries'])
+                criminal_slots = pd.to_numeric(info_df['criminal']).to_numpy(dtype=np.int64) - 1
+                for slot in range(4):
+                    origin = category_codes(info_df[f'origin{slot+1}'], coding['countries'])
+                    cell = np.column_stack([origin,
+                                            category_codes(info_df[f'religion{slot+1}'].str.strip(), religions),
+                                            np.where(origin >= 0, coding['country_region'][origin], -1),
+                                            category_codes(info_df[f'gender{slot+1}'], coding['genders']),
+                                            location,
+                                            np.full(num_rows, slot),
+                                            np.full(num_rows, model_idx),
+                                            np.full(num_rows, rounds.index(round))])
+                    known = (cell >= 0).all(axis=1)
+                    coords.append(cell[known])
+                    criminal.append((criminal_slots == slot)[known])
+
+        return cls.from_cells(labels, np.vstack(coords) if coords else np.empty((0, len(labels)), dtype=np.int64),
+                              np.concatenate(criminal) if criminal else np.empty(0))
+
+    def select(self, **filters):
+        """Sub-cube of the cells whose label is (one of) the given value(s) on each filtered dimension, e.g. model='chatgpt'"""
+        keep = np.ones(len(self.appearances), dtype=bool)
+        for dimension, values in filters.items():
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            codes = [self.labels[dimension].index(value) for value in values]
+            keep &= np.isin(self.coords[:, self.dimensions.index(dimension)], codes)
+        return BiasCube(self.labels, self.coords[keep], self.appearances[keep], self.criminals[keep])
+
+    def rollup(self, *dimensions):
+        """
+        Appearances, criminals and criminal percentage summed over every dimension not listed.
+
+        Returns:
+        pd.DataFrame: indexed by the listed dimensions, with the non-empty combinations only
+        """
+        if not dimensions:
+            totals = pd.DataFrame({'appearances': [self.appearances.sum()], 'criminals': [self.criminals.sum()]}, index=['all'])
+        else:
+            axes = [self.dimensions.index(dimension) for dimension in dimensions]
+            shape = tuple(self.shape[axis] for axis in axes)
+            cells, inverse = np.unique(np.ravel_multi_index(self.coords[:, axes].T, shape), return_inverse=True)
+            index = pd.MultiIndex.from_arrays([np.asarray(self.labels[dimension], dtype=object)[codes]
+                                               for dimension, codes in zip(dimensions, np.unravel_index(cells, shape))],
+                                              names=list(dimensions))
+            totals = pd.DataFrame({'appearances': np.bincount(inverse, weights=self.appearances, minlength=len(cells)).astype(np.int64),
+                                   'criminals': np.bincount(inverse, weights=self.criminals, minlength=len(cells)).astype(np.int64)},
+                                  index=index)
+        totals['percentage'] = 100 * totals['criminals'] / totals['appearances']
+        return totals
+
+    def save(self, path=CUBE_PATH):
+        np.savez_compressed(path, coords=self.coords, appearances=self.appearances, criminals=self.criminals,
+                            labels=np.array(json.dumps(self.labels)))
+
+    @classmethod
+    def load(cls, path=CUBE_PATH):
+        with np.load(path) as arrays:
+            return cls(json.loads(str(arrays['labels'])), arrays['coords'], arrays['appearances'], arrays['criminals'])
@@ -1,131 +1,322 @@
+import warnings
+import numpy as np
 import pandas as pd
-from sklearn.metrics import cohen_kappa_score
+from collections import Counter
 from itertools import combinations
 
+# Columns assessed for inter round agreement: static columns, then those of the criminal character
+AGREEMENT_COLUMNS = ["criminal", "criminal_is_migrant", "religion", "region", "gender", "origin"]
+
+def criminal_columns(df_criminal_info):
+    """Agreement columns of each row, the religion, gender and origin being those of the criminal"""
+    rows = np.arange(len(df_criminal_info))
+    slots = pd.to_numeric(df_criminal_info["criminal"], errors='coerce').to_numpy()
+    known = np.isin(slots, [1, 2, 3, 4])
+    slots = np.where(known, slots, 1).astype(np.int64) - 1
+
+    def criminal_value(field):
+        values = df_criminal_info[[f"{field}{i}" for i in range(1, 5)]].to_numpy(dtype=object)[rows, slots]
+        return np.where(known, values, None)
+
+    return pd.DataFrame({"criminal": df_criminal_info["criminal"].to_numpy(dtype=object),
+                         "criminal_is_migrant": df_criminal_info["criminal_is_migrant"].to_numpy(dtype=object),
+                         "region": df_criminal_info["criminal_region"].to_numpy(dtype=object),
+                         "religion": criminal_value("religion"),
+                         "gender": criminal_value("gender"),
+                         "origin": criminal_value("origin")},
+                        index=df_criminal_info.index)
+
+def coded_labels(criminal_info_dict, columns=AGREEMENT_COLUMNS):
+    """
+    Integer codes of the agreement columns, aligned by row index (prompt) across rounds.
+
+    Returns:
+    dict: column -> (rows x rounds) codes, -1 where a round has no value for the row
+    """
+    frames = [criminal_columns(df) for df in criminal_info_dict.values()]
+    index = frames[0].index
+    for frame in frames[1:]:
+        index = index.union(frame.index)
+    frames = [frame.reindex(index) for frame in frames]
+
+    codes = {}
+    for column in columns:
+        values = np.column_stack([frame[column].to_numpy(dtype=object) for frame in frames])
+        # The same code is given to a label in every round (equal numbers such as 1 and 1.0 share it), -1 to missing values
+        column_codes, _ = pd.factorize(values.ravel())
+        codes[column] = column_codes.reshape(values.shape)
+    return codes
+
+def confusion_matrix(a, b):
+    """Confusion matrix of two code arrays over the rows where both have a value"""
+    both = (a >= 0) & (b >= 0)
+    a, b = a[both], b[both]
+    num_categories = max(a.max(initial=-1), b.max(initial=-1)) + 1
+    return np.bincount(a * num_categories + b, minlength=num_categories ** 2).reshape(num_categories, num_categories)
+
+def kappa_from_confusion(confusion):
+    """Observed agreement and Cohen's kappa of a confusion matrix, or of a stack of them (... x categories x categories)"""
+    num_rows = confusion.sum(axis=(-2, -1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        observed = np.trace(confusion, axis1=-2, axis2=-1) / num_rows
+        expected = (confusion.sum(axis=-1) * confusion.sum(axis=-2)).sum(axis=-1) / num_rows ** 2
+        return observed, (observed - expected) / (1 - expected)
+
+def cohen_kappa(a, b):
+    """Cohen's kappa of two code arrays over the rows where both have a value, from their confusion matrix"""
+    confusion = confusion_matrix(a, b)
+    num_rows = int(confusion.sum())
+    if num_rows == 0:
+        return np.nan, 0
+    return kappa_from_confusion(confusion)[1], num_rows
+
+def category_counts(codes):
+    """(rows x categories) number of rounds giving each label to each row"""
+    num_categories = codes.max(initial=-1) + 1
+    rows = np.broadcast_to(np.arange(len(codes))[:, None], codes.shape)
+    valid = codes >= 0
+    return np.bincount(rows[valid] * num_categories + codes[valid], minlength=len(codes) * num_categories).reshape(len(codes), num_categories)
+
+def fleiss_kappa(codes):
+    """Fleiss' kappa of all rounds, over the rows that have a value in every round"""
+    counts = category_counts(codes[(codes >= 0).all(axis=1)])
+    num_rows, num_raters = len(counts), codes.shape[1]
+    if num_rows == 0 or num_raters < 2:
+        return np.nan, num_rows
+    row_agreement = ((counts ** 2).sum(axis=1) - num_raters) / (num_raters * (num_raters - 1))
+    shares = counts.sum(axis=0) / (num_rows * num_raters)
+    expected = (shares ** 2).sum()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (row_agreement.mean() - expected) / (1 - expected), num_rows
+
+def krippendorff_alpha(codes):
+    """Krippendorff's alpha (nominal) of all rounds; rows with missing values count if at least 2 rounds have a value"""
+    counts = category_counts(codes)
+    values_per_row = counts.sum(axis=1)
+    counts, values_per_row = counts[values_per_row >= 2], values_per_row[values_per_row >= 2]
+    if len(counts) == 0:
+        return np.nan, 0
+    # Coincidence matrix: pairs of values given to the same row by different rounds
+    weighted = counts / (values_per_row - 1)[:, None]
+    coincidences = weighted.T @ counts - np.diag(weighted.sum(axis=0))
+    marginals = coincidences.sum(axis=1)
+    total = marginals.sum()
+    observed_disagreement = (total - np.trace(coincidences)) / total
+    expected_disagreement = (total ** 2 - (marginals ** 2).sum()) / (total * (total - 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 1 - observed_disagreement / expected_disagreement, len(counts)
+
+def calculate_round_agreement(criminal_info_dict, columns=AGREEMENT_COLUMNS):
+    """
+    Agreement of the generation rounds on the criminal and its attributes.
+
+    Rows are matched across rounds by their index (the prompt), so rounds with
+    different missing rows are compared on the prompts they share.
+
+    Parameters:
+    criminal_info_dict: Dictionary of DataFrames containing criminal charater info from different rounds
+
+    Returns:
+    dict: 'pairwise_kappa' (Cohen's kappa per column and pair of rounds) and
+          'multi_rater' (Fleiss' kappa and Krippendorff's alpha of all rounds per column)
+    """
+    codes = coded_labels(criminal_info_dict, columns)
+    num_rounds = len(criminal_info_dict)
+
+    pairwise, multi_rater = [], []
+    for column in columns:
+        for i, j in combinations(range(num_rounds), 2):
+            kappa, num_rows = cohen_kappa(codes[column][:, i], codes[column][:, j])
+            pairwise.append({'Column': column, 'Rater Pair': f"Rater_{i+1}_vs_Rater_{j+1}", 'Kappa Score': kappa, 'Rows': num_rows})
+        fleiss, fleiss_rows = fleiss_kappa(codes[column])
+        alpha, alpha_rows = krippendorff_alpha(codes[column])
+        multi_rater.append({'Column': column, 'Fleiss Kappa': fleiss, 'Fleiss Rows': fleiss_rows,
+                            'Krippendorff Alpha': alpha, 'Krippendorff Rows': alpha_rows})
+
+    return {'pairwise_kappa': pd.DataFrame(pairwise, columns=['Column', 'Rater Pair', 'Kappa Score', 'Rows']),
+            'multi_rater': pd.DataFrame(multi_rater)}
+
+class RoundAgreementAccumulator:
+    """
+    Round agreement of calculate_round_agreement, updated with the new rows only.
+
+    Each prompt keeps its label per round for every agreement column. A new or
+    re-extracted row takes the previous contribution of its prompt out of the
+    counts and adds the new one: the confusion counts of every pair of rounds,
+    the category counts of the prompts extracted in every round (Fleiss' kappa)
+    and the coincidences of the prompts extracted in at least 2 rounds
+    (Krippendorff's alpha). result() then only works on these counts, so its
+    cost does not grow with the number of rows.
+    """
+
+    def __init__(self, rounds, columns=AGREEMENT_COLUMNS):
+        self.rounds = list(rounds)
+        self.columns = list(columns)
+        self.labels = {column: {} for column in self.columns}
+        self.confusion = {column: {pair: Counter() for pair in combinations(range(len(self.rounds)), 2)} for column in self.columns}
+        self.fleiss_rows = Counter()
+        self.fleiss_agreement = Counter()
+        self.fleiss_counts = {column: Counter() for column in self.columns}
+        self.alpha_rows = Counter()
+        self.coincidences = {column: Counter() for column in self.columns}
+        self.round_rows = Counter()
+        self.prompt_rounds = {}
+
+    def update(self, round, criminal_info_df):
+        """Add (or replace) the rows of one round, indexed by prompt"""
+        position = self.rounds.index(round)
+        frame = criminal_columns(criminal_info_df)
+        for prompt in frame.index:
+            rounds = self.prompt_rounds.setdefault(prompt, set())
+            if position not in rounds:
+                rounds.add(position)
+                self.round_rows[round] += 1
+        for column in self.columns:
+            labels = self.labels[column]
+            for prompt, value in zip(frame.index, frame[column].to_numpy(dtype=object)):
+                row = labels.get(prompt)
+                if row is None:
+                    row = labels[prompt] = [None] * len(self.rounds)
+                else:
+                    self.add_row(column, row, -1)
+                row[position] = None if pd.isna(value) else value
+                self.add_row(column, row, 1)
+
+    def add_row(self, column, row, sign):
+        """Add (sign 1) or take out (sign -1) the contribution of the labels of one prompt"""
+        present = [(position, label) for position, label in enumerate(row) if label is not None]
+        for (i, a), (j, b) in combinations(present, 2):
+            self.confusion[column][(i, j)][(a, b)] += sign
+        counts = Counter(label for _, label in present)
+        num_values = len(present)
+        if num_values == len(self.rounds) and num_values >= 2:
+            self.fleiss_rows[column] += sign
+            self.fleiss_agreement[column] += sign * (sum(count ** 2 for count in counts.values()) - num_values) / (num_values * (num_values - 1))
+            self.fleiss_counts[column].update({label: sign * count for label, count in counts.items()})
+        if num_values >= 2:
+            self.alpha_rows[column] += sign
+            for a, count_a in counts.items():
+                for b, count_b in counts.items():
+                    self.coincidences[column][(a, b)] += sign * (count_a * count_b - (count_a if a == b else 0)) / (num_values - 1)
+
+    def prompts_in_all_rounds(self):
+        return sum(len(rounds) == len(self.rounds) for rounds in self.prompt_rounds.values())
+
+    def result(self):
+        """Same tables as calculate_round_agreement on the accumulated rows"""
+        pairwise, multi_rater = [], []
+        for column in self.columns:
+            for (i, j), confusion in self.confusion[column].items():
+                matrix = counter_matrix(confusion)
+                num_rows = int(matrix.sum())
+                kappa = kappa_from_confusion(matrix)[1] if num_rows else np.nan
+                pairwise.append({'Column': column, 'Rater Pair': f"Rater_{i+1}_vs_Rater_{j+1}", 'Kappa Score': kappa, 'Rows': num_rows})
+
+            fleiss_rows = self.fleiss_rows[column]
+            fleiss = np.nan
+            if fleiss_rows:
+                shares = np.array([count for count in self.fleiss_counts[column].values()], dtype=np.float64) / (fleiss_rows * len(self.rounds))
+                expected = (shares ** 2).sum()
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    fleiss = (self.fleiss_agreement[column] / fleiss_rows - expected) / np.float64(1 - expected)
+
+            alpha_rows = self.alpha_rows[column]
+            alpha = np.nan
+            if alpha_rows:
+                coincidences = counter_matrix(self.coincidences[column])
+                marginals = coincidences.sum(axis=1)
+                total = marginals.sum()
+                observed_disagreement = (total - np.trace(coincidences)) / total
+                expected_disagreement = (total ** 2 - (marginals ** 2).sum()) / (total * (total - 1))
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    alpha = 1 - observed_disagreement / np.float64(expected_disagreement)
+            multi_rater.append({'Column': column, 'Fleiss Kappa': fleiss, 'Fleiss Rows': fleiss_rows,
+                                'Krippendorff Alpha': alpha, 'Krippendorff Rows': alpha_rows})
+
+        return {'pairwise_kappa': pd.DataFrame(pairwise, columns=['Column', 'Rater Pair', 'Kappa Score', 'Rows']),
+                'multi_rater': pd.DataFrame(multi_rater)}
+
+def counter_matrix(counter):
+    """Square matrix of a Counter keyed by (label, label), over the labels it holds"""
+    labels = list(dict.fromkeys(label for pair in counter for label in pair))
+    positions = {label: position for position, label in enumerate(labels)}
+    matrix = np.zeros((len(labels), len(labels)))
+    for (a, b), count in counter.items():
+        matrix[positions[a], positions[b]] = count
+    return matrix
+
+def agreement_matrix(model_round_info, columns=AGREEMENT_COLUMNS, num_resamples=1000, confidence=0.95, seed=42):
+    """
+    Agreement of every pair of (model, round) on the criminal and its attributes for the same scenarios.
+
+    The labels of all models and rounds are coded once, aligned by prompt. Each
+    pair then needs one bincount for its confusion matrix; its bootstrap
+    resamples the prompts both extracted, whose confusion matrix follows a
+    multinomial over the cells of the observed one, so the resamples are drawn
+    from the cells and their cost does not depend on the number of prompts.
+
+    Parameters:
+    model_round_info: Dictionary of model -> dictionary of round -> extracted criminal information DataFrame
+    num_resamples: Number of bootstrap resamples per pair (0 skips the confidence intervals)
+    confidence: Level of the confidence intervals
+
+    Returns:
+    pd.DataFrame: one row per column and pair, with the number of prompts compared, the share of identical
+                  labels and Cohen's kappa, each with its bootstrap confidence interval
+    """
+    raters = [(model, round) for model, round_info in model_round_info.items() for round in round_info]
+    codes = coded_labels({rater: model_round_info[rater[0]][rater[1]] for rater in raters}, columns)
+    pairs = list(combinations(range(len(raters)), 2))
+    seeds = iter(np.random.SeedSequence(seed).spawn(len(columns) * len(pairs)))
+    alpha = 100 * (1 - confidence) / 2
+
+    results = []
+    for column in columns:
+        for i, j in pairs:
+            confusion = confusion_matrix(codes[column][:, i], codes[column][:, j])
+            num_rows = int(confusion.sum())
+            agreement, kappa = kappa_from_confusion(confusion) if num_rows else (np.nan, np.nan)
+            agreement_ci, kappa_ci = (np.nan, np.nan), (np.nan, np.nan)
+            rng = np.random.default_rng(next(seeds))
+            if num_rows and num_resamples:
+                resampled = rng.multinomial(num_rows, confusion.ravel() / num_rows, size=num_resamples).reshape(-1, *confusion.shape)
+                resampled_agreement, resampled_kappa = kappa_from_confusion(resampled)
+                with warnings.catch_warnings(): # pairs with a single label have no kappa
+                    warnings.simplefilter('ignore', RuntimeWarning)
+                    agreement_ci = np.nanpercentile(resampled_agreement, [alpha, 100 - alpha])
+                    kappa_ci = np.nanpercentile(resampled_kappa, [alpha, 100 - alpha])
+            results.append({'column': column,
+                            'model_a': raters[i][0], 'round_a': raters[i][1],
+                            'model_b': raters[j][0], 'round_b': raters[j][1],
+                            'rows': num_rows,
+                            'agreement': agreement, 'agreement_ci_low': agreement_ci[0], 'agreement_ci_high': agreement_ci[1],
+                            'kappa': kappa, 'kappa_ci_low': kappa_ci[0], 'kappa_ci_high': kappa_ci[1]})
+    return pd.DataFrame(results)
+
 def calculate_multi_rater_kappa(dict):
     """
     Calculate Cohen's kappa for all pairs of generation rounds across multiple columns.
-    
+
     Parameters:
     dict: Dictionary of DataFrames containing criminal charater info from different rounds
-    
+
     Returns:
-    dict: Dictionary containing kappa scores for each column and rater pair
+    pd.DataFrame: Kappa score for each column and rater pair
     """
-    # Function to get dynamic column values based on criminal number
-    def get_dynamic_columns(df_criminal_info):
-        religion = [df_criminal_info.loc[ind, f"religion{i}"] for ind, i in df_criminal_info["criminal"].items()]
-        origin = [df_criminal_info.loc[ind, f"origin{i}"] for ind, i in df_criminal_info["criminal"].items()]
-        gender= [df_criminal_info.loc[ind, f"gender{i}"] for ind, i in df_criminal_info["criminal"].items()]
-
-        return pd.DataFrame({"criminal": df_criminal_info["criminal"],
-                             "criminal_is_migrant": df_criminal_info["criminal_is_migrant"],
-                             "region": df_criminal_info["criminal_region"],
-                             "religion": religion,
-                             "gender": gender,
-                             "origin": origin
-                             })
-
-    # Store DataFrames in a list for easier iteration
-    df_list = [dict.get(key) for key in dict.keys()]
-    
-    # Static columns that don't depend on criminal number
-    static_columns = ["criminal", "criminal_is_migrant"]
-    # Dynamic columns that depend on criminal number
-    dynamic_columns = ["religion", "region", "gender", "origin"]
-    # All columns to be assessed for inter round agreement
-    all_columns = static_columns + dynamic_columns
-
-    dfs = [get_dynamic_columns(df) for df in df_list]
-
-    round_pairs = list(combinations(range(len(dfs)), 2))
-    results = {}
-    # Calculate kappa for each column and rater pair
-    for col in all_columns:
-        results[col] = {}
-        for i, j in round_pairs:
-            try:
-                kappa = cohen_kappa_score(dfs[i][col], dfs[j][col])
-                results[col][f"Rater_{i+1}_vs_Rater_{j+1}"] = kappa
-            except Exception as e:
-                results[col][f"Rater_{i+1}_vs_Rater_{j+1}"] = f"Error: {str(e)}"
- 
-    # Format the kappa results into a readable DataFrame
-
-    formatted_results = []
-    for column, scores in results.items():
-        for rater_pair, kappa in scores.items():
-            formatted_results.append({
-                'Column': column,
-                'Rater Pair': rater_pair,
-                'Kappa Score': kappa if isinstance(kappa, float) else kappa
-            })
-    
-    return pd.DataFrame(formatted_results)
+    return calculate_round_agreement(dict)['pairwise_kappa'][['Column', 'Rater Pair', 'Kappa Score']]
 
 # Example usage:
 if __name__ == "__main__":
-    df1 = pd.DataFrame({
-        'criminal': [1, 2, 3, 4],
-        'criminal_is_migrant': [True, False, True, False],
-        'religion1': ['A', 'B', 'C', 'D'],
-        'region1': ['X', 'Y', 'Z', 'W'],
-        'gender1': ['M', 'F', 'M', 'F'],
-        'origin1': ['P', 'Q', 'R', 'S'],
-        'religion1': ['A', 'B', 'C', 'D'],
-        'region1': ['X', 'Y', 'Z', 'W'],
-        'gender1': ['M', 'F', 'M', 'F'],
-        'origin1': ['P', 'Q', 'R', 'S'],
-        'religion1': ['A', 'B', 'C', 'D'],
-        'region1': ['X', 'Y', 'Z', 'W'],
-        'gender1': ['M', 'F', 'M', 'F'],
-        'origin1': ['P', 'Q', 'R', 'S'],
-        'religion1': ['A', 'B', 'C', 'D'],
-        'region1': ['X', 'Y', 'Z', 'W'],
-        'gender1': ['M', 'F', 'M', 'F'],
-        'origin1': ['P', 'Q', 'R', 'S']
-    })
-    df2 = pd.DataFrame({
-        'criminal': [1, 4, 3, 4],
-        'criminal_is_migrant': [True, False, False, False],
-        'religion1': ['A', 'B', 'C', 'D'],
-        'region1': ['X', 'Y', 'Z', 'W'],
-        'gender1': ['M', 'F', 'M', 'F'],
-        'origin1': ['P', 'Q', 'R', 'S'],
-        'religion1': ['A', 'B', 'C', 'D'],
-        'region1': ['X', 'Y', 'Z', 'W'],
-        'gender1': ['M', 'F', 'M', 'F'],
-        'origin1': ['P', 'Q', 'R', 'S'],
-        'religion1': ['A', 'B', 'C', 'D'],
-        'region1': ['X', 'Y', 'Z', 'W'],
-        'gender1': ['M', 'F', 'M', 'F'],
-        'origin1': ['P', 'Q', 'R', 'S'],
-        'religion1': ['A', 'B', 'C', 'D'],
-        'region1': ['X', 'Y', 'Z', 'W'],
-        'gender1': ['M', 'F', 'M', 'F'],
-        'origin1': ['P', 'Q', 'R', 'S']
-    })
-    df3 = pd.DataFrame({
-        'criminal': [1, 3, 3, 2],
-        'criminal_is_migrant': [True, False, True, False],
-        'religion1': ['A', 'B', 'C', 'D'],
-        'region1': ['X', 'Y', 'Z', 'W'],
-        'gender1': ['M', 'F', 'M', 'F'],
-        'origin1': ['P', 'Q', 'R', 'S'],
-        'religion1': ['A', 'B', 'C', 'D'],
-        'region1': ['X', 'Y', 'Z', 'W'],
-        'gender1': ['M', 'F', 'M', 'F'],
-        'origin1': ['P', 'Q', 'R', 'S'],
-        'religion1': ['A', 'B', 'C', 'D'],
-        'region1': ['X', 'Y', 'Z', 'W'],
-        'gender1': ['M', 'F', 'M', 'F'],
-        'origin1': ['P', 'Q', 'R', 'S'],
-        'religion1': ['A', 'B', 'C', 'D'],
-        'region1': ['X', 'Y', 'Z', 'W'],
-        'gender1': ['M', 'F', 'M', 'F'],
-        'origin1': ['P', 'Q', 'R', 'S']
-    })
-
-    # Calculate kappa scores
-    results = calculate_multi_rater_kappa({'round1':df1, 'round1':df2, 'round1':df3})
-    print(results)
+    def example_round(criminals, migrants):
+        return pd.DataFrame({'criminal': criminals,
+                             'criminal_is_migrant': migrants,
+                             'criminal_region': ['X', 'Y', 'Z', 'W'],
+                             **{f'{field}{i}': values for i in range(1, 5)
+                                for field, values in [('religion', ['A', 'B', 'C', 'D']), ('gender', ['M', 'F', 'M', 'F']),
+                                                      ('origin', ['P', 'Q', 'R', 'S'])]}})
+
+    results = calculate_round_agreement({'round1': example_round([1, 2, 3, 4], [True, False, True, False]),
+                                         'round2': example_round([1, 4, 3, 4], [True, False, False, False]),
+                                         'round3': example_round([1, 3, 3, 2], [True, False, True, False])})
+    print(results['pairwise_kappa'])
+    print(results['multi_rater'])
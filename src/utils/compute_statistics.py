@@ -1,68 +1,116 @@
+import numpy as np
 import pandas as pd
-from collections import Counter
 # from scipy.stats import pearsonr # colls correlation and p-value
 
-def compute_responses_statistics(criminal_info_dict, country_info_path = 'data/raw/selected_countries_info.csv'):
+GENDERS = ['Female', 'Male']
+STAT_NAMES = ['total', 'criminal', 'percentage']
+
+def load_statistics_coding(country_info_path='data/raw/selected_countries_info.csv'):
+    """Categories of the statistics tables and the region/religion code of each country"""
     country_info_df = pd.read_csv(country_info_path, sep=';')
-    list_countries = country_info_df['Country']
-    list_regions = country_info_df['Region'].unique()
-    list_religions = country_info_df['Religion'].unique()
-
-    rounds = criminal_info_dict.keys()
-
-    immigrant_stats_df = pd.DataFrame(columns=[f'{round}_{name}' for round in rounds for name in ['total','criminal','percentage']],index=['immigrant'])
-    gender_stats_df = pd.DataFrame(columns=[f'{round}_{name}' for round in rounds for name in ['total','criminal','percentage']],index=['Female','Male'])
-    country_stats_df = pd.DataFrame(columns=[f'{round}_{name}' for round in rounds for name in ['total','criminal','percentage']],index=list_countries)
-    region_stats_df = pd.DataFrame(columns=[f'{round}_{name}' for round in rounds for name in ['total','criminal','percentage']],index=list_regions)
-    religion_stats_df = pd.DataFrame(columns=[f'{round}_{name}' for round in rounds for name in ['total','criminal','percentage']],index=list_religions)
-
-    for round in rounds:
-        df = criminal_info_dict[round]
-        n_records = len(df) # number of scenarios
-
-        immigrant_count = 3 * n_records # 3 out of 4 characters are immigrants, 4 characters in each scenario
-        gender_count = Counter(list(df.loc[:,['gender1','gender2', 'gender3','gender4']].stack()))
-        country_count = Counter(list(df.loc[:,['origin1','origin2', 'origin3','origin4']].stack()))
-        region_count = {region:0 for region in list_regions}
-        for country in country_count.keys():
-            region = country_info_df.loc[(country_info_df['Country'] == country),'Region']
-            region_count[region.iloc[0]] = country_count[country] + region_count[region.iloc[0]]
-        religion_count = {religion:0 for religion in list_religions}
-        for country in country_count.keys():
-            religion = country_info_df.loc[(country_info_df['Country'] == country),'Religion']
-            religion_count[religion.iloc[0]] = country_count[country] + religion_count[religion.iloc[0]]
-
-        criminal_immigrant_count = sum(df.criminal_is_migrant)
-        criminal_gender_count = Counter([df.loc[i, f'gender{ch}'] for i,ch in zip(range(n_records),df['criminal'])])
-        criminal_country_count = Counter([df.loc[i, f'origin{ch}'] for i,ch in zip(range(n_records),df['criminal'])])
-        criminal_region_count = {region:0 for region in list_regions}
-        for country in criminal_country_count.keys():
-            region = country_info_df.loc[(country_info_df['Country'] == country),'Region']
-            criminal_region_count[region.iloc[0]] = criminal_country_count[country] + criminal_region_count[region.iloc[0]]
-        criminal_religion_count = {religion:0 for religion in list_religions}
-        for country in criminal_country_count.keys():
-            religion = country_info_df.loc[(country_info_df['Country'] == country),'Religion']
-            criminal_religion_count[religion.iloc[0]] = criminal_country_count[country] + criminal_religion_count[religion.iloc[0]]
-
-        immigrant_stats_df.loc['immigrant',f'{round}_total'] = immigrant_count
-        immigrant_stats_df.loc['immigrant',f'{round}_criminal'] = criminal_immigrant_count
-        immigrant_stats_df.loc['immigrant',f'{round}_percentage'] = 100 * criminal_immigrant_count/immigrant_count
-        gender_stats_df[f'{round}_total'] = gender_count
-        gender_stats_df[f'{round}_criminal'] = criminal_gender_count
-        gender_stats_df[f'{round}_percentage'] = 100 * gender_stats_df[f'{round}_criminal']/gender_stats_df[f'{round}_total']
-        country_stats_df[f'{round}_total'] = country_count
-        country_stats_df[f'{round}_criminal'] = criminal_country_count
-        country_stats_df[f'{round}_percentage'] = 100 * country_stats_df[f'{round}_criminal']/country_stats_df[f'{round}_total']
-        country_stats_df.fillna(0, inplace=True)
-        region_stats_df[f'{round}_total'] = region_count
-        region_stats_df[f'{round}_criminal'] = criminal_region_count
-        region_stats_df[f'{round}_percentage'] = 100 * region_stats_df[f'{round}_criminal']/region_stats_df[f'{round}_total']
-        religion_stats_df[f'{round}_total'] = religion_count
-        religion_stats_df[f'{round}_criminal'] = criminal_religion_count
-        religion_stats_df[f'{round}_percentage'] = 100 * religion_stats_df[f'{round}_criminal']/religion_stats_df[f'{round}_total']
+    countries = pd.Index(country_info_df['Country'])
+    regions = pd.Index(country_info_df['Region'].unique())
+    religions = pd.Index(country_info_df['Religion'].unique())
+    return {'countries': countries,
+            'regions': regions,
+            'religions': religions,
+            'genders': pd.Index(GENDERS),
+            'country_region': regions.get_indexer(country_info_df['Region']),
+            'country_religion': religions.get_indexer(country_info_df['Religion'])}
+
+def category_codes(column, categories):
+    """Integer codes of the values of a column in categories, -1 for values outside them"""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes, uniques = column.cat.codes.to_numpy(), column.cat.categories
+    else:
+        codes, uniques = pd.factorize(column)
+    # Missing values have code -1, which picks the -1 appended at the end
+    mapping = np.append(categories.get_indexer(uniques), -1)
+    return mapping[codes]
+
+def bincount_codes(codes, size):
+    codes = codes.ravel()
+    return np.bincount(codes[codes >= 0], minlength=size)
+
+def count_responses(criminal_info_df, coding):
+    """
+    Counts behind the statistics tables of one round, computed on integer codes.
+
+    The rows are used by position, so the result does not depend on the index.
+
+    Returns:
+    dict: number of rows, criminal immigrants, and the total and criminal counts per gender and per country
+    """
+    num_rows = len(criminal_info_df)
+    rows = np.arange(num_rows)
+    slots = pd.to_numeric(criminal_info_df['criminal']).to_numpy(dtype=np.int64) - 1
+    country_codes = np.column_stack([category_codes(criminal_info_df[f'origin{i}'], coding['countries']) for i in range(1, 5)])
+    gender_codes = np.column_stack([category_codes(criminal_info_df[f'gender{i}'], coding['genders']) for i in range(1, 5)])
+
+    return {'rows': num_rows,
+            'immigrant_criminal': int(criminal_info_df['criminal_is_migrant'].sum()),
+            'gender_total': bincount_codes(gender_codes, len(coding['genders'])),
+            'gender_criminal': bincount_codes(gender_codes[rows, slots], len(coding['genders'])),
+            'country_total': bincount_codes(country_codes, len(coding['countries'])),
+            'country_criminal': bincount_codes(country_codes[rows, slots], len(coding['countries']))}
+
+def statistics_tables(round_counts, coding):
+    """
+    Format the counts of each round (from count_responses) into the statistics tables.
+
+    The tables are the same as those of the original implementation (compute_responses_statistics_legacy
+    in scripts/benchmark_analysis.py): genders
+    that never appear have no counts, countries without characters have zero counts
+    and percentages, and regions and religions without characters have no percentage.
+    """
+    columns = [f'{round}_{name}' for round in round_counts for name in STAT_NAMES]
+    immigrant_stats_df = pd.DataFrame(columns=columns, index=['immigrant'])
+    gender_stats_df = pd.DataFrame(index=coding['genders'])
+    country_stats_df = pd.DataFrame(index=coding['countries'])
+    region_stats_df = pd.DataFrame(index=coding['regions'])
+    religion_stats_df = pd.DataFrame(index=coding['religions'])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for round, counts in round_counts.items():
+            immigrant_count = 3 * counts['rows'] # 3 out of 4 characters are immigrants, 4 characters in each scenario
+            immigrant_stats_df.loc['immigrant', f'{round}_total'] = immigrant_count
+            immigrant_stats_df.loc['immigrant', f'{round}_criminal'] = counts['immigrant_criminal']
+            immigrant_stats_df.loc['immigrant', f'{round}_percentage'] = 100 * counts['immigrant_criminal'] / immigrant_count if immigrant_count else np.nan
+
+            gender_total = np.where(counts['gender_total'] > 0, counts['gender_total'], np.nan)
+            gender_criminal = np.where(counts['gender_criminal'] > 0, counts['gender_criminal'], np.nan)
+            country_total, country_criminal = counts['country_total'], counts['country_criminal']
+            tables = [(gender_stats_df, gender_total, gender_criminal),
+                      (country_stats_df, country_total, country_criminal)]
+            for table_df, code_name in [(region_stats_df, 'country_region'), (religion_stats_df, 'country_religion')]:
+                tables.append((table_df,
+                               np.bincount(coding[code_name], weights=country_total, minlength=len(table_df)).astype(np.int64),
+                               np.bincount(coding[code_name], weights=country_criminal, minlength=len(table_df)).astype(np.int64)))
+
+            for table_df, total, criminal in tables:
+                table_df[f'{round}_total'] = total
+                table_df[f'{round}_criminal'] = criminal
+                table_df[f'{round}_percentage'] = 100 * criminal / total
+            country_stats_df[f'{round}_percentage'] = country_stats_df[f'{round}_percentage'].fillna(0)
 
     return {'immigrant_stats': immigrant_stats_df,
             'gender_stats': gender_stats_df,
             'country_stats': country_stats_df,
             'region_stats': region_stats_df,
-            'religion_stats': religion_stats_df}
\ No newline at end of file
+            'religion_stats': religion_stats_df}
+
+def compute_responses_statistics(criminal_info_dict, country_info_path = 'data/raw/selected_countries_info.csv'):
+    """
+    Total and criminal counts and criminal percentages of the characters per round,
+    by immigrant status, gender, country, region and religion.
+
+    Parameters:
+    criminal_info_dict: Dictionary of DataFrames of extracted criminal information per round
+    country_info_path: Countries, with their region and religion, of the tables
+
+    Returns:
+    dict: Statistics DataFrame per table, with total, criminal and percentage columns per round
+    """
+    coding = load_statistics_coding(country_info_path)
+    round_counts = {round: count_responses(df, coding) for round, df in criminal_info_dict.items()}
+    return statistics_tables(round_counts, coding)
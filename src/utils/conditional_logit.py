@@ -0,0 +1,242 @@
+import math
+import warnings
+import numpy as np
+import pandas as pd
+
+from src.utils.compute_statistics import load_statistics_coding, category_codes
+
+DEFAULT_ATTRIBUTES = ['gender', 'immigrant', 'religion', 'region', 'slot']
+TABLE_COLUMNS = ['coefficient', 'std_error', 'z', 'p_value', 'odds_ratio']
+
+def one_hot(codes, labels, name):
+    """(scenarios x 4 x categories-1) dummies of coded categories, the first category being the reference"""
+    dummies = (codes[:, :, None] == np.arange(1, len(labels))[None, None, :]).astype(np.float32)
+    return dummies, [f'{name}_{str(label).strip()}' for label in labels[1:]]
+
+def choice_data(criminal_info_df, attributes=DEFAULT_ATTRIBUTES, coding=None):
+    """
+    Attributes of the 4 candidates of each scenario and the chosen criminal.
+
+    Parameters:
+    criminal_info_df: Extracted criminal information (one row per scenario)
+    attributes: Attributes of the candidates among gender (male vs female), immigrant
+                (origin differs from the location), religion, region, country and slot (position in the list)
+
+    Returns:
+    tuple: X (scenarios x 4 x features, float32), chosen slot per scenario (0-3), feature names,
+           and the positions of the rows kept (scenarios with a known criminal and candidates)
+    """
+    coding = coding if coding else load_statistics_coding()
+    criminal_info_df = criminal_info_df.reset_index(drop=True)
+    countries = np.column_stack([category_codes(criminal_info_df[f'origin{i}'], coding['countries']) for i in range(1, 5)])
+    genders = np.column_stack([category_codes(criminal_info_df[f'gender{i}'], coding['genders']) for i in range(1, 5)])
+    location = category_codes(criminal_info_df['location'], coding['countries'])
+    chosen = pd.to_numeric(criminal_info_df['criminal'], errors='coerce').to_numpy()
+    kept = np.flatnonzero((countries >= 0).all(axis=1) & (genders >= 0).all(axis=1) & np.isin(chosen, [1, 2, 3, 4]))
+    countries, genders, location, chosen = countries[kept], genders[kept], location[kept], chosen[kept].astype(np.int64) - 1
+
+    blocks, names = [], []
+    for attribute in attributes:
+        if attribute == 'gender':
+            blocks.append((genders == coding['genders'].get_loc('Male')).astype(np.float32)[:, :, None])
+            names.append('gender_Male')
+        elif attribute == 'immigrant':
+            blocks.append((countries != location[:, None]).astype(np.float32)[:, :, None])
+            names.append('immigrant')
+        elif attribute == 'slot':
+            block, block_names = one_hot(np.tile(np.arange(4), (len(kept), 1)), [1, 2, 3, 4], 'slot')
+            blocks.append(block)
+            names.extend(block_names)
+        elif attribute in ['religion', 'region', 'country']:
+            labels = {'religion': coding['religions'], 'region': coding['regions'], 'country': coding['countries']}[attribute]
+            codes = countries if attribute == 'country' else coding[f'country_{attribute}'][countries]
+            block, block_names = one_hot(codes, labels, attribute)
+            blocks.append(block)
+            names.extend(block_names)
+        else:
+            raise ValueError(f'Unknown attribute: {attribute}')
+
+    # Dummies are exact in float32, which halves the memory of large designs
+    X = np.concatenate(blocks, axis=2) if blocks else np.empty((len(kept), 4, 0), dtype=np.float32)
+    return X, chosen, names, kept
+
+def newton_terms(X, chosen, beta, chunk_size=50_000, cluster_codes=None, num_clusters=0):
+    """
+    Gradient, information matrix (minus the Hessian) and log-likelihood of the conditional logit at beta.
+
+    Scenarios are processed in chunks so that the float64 intermediate arrays stay small;
+    with cluster_codes, the scores are also summed per cluster.
+    """
+    num_features = X.shape[2]
+    gradient = np.zeros(num_features)
+    information = np.zeros((num_features, num_features))
+    log_likelihood = 0.0
+    cluster_scores = np.zeros((num_clusters, num_features))
+
+    for start in range(0, len(X), chunk_size):
+        X_chunk = X[start:start + chunk_size].astype(np.float64)
+        rows = np.arange(len(X_chunk))
+        chosen_chunk = chosen[start:start + chunk_size]
+
+        utilities = X_chunk @ beta
+        utilities -= utilities.max(axis=1, keepdims=True)
+        log_probabilities = utilities - np.log(np.exp(utilities).sum(axis=1, keepdims=True))
+        probabilities = np.exp(log_probabilities)
+
+        # Attributes centred on their probability-weighted mean in each scenario
+        centred = X_chunk - np.einsum('nj,njp->np', probabilities, X_chunk)[:, None, :]
+        scores = centred[rows, chosen_chunk]
+        weighted = (np.sqrt(probabilities)[:, :, None] * centred).reshape(-1, num_features)
+
+        gradient += scores.sum(axis=0)
+        information += weighted.T @ weighted
+        log_likelihood += log_probabilities[rows, chosen_chunk].sum()
+        if cluster_codes is not None:
+            np.add.at(cluster_scores, cluster_codes[start:start + chunk_size], scores)
+
+    return gradient, information, log_likelihood, cluster_scores
+
+def estimable_columns(X, chunk_size=50_000, tolerance=1e-9):
+    """
+    Features whose effect on the choice can be estimated, and the features aliased with earlier ones.
+
+    Only the differences between the candidates of a scenario enter the likelihood, so the
+    features are tested on their scenario-centred values: a feature equal for the 4 candidates
+    of every scenario has no effect, and one that is a linear combination of earlier features
+    (e.g. religion_Muslim + religion_Hindu against the regions of the countries of those
+    religions) is aliased. Each feature is kept when the part of its centred values not
+    explained by the features kept before it is above tolerance (relative to its own sum of squares).
+
+    Returns:
+    tuple: indices of the features kept and of the aliased features (features equal for
+           the candidates of every scenario are in neither)
+    """
+    num_features = X.shape[2]
+    gram = np.zeros((num_features, num_features))
+    for start in range(0, len(X), chunk_size):
+        centred = X[start:start + chunk_size].astype(np.float64)
+        centred -= centred.mean(axis=1, keepdims=True)
+        centred = centred.reshape(-1, num_features)
+        gram += centred.T @ centred
+
+    kept, aliased = [], []
+    for feature in range(num_features):
+        if gram[feature, feature] == 0:
+            continue
+        residual = gram[feature, feature]
+        if kept:
+            residual -= gram[feature, kept] @ np.linalg.solve(gram[np.ix_(kept, kept)], gram[kept, feature])
+        (kept if residual > tolerance * gram[feature, feature] else aliased).append(feature)
+    return np.array(kept, dtype=np.int64), np.array(aliased, dtype=np.int64)
+
+def fit_conditional_logit(X, chosen, clusters=None, max_iterations=50, tolerance=1e-8, max_halvings=30):
+    """
+    Maximum likelihood estimate of a conditional (McFadden) logit over 4 alternatives per scenario, by Newton's method.
+
+    P(candidate j is chosen) = exp(x_j b) / sum_k exp(x_k b). The gradient and the
+    Hessian are computed for whole chunks of scenarios at once; the Hessian is a
+    single matrix product of the probability-weighted, scenario-centred attributes.
+    A step that lowers the log-likelihood is halved (up to max_halvings times), and
+    a RuntimeWarning is issued when the steps are still above tolerance after
+    max_iterations, e.g. when an attribute perfectly predicts the choice.
+
+    Only the features returned as kept by estimable_columns are fitted: the aliased
+    ones would otherwise get an arbitrary share of the effect of the features they are
+    confounded with, with meaningless standard errors.
+
+    Parameters:
+    X: (scenarios x 4 x features) attributes of the candidates
+    chosen: Index (0-3) of the chosen candidate of each scenario
+    clusters: Optional cluster of each scenario (e.g. the prompt, shared by the rounds) for cluster-robust standard errors
+
+    Returns:
+    dict: coefficients, standard errors, log-likelihoods, number of iterations, convergence,
+          the features kept and the aliased features left out
+    """
+    num_scenarios, num_alternatives, _ = X.shape
+    identified, aliased = estimable_columns(X)
+    X = X[:, :, identified]
+
+    beta = np.zeros(len(identified))
+    terms = newton_terms(X, chosen, beta)
+    converged = False
+    for iteration in range(1, max_iterations + 1):
+        gradient, information, log_likelihood, _ = terms
+        step = np.linalg.lstsq(information, gradient, rcond=None)[0]
+        for _ in range(max_halvings):
+            terms = newton_terms(X, chosen, beta + step)
+            # Differences within rounding of the log-likelihood count as no decrease
+            if terms[2] >= log_likelihood - 1e-12 * max(1.0, abs(log_likelihood)):
+                break
+            step /= 2
+        else:
+            terms = newton_terms(X, chosen, beta + step)
+        beta += step
+        if np.max(np.abs(step), initial=0) < tolerance:
+            converged = True
+            break
+    if not converged:
+        warnings.warn(f'The conditional logit did not converge in {max_iterations} iterations '
+                      f'(last step {np.max(np.abs(step)):.2g}); an attribute may separate the choices perfectly', RuntimeWarning)
+
+    if clusters is None:
+        _, information, log_likelihood, _ = newton_terms(X, chosen, beta)
+        covariance = np.linalg.pinv(information)
+    else:
+        # Sandwich estimator with the scores summed per cluster
+        _, cluster_codes = np.unique(clusters, return_inverse=True)
+        _, information, log_likelihood, cluster_scores = newton_terms(X, chosen, beta, cluster_codes=cluster_codes,
+                                                                      num_clusters=cluster_codes.max(initial=-1) + 1)
+        bread = np.linalg.pinv(information)
+        covariance = bread @ (cluster_scores.T @ cluster_scores) @ bread
+
+    return {'features': identified,
+            'aliased': aliased,
+            'coefficients': beta,
+            'standard_errors': np.sqrt(np.diag(covariance)),
+            'log_likelihood': log_likelihood,
+            'null_log_likelihood': num_scenarios * math.log(1 / num_alternatives),
+            'iterations': iteration,
+            'converged': converged,
+            'num_scenarios': num_scenarios}
+
+def conditional_logit_table(criminal_info_dict, attributes=DEFAULT_ATTRIBUTES, cluster_by_index=True):
+    """
+    Effects of the candidates' attributes on the choice of the criminal, pooled over the rounds of a model.
+
+    Parameters:
+    criminal_info_dict: Dictionary of DataFrames of extracted criminal information per round
+    cluster_by_index: Cluster the standard errors by the DataFrame index (the prompt), as the rounds share their scenarios
+
+    Returns:
+    pd.DataFrame: coefficient, std_error, z, p_value and odds_ratio per attribute, with the fit statistics and the
+                  aliased attributes left out of the fit in .attrs (an empty table with NaN statistics when no
+                  scenario has a known criminal and candidates)
+    """
+    coding = load_statistics_coding()
+    data = [choice_data(info_df, attributes, coding) for info_df in criminal_info_dict.values()]
+    if sum(len(chosen) for _, chosen, _, _ in data) == 0:
+        table = pd.DataFrame(columns=TABLE_COLUMNS, index=pd.Index([], name='attribute'), dtype=float)
+        table.attrs = {'scenarios': 0, 'log_likelihood': np.nan, 'pseudo_r2': np.nan, 'iterations': 0, 'converged': False, 'aliased': []}
+        return table
+    X = np.concatenate([X for X, _, _, _ in data])
+    chosen = np.concatenate([chosen for _, chosen, _, _ in data])
+    names = data[0][2]
+    clusters = np.concatenate([info_df.index.to_numpy()[kept] for info_df, (_, _, _, kept) in zip(criminal_info_dict.values(), data)]) \
+        if cluster_by_index else None
+
+    fit = fit_conditional_logit(X, chosen, clusters)
+    z = fit['coefficients'] / fit['standard_errors']
+    table = pd.DataFrame({'coefficient': fit['coefficients'],
+                          'std_error': fit['standard_errors'],
+                          'z': z,
+                          'p_value': [math.erfc(abs(value) / math.sqrt(2)) for value in z],
+                          'odds_ratio': np.exp(fit['coefficients'])},
+                         index=pd.Index([names[feature] for feature in fit['features']], name='attribute'))
+    table.attrs = {'scenarios': fit['num_scenarios'],
+                   'log_likelihood': fit['log_likelihood'],
+                   'pseudo_r2': 1 - fit['log_likelihood'] / fit['null_log_likelihood'],
+                   'iterations': fit['iterations'],
+                   'converged': fit['converged'],
+                   'aliased': [names[feature] for feature in fit['aliased']]}
+    return table
@@ -0,0 +1,111 @@
+import json
+import os
+import re
+from itertools import permutations
+import numpy as np
+import pandas as pd
+
+from src.utils.scenario_store import INFO_COLUMNS
+
+# Orders of the 4 characters; the position in this list is the permutation id used in scenario IDs
+CHARACTER_PERMUTATIONS = list(permutations(range(4)))
+SCENARIO_ID_PATTERN = re.compile(r'^s(?P<base>\d+)-p(?P<permutation>\d+)-l(?P<location>\d)-t(?P<template>[0-9a-f]+)$')
+
+def make_scenario_id(base_idx, permutation_idx, location_member, template_hash):
+    """Stable ID of a counterfactual scenario: base scenario, character order, location member and template"""
+    return f's{base_idx}-p{permutation_idx:02d}-l{location_member}-t{template_hash}'
+
+def parse_scenario_id(scenario_id):
+    match = SCENARIO_ID_PATTERN.match(scenario_id)
+    if not match:
+        raise ValueError(f'Invalid counterfactual scenario ID: {scenario_id}')
+    return {'base': int(match['base']),
+            'permutation': int(match['permutation']),
+            'location_member': int(match['location']),
+            'template_hash': match['template']}
+
+def counterfactual_info(base_info, permutation_idx, location_member):
+    """
+    Scenario information of one counterfactual variant of a base scenario.
+
+    Member m is the character in slot m+1 of the base scenario. The permutation
+    puts member CHARACTER_PERMUTATIONS[p][k] in slot k+1, and the crime happens in
+    the country of member location_member.
+    """
+    order = CHARACTER_PERMUTATIONS[permutation_idx]
+    info = {}
+    for slot, member in enumerate(order):
+        info[f'origin{slot+1}'] = base_info[f'origin{member+1}']
+        info[f'religion{slot+1}'] = base_info[f'religion{member+1}']
+    info['location'] = base_info[f'origin{location_member+1}']
+    return {column: info[column] for column in INFO_COLUMNS}
+
+def iter_counterfactual_scenarios(base_info_df, templates, permute_characters=True, all_locations=True):
+    """
+    Lazily expand base scenarios into their counterfactual variants.
+
+    For every base scenario (in order) and every template, yields each permutation
+    of the characters combined with each member as the location. Without
+    permute_characters only the base order is used, and without all_locations only
+    the base location is used. Nothing is materialised beyond the current scenario.
+
+    Parameters:
+    base_info_df: Base scenario information (as in input_info.csv), indexed by prompt ID
+    templates: List of PromptTemplate objects (base prompt variants)
+
+    Yields:
+    dict: scenario_id, the scenario columns and the rendered prompt
+    """
+    permutation_ids = range(len(CHARACTER_PERMUTATIONS)) if permute_characters else [0]
+    for base_idx, base_info in base_info_df.iterrows():
+        base_location = [base_info[f'origin{m+1}'] for m in range(4)].index(base_info['location'])
+        location_members = range(4) if all_locations else [base_location]
+        for template in templates:
+            for permutation_idx in permutation_ids:
+                for location_member in location_members:
+                    info = counterfactual_info(base_info, permutation_idx, location_member)
+                    yield {'scenario_id': make_scenario_id(base_idx, permutation_idx, location_member, template.hash),
+                           **info,
+                           'prompt': template.render(info)}
+
+def count_counterfactual_scenarios(num_base, num_templates, permute_characters=True, all_locations=True):
+    return num_base * num_templates * (len(CHARACTER_PERMUTATIONS) if permute_characters else 1) * (4 if all_locations else 1)
+
+def counterfactual_info_frame(base_info_df, scenario_ids):
+    """Decode scenario IDs into scenario information, for joining responses with their inputs"""
+    ids_df = pd.Series(scenario_ids, dtype=object).str.extract(SCENARIO_ID_PATTERN)
+    ids_df[['base', 'permutation', 'location']] = ids_df[['base', 'permutation', 'location']].astype(int)
+
+    orders = np.array(CHARACTER_PERMUTATIONS)[ids_df['permutation'].to_numpy()]
+    base_rows = base_info_df.loc[ids_df['base']].reset_index(drop=True)
+    origins = base_rows[['origin1', 'origin2', 'origin3', 'origin4']].to_numpy()
+    religions = base_rows[['religion1', 'religion2', 'religion3', 'religion4']].to_numpy()
+    rows = np.arange(len(ids_df))
+
+    info_df = pd.DataFrame({'scenario_id': list(scenario_ids)})
+    for slot in range(4):
+        info_df[f'origin{slot+1}'] = origins[rows, orders[:, slot]]
+        info_df[f'religion{slot+1}'] = religions[rows, orders[:, slot]]
+    info_df['location'] = origins[rows, ids_df['location'].to_numpy()]
+    info_df['base'] = ids_df['base'].to_numpy()
+    info_df['permutation'] = ids_df['permutation'].to_numpy()
+    info_df['location_member'] = ids_df['location'].to_numpy()
+    info_df['template_hash'] = ids_df['template'].to_numpy()
+    return info_df
+
+def counterfactual_responses_path(model_name):
+    return f'data/processed/counterfactual/{model_name}_responses.jsonl'
+
+def load_counterfactual_responses(model_name, base_info_df):
+    """Generated counterfactual responses of a model joined with their scenario information"""
+    with open(counterfactual_responses_path(model_name), 'r', encoding='utf-8') as f:
+        responses_df = pd.DataFrame([json.loads(line) for line in f if line.strip()])
+    return responses_df.merge(counterfactual_info_frame(base_info_df, responses_df['scenario_id'].unique()), on='scenario_id')
+
+def completed_scenario_ids(model_name):
+    """(scenario_id, round) pairs already generated, so that an interrupted run can be resumed"""
+    path = counterfactual_responses_path(model_name)
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as f:
+        return {(record['scenario_id'], record['round']) for record in map(json.loads, filter(str.strip, f))}
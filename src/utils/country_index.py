@@ -0,0 +1,102 @@
+import json
+import re
+import difflib
+import unicodedata
+from collections import Counter, defaultdict
+import pandas as pd
+
+DEMONYMS_PATH = 'src/utils/country_demonyms.json'
+
+def normalize_country_text(text):
+    """Unicode-normalised form used for the lookups: no accents, case-folded, punctuation as spaces and no leading "the" """
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char)).casefold()
+    text = re.sub(r'[^\w]+', ' ', text.replace('&', ' and ')).strip()
+    return re.sub(r'^the ', '', text)
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+class CountryIndex:
+    """
+    Resolve country names, aliases and demonyms to the standard country names.
+
+    Exact names are looked up in a dictionary of normalised aliases (from
+    country_aliases.json, the country names of countries_info_full.csv and the
+    demonyms). Other names (misspellings, unusual forms) go through a trigram
+    index: the aliases sharing the most trigrams with the name are re-ranked by
+    their similarity ratio to it, and the best ratio is returned as the
+    confidence of the match.
+    """
+
+    def __init__(self, aliases_path='src/utils/country_aliases.json', countries_info_path='data/raw/countries_info_full.csv',
+                 demonyms_path=DEMONYMS_PATH):
+        with open(aliases_path, 'r') as f:
+            country_aliases = json.load(f)
+        with open(demonyms_path, 'r') as f:
+            country_demonyms = json.load(f)
+        countries_info = pd.read_csv(countries_info_path, sep=';')
+
+        self.exact = {}
+        for standard_name, aliases in country_aliases.items():
+            for alias in [standard_name] + aliases:
+                self.exact[normalize_country_text(alias)] = standard_name
+        # Countries outside the aliases file resolve to themselves, so that e.g. "Niger" is not taken for "Nigeria"
+        for country in countries_info['Country'].dropna().str.strip():
+            self.exact.setdefault(normalize_country_text(country), country)
+        for standard_name, demonyms in country_demonyms.items():
+            for demonym in demonyms:
+                self.exact.setdefault(normalize_country_text(demonym), standard_name)
+
+        self.names = list(self.exact)
+        self.postings = defaultdict(list)
+        for name_id, name in enumerate(self.names):
+            for trigram in trigrams(name):
+                self.postings[trigram].append(name_id)
+        self.max_words = max(len(name.split()) for name in self.names)
+        self.cache = {}
+
+    def lookup(self, name):
+        """Standard name of an exact (normalised) alias or demonym, or None"""
+        return self.exact.get(normalize_country_text(name))
+
+    def fuzzy_lookup(self, normalized_name, num_candidates=10):
+        """(standard name, similarity ratio) of the closest alias, or (None, 0.0)"""
+        shared = Counter(name_id for trigram in trigrams(normalized_name) for name_id in self.postings.get(trigram, ()))
+        scores = {self.names[name_id]: difflib.SequenceMatcher(None, normalized_name, self.names[name_id]).ratio()
+                  for name_id, _ in shared.most_common(num_candidates)}
+        if not scores:
+            return None, 0.0
+        best = max(scores, key=scores.get)
+        return self.exact[best], scores[best]
+
+    def resolve(self, text, min_confidence=0.85):
+        """
+        Resolve the country named at the start of a phrase (e.g. "Nigeria, who stole the car").
+
+        The whole phrase and then its leading words, longest first, are looked up
+        exactly; if none matches, the leading words are matched by the trigram index.
+
+        Returns:
+        tuple: (standard country name or None, confidence between 0 and 1)
+        """
+        if text in self.cache:
+            return self.cache[text]
+
+        normalized = normalize_country_text(text)
+        words = normalized.split()
+        country, confidence = self.exact.get(normalized), 1.0
+        num_words = min(len(words), self.max_words)
+        while not country and num_words > 0:
+            country = self.exact.get(' '.join(words[:num_words]))
+            num_words -= 1
+
+        if not country:
+            candidates = [self.fuzzy_lookup(' '.join(words[:num_words])) for num_words in range(1, min(len(words), self.max_words) + 1)]
+            country, confidence = max(candidates, key=lambda candidate: candidate[1], default=(None, 0.0))
+            if confidence < min_confidence:
+                country = None
+
+        self.cache[text] = (country, confidence)
+        return country, confidence
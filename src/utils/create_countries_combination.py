@@ -1,27 +1,124 @@
+import random
 import pandas as pd
-from itertools import combinations
 from tqdm import tqdm
 
+def iter_filtered_combinations(df, num_countries=4):
+    """
+    Yield the combinations of row positions whose countries all have different regions and religions.
+
+    The combinations are built by backtracking in the same (lexicographic) order as
+    itertools.combinations, but a branch is abandoned as soon as a region or religion
+    repeats, or when the remaining rows cannot provide enough distinct regions and
+    religions to complete it. Only one combination is held in memory at a time.
+    Rows with a missing region or religion are never selected.
+    """
+    regions = df['Region'].tolist()
+    religions = df['Religion'].tolist()
+    candidates = [pos for pos in range(len(df)) if not (pd.isna(regions[pos]) or pd.isna(religions[pos]))]
+
+    # Number of distinct regions/religions among the candidates from position k onwards
+    suffix_regions, suffix_religions = [0] * (len(candidates) + 1), [0] * (len(candidates) + 1)
+    seen_regions, seen_religions = set(), set()
+    for k in range(len(candidates) - 1, -1, -1):
+        seen_regions.add(regions[candidates[k]])
+        seen_religions.add(religions[candidates[k]])
+        suffix_regions[k], suffix_religions[k] = len(seen_regions), len(seen_religions)
+
+    comb, used_regions, used_religions = [], set(), set()
+
+    def extend(start):
+        needed = num_countries - len(comb)
+        if needed == 0:
+            yield list(comb)
+            return
+        for k in range(start, len(candidates) - needed + 1):
+            if suffix_regions[k] < needed or suffix_religions[k] < needed:
+                return
+            pos = candidates[k]
+            if regions[pos] in used_regions or religions[pos] in used_religions:
+                continue
+            comb.append(pos)
+            used_regions.add(regions[pos])
+            used_religions.add(religions[pos])
+            yield from extend(k + 1)
+            comb.pop()
+            used_regions.discard(regions[pos])
+            used_religions.discard(religions[pos])
+
+    yield from extend(0)
+
 def create_filtered_combination(df, num_countries=4):
-    n_rows = len(df)
-    
-    print(f'\nGenerating combinations of {num_countries} countries...')
-    combs = list(combinations(range(n_rows), num_countries))
-    print(f'{len(combs)} combinations created.')
-    
-    print('Filtering rows with the same Region or Religion ...')
-    filtered_combs = []
-    
-    for comb in tqdm(combs):
-        comb = list(comb)
-        regions = df.loc[comb, 'Region'].values
-        religions = df.loc[comb, 'Religion'].values
-        if len(set(regions)) == 4 and len(set(religions)) == 4:
-            filtered_combs.append(comb)
-    
-    filtered_combs_df = pd.DataFrame(filtered_combs, columns=['Row1', 'Row2', 'Row3', 'Row4'])
+    print(f'\nGenerating combinations of {num_countries} countries with different Region and Religion...')
+    filtered_combs = list(tqdm(iter_filtered_combinations(df, num_countries), unit='comb'))
+
+    filtered_combs_df = pd.DataFrame(filtered_combs, columns=[f'Row{i+1}' for i in range(num_countries)])
     filtered_combs_df = filtered_combs_df.reset_index(drop=True)
-    
+
     print(f'Combinations after filtering = {len(filtered_combs_df)}.')
-    
+
     return filtered_combs_df
+
+def sample_balanced_combinations(df, num_samples, num_countries=4, seed=42, max_attempts=100):
+    """
+    Draw distinct valid combinations so that every country, and every country as the location, is used about equally often.
+
+    Countries with a rare religion necessarily appear more often than the others, as
+    every combination needs four different religions; the sampler balances the counts
+    as far as the region and religion constraints allow.
+
+    Each combination is built greedily from the least used countries (ties broken at
+    random) that keep the regions and religions different, and its location is the
+    member least used as a location so far. When a draw repeats an earlier combination
+    or reaches a dead end, it is redrawn with more random noise on the usage counts. The cost of a draw
+    depends on the number of countries only, not on the number of valid combinations.
+
+    Parameters:
+    df: Countries information with Region and Religion columns
+    num_samples: Number of combinations to draw
+    num_countries: Number of countries in each combination
+    seed: Seed of the random generator, for reproducible samples
+    max_attempts: Number of redraws of a combination before giving up
+
+    Returns:
+    DataFrame: Row positions of the countries (Row1..RowN) and the position of the location (Location)
+    """
+    rng = random.Random(seed)
+    regions = df['Region'].tolist()
+    religions = df['Religion'].tolist()
+    candidates = [pos for pos in range(len(df)) if not (pd.isna(regions[pos]) or pd.isna(religions[pos]))]
+
+    counts = {pos: 0 for pos in candidates}
+    location_counts = {pos: 0 for pos in candidates}
+    drawn = set()
+    samples = []
+
+    for _ in tqdm(range(num_samples), unit='comb'):
+        spread = max(counts.values()) - min(counts.values()) + 1
+        for attempt in range(max_attempts):
+            # The noise grows with the attempts until it covers the spread of the usage counts
+            noise = 0.5 + attempt * spread / 10
+            comb, used_regions, used_religions = [], set(), set()
+            for pos in sorted(candidates, key=lambda pos: counts[pos] + noise * rng.random()):
+                if regions[pos] in used_regions or religions[pos] in used_religions:
+                    continue
+                comb.append(pos)
+                used_regions.add(regions[pos])
+                used_religions.add(religions[pos])
+                if len(comb) == num_countries:
+                    break
+            # A greedy draw can reach a dead end; it is redrawn like a duplicate
+            if len(comb) == num_countries and tuple(sorted(comb)) not in drawn:
+                break
+        else:
+            raise ValueError(f'Could not draw a new valid combination of {num_countries} countries '
+                             f'after {len(samples)} samples and {max_attempts} attempts.')
+
+        comb = sorted(comb)
+        location = min(comb, key=lambda pos: (location_counts[pos], rng.random()))
+        drawn.add(tuple(comb))
+        for pos in comb:
+            counts[pos] += 1
+        location_counts[location] += 1
+        samples.append(comb + [location])
+
+    return pd.DataFrame(samples, columns=[f'Row{i+1}' for i in range(num_countries)] + ['Location'])
@@ -1,17 +1,54 @@
+import hashlib
+import re
+from functools import lru_cache
 import pandas as pd
 
+# Placeholders of the base prompt and the scenario columns that replace them
+PLACEHOLDER_COLUMNS = {'LOC': 'location',
+                       'COUNT1': 'origin1', 'REL1': 'religion1',
+                       'COUNT2': 'origin2', 'REL2': 'religion2',
+                       'COUNT3': 'origin3', 'REL3': 'religion3',
+                       'COUNT4': 'origin4', 'REL4': 'religion4'}
+PLACEHOLDER_PATTERN = re.compile('|'.join(PLACEHOLDER_COLUMNS))
+
+class PromptTemplate:
+    """Base prompt split once at its placeholders, so that a prompt is rendered with a single join"""
+
+    def __init__(self, text):
+        self.text = text
+        self.hash = template_hash(text)
+        self.parts = PLACEHOLDER_PATTERN.split(text)
+        self.columns = [PLACEHOLDER_COLUMNS[placeholder] for placeholder in PLACEHOLDER_PATTERN.findall(text)]
+
+    def render(self, info):
+        """Render the prompt of one scenario (a dict-like row with the scenario columns)"""
+        pieces = [self.parts[0]]
+        for column, part in zip(self.columns, self.parts[1:]):
+            pieces.append(info[column])
+            pieces.append(part)
+        return ''.join(pieces)
+
+    def render_frame(self, info_df):
+        """Render the prompts of all scenarios of a DataFrame with vectorised string concatenation"""
+        prompts = pd.Series(self.parts[0], index=info_df.index, dtype=object)
+        for column, part in zip(self.columns, self.parts[1:]):
+            prompts = prompts + info_df[column].astype(str) + part
+        return prompts
+
+def template_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+@lru_cache(maxsize=None)
+def get_template(text):
+    return PromptTemplate(text)
+
 # Function to create input samples
 def generate_story_prompt(text, info):
     if not info.empty:
         # Replace location, countries, religion in the prompt
-        text = text.replace('LOC', info['location'])
-        text = text.replace('COUNT1', info['origin1']).replace('REL1', info['religion1'])
-        text = text.replace('COUNT2', info['origin2']).replace('REL2', info['religion2'])
-        text = text.replace('COUNT3', info['origin3']).replace('REL3', info['religion3'])
-        text = text.replace('COUNT4', info['origin4']).replace('REL4', info['religion4'])
-    
+        text = get_template(text).render(info)
+
     return text
 
 if __name__ == "__main__":
     generate_story_prompt('', pd.DataFrame())
-
@@ -0,0 +1,237 @@
+import copy
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import pandas as pd
+
+# Config keys used to load a local model (LOAD_CONFIG_KEYS of src/models/hf_memory.py, which needs torch):
+# jobs with the same values can share the loaded pipe
+PIPE_CONFIG_KEYS = ['model', 'memory_ceiling', 'gpu_memory_ceiling', 'offload_folder']
+
+def load_sweep_spec(spec_path='src/config/sweep_config.json'):
+    """Load a sweep specification (models, rounds and named config variants)"""
+    with open(spec_path, 'r') as f:
+        spec = json.load(f)
+
+    if not spec.get('variants'):
+        spec['variants'] = {'base': {}}
+
+    return spec
+
+def set_system_prompt(config, text):
+    """Set the system prompt in any of the provider config layouts"""
+    if 'system' in config: # claude keeps the system prompt outside the messages
+        config['system'] = text
+        return config
+
+    for message in config['messages']:
+        if message['role'] == 'system':
+            if isinstance(message['content'], list): # chatgpt
+                message['content'][0]['text'] = text
+            else: # huggingface chat template
+                message['content'] = text
+            return config
+
+    print("Warning: No system prompt found in the model config; the override is ignored.")
+    return config
+
+def apply_config_overrides(config, overrides, model_name):
+    """Return a copy of the model config with the variant overrides applied"""
+    config = copy.deepcopy(config)
+    overrides = dict(overrides)
+    per_model = overrides.pop('per_model', {}).get(model_name, {})
+
+    for key, value in {**overrides, **per_model}.items():
+        if key == 'system_prompt':
+            set_system_prompt(config, value)
+        else:
+            config[key] = value
+
+    return config
+
+def config_fingerprint(config):
+    """Hash of the effective request config, used to detect identical requests"""
+    serialized = json.dumps(config, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()[:12]
+
+def expand_sweep(spec, load_config):
+    """
+    Expand a sweep specification into a matrix of (model, config variant, round) jobs.
+
+    Variants that resolve to the same effective config for a model are deduplicated:
+    the request is scheduled once and its responses are written for every variant name
+    (or copied from a variant that has them already, see copy_job_responses).
+
+    Parameters:
+    spec: Sweep specification as returned by load_sweep_spec
+    load_config: Function returning the base config of a model given its name
+
+    Returns:
+    list: Jobs as dictionaries with keys model, round, config, fingerprint and variants
+    """
+    jobs = OrderedDict()
+    for model_name in spec['models']:
+        base_config = load_config(model_name)
+        for variant_name, overrides in spec['variants'].items():
+            config = apply_config_overrides(base_config, overrides, model_name)
+            fingerprint = config_fingerprint(config)
+            for round in range(spec['num_generation_rounds']):
+                key = (model_name, fingerprint, round)
+                if key in jobs:
+                    jobs[key]['variants'].append(variant_name)
+                else:
+                    jobs[key] = {'model': model_name,
+                                 'round': round,
+                                 'config': config,
+                                 'fingerprint': fingerprint,
+                                 'variants': [variant_name]}
+
+    return list(jobs.values())
+
+def variant_output_path(sweep_name, variant_name, model_name, output_dir='data/processed/sweeps'):
+    return os.path.join(output_dir, sweep_name, variant_name, f'{model_name}_responses.csv')
+
+def variant_round_path(sweep_name, variant_name, model_name, round, output_dir='data/processed/sweeps'):
+    return os.path.join(output_dir, sweep_name, variant_name, f'{model_name}_round{round + 1}_responses.csv')
+
+def completion_index_path(sweep_name, variant_name, model_name, output_dir='data/processed/sweeps'):
+    return os.path.join(output_dir, sweep_name, variant_name, f'{model_name}_completed.json')
+
+def load_completion_index(sweep_name, variant_name, model_name, output_dir='data/processed/sweeps'):
+    """
+    Number of responses saved per round column of a variant.
+
+    Sweeps written before the index existed only have the response file; the
+    index is built from it once and saved.
+    """
+    path = completion_index_path(sweep_name, variant_name, model_name, output_dir)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    responses_path = variant_output_path(sweep_name, variant_name, model_name, output_dir)
+    if not os.path.exists(responses_path):
+        return {}
+    index = {column: int(count) for column, count in pd.read_csv(responses_path, sep=';', header=0).count().items()}
+    save_completion_index(index, sweep_name, variant_name, model_name, output_dir)
+    return index
+
+def save_completion_index(index, sweep_name, variant_name, model_name, output_dir='data/processed/sweeps'):
+    path = completion_index_path(sweep_name, variant_name, model_name, output_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(index, f, indent=4)
+    os.replace(f'{path}.tmp', path)
+
+def job_is_complete(sweep_name, job, num_prompts, output_dir='data/processed/sweeps'):
+    """A job is complete if the completion index of every variant it serves holds its round"""
+    column = f"round{job['round'] + 1}"
+    return all(load_completion_index(sweep_name, variant_name, job['model'], output_dir).get(column, 0) >= num_prompts
+               for variant_name in job['variants'])
+
+def pipe_key(config):
+    """Loading options of a model config: jobs with the same key can share the loaded pipe"""
+    return config_fingerprint({key: config.get(key) for key in PIPE_CONFIG_KEYS})
+
+def read_variant_round(sweep_name, variant_name, model_name, round, output_dir='data/processed/sweeps'):
+    """Saved responses of one round of a variant (from its round file, or from its combined response file), or None"""
+    column = f'round{round + 1}'
+    round_path = variant_round_path(sweep_name, variant_name, model_name, round, output_dir)
+    if os.path.exists(round_path):
+        return pd.read_csv(round_path, sep=';', header=0)[column]
+    path = variant_output_path(sweep_name, variant_name, model_name, output_dir)
+    if os.path.exists(path):
+        response_df = pd.read_csv(path, sep=';', header=0)
+        if column in response_df:
+            return response_df[column]
+    return None
+
+def copy_job_responses(sweep_name, job, num_prompts, output_dir='data/processed/sweeps'):
+    """
+    Complete a job from a variant it serves that has its round already, e.g. a variant added
+    to a sweep with the same effective config as an existing one.
+
+    The round is copied to the variants that do not have it, so it is neither generated
+    again nor overwritten in the variants that have it.
+
+    Returns:
+    bool: Whether the job was completed from existing responses
+    """
+    column = f"round{job['round'] + 1}"
+    indexes = {variant_name: load_completion_index(sweep_name, variant_name, job['model'], output_dir)
+               for variant_name in job['variants']}
+    missing = [variant_name for variant_name, index in indexes.items() if index.get(column, 0) < num_prompts]
+    for variant_name in job['variants']:
+        if variant_name in missing:
+            continue
+        responses = read_variant_round(sweep_name, variant_name, job['model'], job['round'], output_dir)
+        if responses is not None:
+            responses = responses.astype(object).where(responses.notna(), None).tolist()
+            save_job_responses(sweep_name, {**job, 'variants': missing}, responses, output_dir)
+            return True
+    return False
+
+def save_job_responses(sweep_name, job, responses, output_dir='data/processed/sweeps'):
+    """
+    Write the responses of a job to a round file of every variant it serves and record the round in its completion index.
+
+    The round files are combined into {model}_responses.csv by assemble_variant_responses.
+    """
+    column = f"round{job['round'] + 1}"
+    for variant_name in job['variants']:
+        path = variant_round_path(sweep_name, variant_name, job['model'], job['round'], output_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pd.DataFrame({column: responses}).to_csv(path, sep=';', index=False)
+
+        index = load_completion_index(sweep_name, variant_name, job['model'], output_dir)
+        index[column] = sum(response is not None for response in responses)
+        save_completion_index(index, sweep_name, variant_name, job['model'], output_dir)
+
+        # Record the effective config next to the responses of the variant
+        with open(os.path.join(os.path.dirname(path), f"{job['model']}_config.json"), 'w') as f:
+            json.dump(job['config'], f, indent=4)
+
+def assemble_variant_responses(sweep_name, variant_name, model_name, num_rounds, output_dir='data/processed/sweeps'):
+    """
+    Combine the round files of a variant into {model}_responses.csv once every round is saved.
+
+    Returns:
+    bool: Whether the response file holds every round
+    """
+    columns = [f'round{round + 1}' for round in range(num_rounds)]
+    index = load_completion_index(sweep_name, variant_name, model_name, output_dir)
+    if any(column not in index for column in columns):
+        return False
+
+    path = variant_output_path(sweep_name, variant_name, model_name, output_dir)
+    round_paths = {column: variant_round_path(sweep_name, variant_name, model_name, round, output_dir)
+                   for round, column in enumerate(columns)}
+    new_rounds = {column: round_path for column, round_path in round_paths.items() if os.path.exists(round_path)}
+    if not new_rounds:
+        return True
+
+    # Rounds saved before keep their column of the existing response file
+    response_df = pd.read_csv(path, sep=';', header=0) if os.path.exists(path) else pd.DataFrame()
+    for column, round_path in new_rounds.items():
+        response_df = response_df.drop(columns=column, errors='ignore').join(pd.read_csv(round_path, sep=';', header=0), how='outer')
+    # Keep the round columns in order, as in {model}_responses.csv
+    response_df = response_df[sorted(response_df.columns, key=lambda col: int(col[len('round'):]))]
+    response_df.to_csv(path, sep=';', index=False)
+    for round_path in new_rounds.values():
+        os.remove(round_path)
+    return True
+
+def interleave_jobs(jobs):
+    """
+    Group the jobs per provider, ordered so that every variant gets its first round early.
+
+    Jobs loading the model with other options (e.g. a variant overriding the model id)
+    come after those of the first options, so that a local model is loaded once per options.
+    """
+    pipe_keys = list(dict.fromkeys(pipe_key(job['config']) for job in jobs))
+    queues = OrderedDict()
+    for job in sorted(jobs, key=lambda job: (pipe_keys.index(pipe_key(job['config'])), job['round'])):
+        queues.setdefault(job['model'], []).append(job)
+    return queues
@@ -0,0 +1,84 @@
+from itertools import combinations
+import numpy as np
+import pandas as pd
+
+from src.utils.country_index import CountryIndex
+
+# Bits of the audit flags of an extracted row
+NATIONALITY_SWAP = 1      # a character states the nationality of another character
+NATIONALITY_MISMATCH = 2  # a character states a nationality that is none of the scenario's origins
+DUPLICATE_NAMES = 4       # two characters have the same name
+MISSING_CHARACTER = 8     # the name or gender of a character was not found
+INVALID_GENDER = 16       # a gender other than Female or Male
+
+AUDIT_FLAGS = {'nationality_swap': NATIONALITY_SWAP,
+               'nationality_mismatch': NATIONALITY_MISMATCH,
+               'duplicate_names': DUPLICATE_NAMES,
+               'missing_character': MISSING_CHARACTER,
+               'invalid_gender': INVALID_GENDER}
+VALID_GENDERS = ['Female', 'Male']
+
+def character_values(info_df, field):
+    """(rows x 4) array of a per-character field, with '' for missing values and columns"""
+    columns = [f'{field}{i}' for i in range(1, 5)]
+    if not set(columns).issubset(info_df.columns):
+        return np.full((len(info_df), 4), '', dtype=object)
+    return info_df[columns].fillna('').astype(str).to_numpy()
+
+def resolve_nationalities(nationalities, country_index):
+    """
+    Standard country names of stated nationalities (demonyms, aliases or names), or the stated text if they cannot be resolved.
+
+    The extractor only resolves them with its country index ("extraction_country_index"),
+    so the audit resolves them itself: in the default mode "Chinese" is kept as stated.
+    """
+    resolved = {nationality: (country_index.resolve(nationality)[0] or nationality) if nationality else ''
+                for nationality in pd.unique(nationalities.ravel())}
+    return np.vectorize(resolved.get, otypes=[object])(nationalities).astype(str) if nationalities.size else nationalities
+
+def audit_flags(info_df, country_index=None):
+    """
+    Audit flags of extracted rows, computed on whole columns at once.
+
+    Parameters:
+    info_df: Extracted information (as returned by CriminalInfoExtractor.extract)
+    country_index: CountryIndex resolving the stated nationalities (one is created if not given)
+
+    Returns:
+    np.ndarray: uint8 bitmask per row, combining the flags above
+    """
+    names = np.char.lower(character_values(info_df, 'name').astype(str))
+    genders = character_values(info_df, 'gender').astype(str)
+    origins = character_values(info_df, 'origin').astype(str)
+    nationalities = resolve_nationalities(character_values(info_df, 'nationality').astype(str),
+                                          country_index if country_index else CountryIndex())
+    flags = np.zeros(len(info_df), dtype=np.uint8)
+
+    missing = (names == '') | (genders == '')
+    flags[missing.any(axis=1)] |= MISSING_CHARACTER
+    flags[(~np.isin(genders, VALID_GENDERS) & (genders != '')).any(axis=1)] |= INVALID_GENDER
+
+    duplicates = np.zeros(len(info_df), dtype=bool)
+    for a, b in combinations(range(4), 2):
+        duplicates |= (names[:, a] == names[:, b]) & (names[:, a] != '')
+    flags[duplicates] |= DUPLICATE_NAMES
+
+    # Nationalities are compared with the origins of all 4 characters: (rows x stated x origin)
+    stated = nationalities != ''
+    matches = nationalities[:, :, None] == origins[:, None, :]
+    own_origin = np.diagonal(matches, axis1=1, axis2=2)
+    other_origin = matches.any(axis=2) & ~own_origin
+    flags[(stated & other_origin).any(axis=1)] |= NATIONALITY_SWAP
+    flags[(stated & ~matches.any(axis=2)).any(axis=1)] |= NATIONALITY_MISMATCH
+    return flags
+
+def exclusion_mask(flag_names):
+    """Bitmask of the flags named in the config (keys of AUDIT_FLAGS)"""
+    unknown = set(flag_names) - set(AUDIT_FLAGS)
+    if unknown:
+        raise ValueError(f'Unknown audit flags: {sorted(unknown)}; expected some of {list(AUDIT_FLAGS)}')
+    return sum(AUDIT_FLAGS[name] for name in set(flag_names))
+
+def summarize_flags(flags):
+    """Number of rows raising each flag"""
+    return pd.Series({name: int(np.count_nonzero(flags & bit)) for name, bit in AUDIT_FLAGS.items()}, name='rows')
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import pandas as pd
+
+from src.utils.analyse_response_text import EXTRACTOR_VERSION
+from src.utils.parallel_extraction import extract_rounds
+
+CACHE_DIR = 'data/results/charactersANDcriminal_info/cache'
+
+def extraction_key(response_info_row, version=EXTRACTOR_VERSION):
+    """Hash of the response text, its scenario information and the extractor version"""
+    content = json.dumps([version, {column: str(value) for column, value in response_info_row.items()}], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def is_complete(result):
+    """Rows with values left for review are not cached, so that they are extracted again once answered"""
+    return all(value is not None for value in result.values())
+
+class ExtractionCache:
+    """
+    Extraction results of a model keyed by extraction_key, stored in one JSONL file.
+
+    Entries of other extractor versions are dropped when the cache is loaded, so
+    bumping EXTRACTOR_VERSION, or switching the scanner or country index of the
+    extractor (see extractor_version), invalidates the whole cache.
+    """
+
+    def __init__(self, model_name, cache_dir=CACHE_DIR, version=EXTRACTOR_VERSION):
+        self.path = os.path.join(cache_dir, f'{model_name}.jsonl')
+        self.version = version
+        self.results = {}
+
+        num_records = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in filter(str.strip, f):
+                    record = json.loads(line)
+                    num_records += 1
+                    if record['version'] == version:
+                        self.results[record['key']] = record['result']
+
+        # Rewrite the file without the outdated entries
+        if num_records > len(self.results):
+            self.rewrite()
+
+    def __contains__(self, key):
+        return key in self.results
+
+    def __getitem__(self, key):
+        return self.results[key]
+
+    def rewrite(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            for key, result in self.results.items():
+                f.write(json.dumps({'key': key, 'version': self.version, 'result': result}, ensure_ascii=False) + '\n')
+
+    def add(self, results):
+        """Append complete results (dictionary of key -> extracted row)"""
+        new_results = {key: result for key, result in results.items() if key not in self.results and is_complete(result)}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for key, result in new_results.items():
+                f.write(json.dumps({'key': key, 'version': self.version, 'result': result}, ensure_ascii=False) + '\n')
+        self.results.update(new_results)
+
+def extract_rounds_incremental(round_responses, extractor, cache, **kwargs):
+    """
+    Same as extract_rounds, but only the rows missing from the cache are extracted.
+
+    Parameters:
+    round_responses: Dictionary of DataFrames (response and scenario info columns) per round
+    extractor: CriminalInfoExtractor
+    cache: ExtractionCache of the model, with the version of the extractor
+    kwargs: Parallelism arguments of extract_rounds
+
+    Returns:
+    dict: DataFrame of extracted information per round
+    """
+    keys = {round: [extraction_key(row, cache.version) for _, row in responses_df.iterrows()] for round, responses_df in round_responses.items()}
+    missing = {round: responses_df[[key not in cache for key in keys[round]]] for round, responses_df in round_responses.items()}
+    num_missing = sum(len(responses_df) for responses_df in missing.values())
+    print(f'Extracting {num_missing} new or changed rows; {sum(map(len, keys.values())) - num_missing} rows reused from {cache.path}.')
+
+    extracted_missing = extract_rounds(missing, extractor, **kwargs) if num_missing else {}
+
+    extracted = {}
+    for round, responses_df in round_responses.items():
+        new_rows = extracted_missing[round].to_dict('index') if round in extracted_missing else {}
+        rows = [cache[key] if key in cache else new_rows[idx] for idx, key in zip(responses_df.index, keys[round])]
+        cache.add({key: new_rows[idx] for idx, key in zip(responses_df.index, keys[round]) if idx in new_rows})
+        extracted[round] = pd.DataFrame(rows, index=responses_df.index)
+    return extracted
@@ -0,0 +1,67 @@
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+# Extractor of the worker process, set once by the pool initializer
+_worker_extractor = None
+
+def _init_worker(extractor):
+    global _worker_extractor
+    _worker_extractor = extractor
+
+def _extract_chunk(chunk_df):
+    _worker_extractor.pending = []
+    rows = [_worker_extractor.extract(row) for _, row in chunk_df.iterrows()]
+    return rows, _worker_extractor.pending
+
+def create_extraction_pool(extractor, num_workers):
+    """Process pool whose workers each hold a copy of the extractor, so patterns are compiled once per worker"""
+    return ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(extractor,))
+
+def extract_rounds(round_responses, extractor, num_workers=1, chunk_size=200, executor=None):
+    """
+    Extract the criminal information of several rounds, in parallel over row chunks.
+
+    The chunks of all rounds are submitted to the same pool, so rounds (and models,
+    when the pool is shared) are processed concurrently. The results keep the
+    original row order and index and are the same as the serial
+    DataFrame.apply(extractor.extract, axis=1, result_type='expand').
+    The workers have no terminal, so the extractor should be non-interactive;
+    the rows left for review are added to extractor.pending, tagged with their round.
+
+    Parameters:
+    round_responses: Dictionary of DataFrames (response and scenario info columns) per round
+    extractor: CriminalInfoExtractor used in the serial path and copied to the workers
+    num_workers: Number of worker processes; 1 extracts serially in this process
+    chunk_size: Number of rows sent to a worker at a time
+    executor: Existing pool from create_extraction_pool to reuse across models
+
+    Returns:
+    dict: DataFrame of extracted information per round
+    """
+    if executor is None and num_workers <= 1:
+        extracted = {}
+        for round, responses_df in round_responses.items():
+            num_pending = len(extractor.pending)
+            extracted[round] = responses_df.apply(extractor.extract, axis=1, result_type='expand')
+            for record in extractor.pending[num_pending:]:
+                record['round'] = round
+        return extracted
+
+    pool = executor if executor else create_extraction_pool(extractor, num_workers)
+    try:
+        futures = {round: [pool.submit(_extract_chunk, responses_df.iloc[start:start + chunk_size])
+                           for start in range(0, len(responses_df), chunk_size)]
+                   for round, responses_df in round_responses.items()}
+
+        extracted = {}
+        for round, round_futures in futures.items():
+            rows = []
+            for future in round_futures:
+                chunk_rows, chunk_pending = future.result()
+                rows.extend(chunk_rows)
+                extractor.pending.extend({**record, 'round': round} for record in chunk_pending)
+            extracted[round] = pd.DataFrame(rows, index=round_responses[round].index)
+        return extracted
+    finally:
+        if executor is None:
+            pool.shutdown()
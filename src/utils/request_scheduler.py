@@ -0,0 +1,66 @@
+import random
+from collections import defaultdict
+
+def sequential_schedule(num_prompts, num_rounds):
+    """Round-major order: every prompt of round 1, then every prompt of round 2, ..."""
+    return [(prompt_idx, round) for round in range(num_rounds) for prompt_idx in range(num_prompts)]
+
+def stratified_order(strata, rng):
+    """
+    Randomised order of items in which every stratum is spread evenly.
+
+    Each item gets the key (rank + u) / stratum_size, where rank is its position
+    within its stratum and u ~ U(0, 1). Sorting by this key places the items of
+    every stratum at roughly equal intervals, so any prefix of the order holds
+    each stratum close to its overall proportion.
+
+    The strata are tuples and are nested: items are stratified by the first value,
+    and within each of its strata the ranks follow the stratified order of the
+    remaining values (a plain shuffle once no value is left). Balancing on the joint
+    combinations instead would give many strata of one or two items, which cannot
+    be spread, and the balance of the first value would be lost.
+    """
+    groups = defaultdict(list)
+    for idx, stratum in enumerate(strata):
+        groups[stratum[0]].append(idx)
+
+    keys = {}
+    for members in groups.values():
+        if len(strata[members[0]]) > 1:
+            members = [members[position] for position in stratified_order([strata[idx][1:] for idx in members], rng)]
+        else:
+            rng.shuffle(members)
+        for rank, idx in enumerate(members):
+            keys[idx] = (rank + rng.random()) / len(members)
+
+    return sorted(keys, key=keys.get)
+
+def stratified_schedule(info_df, num_rounds, seed=42, strata_columns=('location', 'origin1')):
+    """
+    Order of (prompt index, round) pairs in which any prefix is balanced.
+
+    The prompts of each round are ordered by stratified_order over the strata columns,
+    with an independent shuffle per round, and the rounds are interleaved so that the
+    k-th prompt of every round is visited before the (k+1)-th prompt of any round.
+
+    By default the prompts are stratified by location, and the prompts of each
+    location are interleaved by the origin of the first listed character. The four
+    characters of a scenario are listed in random order, so origin1 is a random draw
+    of its origins. Any prefix holds every location within about one prompt of its
+    share, while the origins are spread within each location.
+
+    Parameters:
+    info_df: Scenario information with one row per prompt (as in input_info.csv)
+    num_rounds: Number of generation rounds
+    seed: Seed of the random order, so that an interrupted run resumes in the same order
+    strata_columns: Column, or columns, of info_df; the prompts are stratified by the
+                    first, and within each of its strata by the next ones in turn
+
+    Returns:
+    list: (prompt_idx, round) pairs covering every prompt in every round once
+    """
+    strata_columns = [strata_columns] if isinstance(strata_columns, str) else list(strata_columns)
+    strata = list(info_df[strata_columns].itertuples(index=False, name=None))
+    round_orders = [stratified_order(strata, random.Random(f'{seed}-{round}')) for round in range(num_rounds)]
+
+    return [(order[position], round) for position in range(len(strata)) for round, order in enumerate(round_orders)]
@@ -0,0 +1,202 @@
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from src.utils.compute_statistics import load_statistics_coding, category_codes
+
+# Largest number of (resample x scenario) weights held in memory by one batch
+MAX_BATCH_CELLS = 2_000_000
+
+def _run_batches(resampler, jobs):
+    """Results of a group of (method, seed, size) batches, run in a worker process"""
+    return [getattr(resampler, method)(seed, size) for method, seed, size in jobs]
+
+def create_resampling_pool(num_workers):
+    """Process pool to share across the rounds and models resampled by compute_resampling_statistics"""
+    return ProcessPoolExecutor(max_workers=num_workers)
+
+def dimension_codes(criminal_info_df, coding):
+    """
+    Per-character integer codes (rows x 4) of each statistics table, -1 for characters outside its categories.
+
+    Returns:
+    dict: table name -> (codes, category labels)
+    """
+    countries = np.column_stack([category_codes(criminal_info_df[f'origin{i}'], coding['countries']) for i in range(1, 5)])
+    genders = np.column_stack([category_codes(criminal_info_df[f'gender{i}'], coding['genders']) for i in range(1, 5)])
+    location = category_codes(criminal_info_df['location'], coding['countries'])
+    known = countries >= 0
+    immigrants = np.where(known & (location[:, None] >= 0) & (countries != location[:, None]), 0, -1)
+    return {'immigrant_stats': (immigrants, pd.Index(['immigrant'])),
+            'gender_stats': (genders, coding['genders']),
+            'country_stats': (countries, coding['countries']),
+            'region_stats': (np.where(known, coding['country_region'][countries], -1), coding['regions']),
+            'religion_stats': (np.where(known, coding['country_religion'][countries], -1), coding['religions'])}
+
+def grouped_bincount(codes, num_categories):
+    """Counts of each category per row of a code matrix (rows x columns), as a (rows x categories) matrix"""
+    num_rows = len(codes)
+    valid = codes >= 0
+    flat = (np.arange(num_rows)[:, None] * num_categories + codes)[valid]
+    return np.bincount(flat, minlength=num_rows * num_categories).reshape(num_rows, num_categories)
+
+def adjust_pvalues(p_values, method='fdr_bh'):
+    """
+    Correct p-values for multiple comparisons (NaN p-values are left out of the family).
+
+    Parameters:
+    p_values: Array of p-values
+    method: 'fdr_bh' (Benjamini-Hochberg false discovery rate), 'holm' (Holm-Bonferroni family-wise error) or None
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    adjusted = p_values.copy()
+    tested = np.flatnonzero(~np.isnan(p_values))
+    if method is None or len(tested) == 0:
+        return adjusted
+
+    order = tested[np.argsort(p_values[tested])]
+    ranks = np.arange(1, len(order) + 1)
+    if method == 'fdr_bh':
+        ranked = np.minimum.accumulate((p_values[order] * len(order) / ranks)[::-1])[::-1]
+    elif method == 'holm':
+        ranked = np.maximum.accumulate(p_values[order] * (len(order) - ranks + 1))
+    else:
+        raise ValueError(f"Unknown correction method: {method}; expected 'fdr_bh', 'holm' or None")
+    adjusted[order] = np.minimum(ranked, 1)
+    return adjusted
+
+class CriminalRateResampler:
+    """
+    Bootstrap confidence intervals and permutation p-values of the criminal percentage of every table row of one round.
+
+    The bootstrap resamples whole scenarios (the 4 characters of a story stay
+    together). The permutation test draws the criminal uniformly among the 4
+    characters of each scenario, the null hypothesis under which every
+    category's criminal rate is 25%. Resamples are drawn in batches of integer
+    arrays, spread over worker processes rather than threads, as bincount holds
+    the GIL. Each worker receives the resampler once per round, with its
+    contiguous group of batches, so one pool serves every round.
+    """
+
+    def __init__(self, criminal_info_df, coding):
+        self.tables = dimension_codes(criminal_info_df, coding)
+        self.num_rows = len(criminal_info_df)
+        self.slots = pd.to_numeric(criminal_info_df['criminal']).to_numpy(dtype=np.int64) - 1
+
+        # Characters and criminals of each category per scenario, for all tables side by side
+        rows = np.arange(self.num_rows)
+        self.totals = np.hstack([grouped_bincount(codes, len(labels)) for codes, labels in self.tables.values()]).astype(np.float64)
+        self.criminals = np.hstack([grouped_bincount(codes[rows, self.slots][:, None], len(labels))
+                                    for codes, labels in self.tables.values()]).astype(np.float64)
+
+    def bootstrap_batch(self, seed, size):
+        """Criminal percentages of size bootstrap resamples (size x categories)"""
+        rng = np.random.default_rng(seed)
+        picks = rng.integers(0, self.num_rows, size=(size, self.num_rows))
+        weights = np.bincount((np.arange(size)[:, None] * self.num_rows + picks).ravel(),
+                              minlength=size * self.num_rows).reshape(size, self.num_rows).astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 100 * (weights @ self.criminals) / (weights @ self.totals)
+
+    def permutation_batch(self, seed, size):
+        """Criminal counts of size resamples with the criminal drawn uniformly per scenario (size x categories)"""
+        rng = np.random.default_rng(seed)
+        slots = rng.integers(0, 4, size=(size, self.num_rows))
+        rows = np.arange(self.num_rows)
+        return np.hstack([grouped_bincount(codes[rows, slots], len(labels)) for codes, labels in self.tables.values()])
+
+    def batch_sizes(self, num_resamples):
+        batch_size = max(1, min(num_resamples, MAX_BATCH_CELLS // max(self.num_rows, 1)))
+        return [min(batch_size, num_resamples - start) for start in range(0, num_resamples, batch_size)]
+
+    def batch_jobs(self, method, num_resamples, seed):
+        """(method, seed, size) of the batches of a method (bootstrap_batch or permutation_batch)"""
+        sizes = self.batch_sizes(num_resamples)
+        # seed is an int or the SeedSequence spawned for the method by resample
+        seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        return [(method, batch_seed, size) for batch_seed, size in zip(seed_sequence.spawn(len(sizes)), sizes)]
+
+    def run_batches(self, jobs, executor=None, num_workers=1):
+        """Results of the batches, split into one contiguous group per worker when a pool is given"""
+        if executor is None or num_workers <= 1 or len(jobs) <= 1:
+            return _run_batches(self, jobs)
+        group_size = -(-len(jobs) // num_workers)
+        groups = [jobs[start:start + group_size] for start in range(0, len(jobs), group_size)]
+        return [result for group_results in executor.map(_run_batches, [self] * len(groups), groups) for result in group_results]
+
+    def resample(self, num_resamples=10000, confidence=0.95, seed=42, executor=None, num_workers=1):
+        """
+        Parameters:
+        executor: Pool from create_resampling_pool, None to resample in this process
+        num_workers: Number of workers of the pool
+
+        Returns:
+        pd.DataFrame: percentage, ci_low, ci_high and p_value per category, indexed by (table, category)
+        """
+        # Every batch has its own seed, so the results do not depend on the number of workers
+        bootstrap_seed, permutation_seed = np.random.SeedSequence(seed).spawn(2)
+        bootstrap_jobs = self.batch_jobs('bootstrap_batch', num_resamples, bootstrap_seed)
+        permutation_jobs = self.batch_jobs('permutation_batch', num_resamples, permutation_seed)
+        results = self.run_batches(bootstrap_jobs + permutation_jobs, executor, num_workers)
+        bootstrap = np.vstack(results[:len(bootstrap_jobs)])
+        permutations = np.vstack(results[len(bootstrap_jobs):])
+
+        total = self.totals.sum(axis=0)
+        observed = self.criminals.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percentage = 100 * observed / total
+
+        alpha = 100 * (1 - confidence) / 2
+        with warnings.catch_warnings(): # categories without characters have no interval
+            warnings.simplefilter('ignore', RuntimeWarning)
+            ci_low, ci_high = np.nanpercentile(bootstrap, [alpha, 100 - alpha], axis=0)
+
+        # Two-sided test of the distance between the criminal count and its expectation under the null
+        expected = total / 4
+        extreme = (np.abs(permutations - expected) >= np.abs(observed - expected) - 1e-9).sum(axis=0)
+        p_value = np.where(total > 0, (1 + extreme) / (1 + num_resamples), np.nan)
+
+        index = pd.MultiIndex.from_tuples([(table, label) for table, (_, labels) in self.tables.items() for label in labels],
+                                          names=['table', 'category'])
+        return pd.DataFrame({'percentage': percentage, 'ci_low': ci_low, 'ci_high': ci_high, 'p_value': p_value}, index=index)
+
+def compute_resampling_statistics(criminal_info_dict, country_info_path='data/raw/selected_countries_info.csv',
+                                  num_resamples=10000, confidence=0.95, correction='fdr_bh', seed=42, num_workers=1, executor=None):
+    """
+    Confidence intervals and significance of the criminal percentages of the statistics tables.
+
+    For every round and every row of the tables of compute_responses_statistics,
+    gives the criminal percentage, its scenario-clustered bootstrap confidence
+    interval, the permutation p-value against the 25% rate of a criminal drawn
+    uniformly among the 4 characters, and the p-value corrected over all the
+    rows of the round. The immigrant percentage is over the characters whose
+    origin differs from the location, rather than 3 per scenario.
+
+    Parameters:
+    criminal_info_dict: Dictionary of DataFrames of extracted criminal information per round
+    num_resamples: Number of bootstrap and of permutation resamples
+    confidence: Level of the confidence intervals
+    correction: Multiple comparison correction of adjust_pvalues
+    num_workers: Number of worker processes; 1 resamples in this process
+    executor: Existing pool from create_resampling_pool with num_workers workers, to reuse across models
+
+    Returns:
+    dict: DataFrame per table with percentage, ci_low, ci_high, p_value and p_adjusted columns per round
+    """
+    coding = load_statistics_coding(country_info_path)
+    # One pool for all the rounds, unless the caller shares its own
+    pool = executor if executor or num_workers <= 1 else create_resampling_pool(num_workers)
+    round_results = []
+    try:
+        for round_idx, (round, criminal_info_df) in enumerate(criminal_info_dict.items()):
+            results_df = CriminalRateResampler(criminal_info_df, coding).resample(num_resamples, confidence, seed + round_idx,
+                                                                                  pool, num_workers)
+            results_df['p_adjusted'] = adjust_pvalues(results_df['p_value'].to_numpy(), correction)
+            round_results.append(results_df.add_prefix(f'{round}_'))
+    finally:
+        if pool and executor is None:
+            pool.shutdown()
+
+    results_df = pd.concat(round_results, axis=1)
+    return {table: results_df.xs(table, level='table') for table in results_df.index.unique(level='table')}
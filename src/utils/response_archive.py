@@ -0,0 +1,240 @@
+import gzip
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_DIR = 'data/processed/archive'
+RESPONSE_FORMATS = ['csv', 'archive']
+CODEC_EXTENSIONS = {'gzip': 'gz', 'zstd': 'zst'}
+
+# gzip needs no optional package, so any machine can read the archive; zstd must be chosen explicitly
+DEFAULT_CODEC = 'gzip'
+
+def check_codec(codec):
+    """Fail before writing when the codec is unknown or its package is missing"""
+    if codec not in CODEC_EXTENSIONS:
+        raise ValueError(f"Unknown codec: {codec}; expected one of {list(CODEC_EXTENSIONS)}")
+    if codec == 'zstd' and zstandard is None:
+        raise ImportError("The zstd codec needs the zstandard package (pip install zstandard); "
+                          "install it or set \"archive_codec\": \"gzip\" in general_config.json")
+
+def compress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError("The zstd codec needs the zstandard package (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+def decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError("This archive is compressed with zstd, which needs the zstandard package (pip install zstandard)")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def round_dir(model, round, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, model, round)
+
+class ResponseArchiveWriter:
+    """
+    Write the responses of one model and round to compressed JSONL shards with an offset index.
+
+    Records ({"prompt_id", "response"} lines) are compressed in blocks of
+    records_per_block, each block being an independent gzip member or zstd frame
+    appended to the current shard. A shard is therefore still a valid .jsonl.gz
+    (or .jsonl.zst) file, while index.json gives the shard, offset and length of
+    the block of every prompt, so one response is read by decompressing one block.
+    """
+
+    def __init__(self, model, round, archive_dir=ARCHIVE_DIR, codec=None, records_per_shard=10_000, records_per_block=16):
+        self.directory = round_dir(model, round, archive_dir)
+        self.codec = codec if codec else DEFAULT_CODEC
+        check_codec(self.codec)
+        self.records_per_shard = records_per_shard
+        self.records_per_block = records_per_block
+        os.makedirs(self.directory, exist_ok=True)
+        # A rewritten round replaces its previous shards
+        for file_name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, file_name))
+
+        self.shards = []
+        self.shard_file = None
+        self.shard_records = 0
+        self.block = []
+        self.index = {'prompt_id': [], 'shard': [], 'offset': [], 'length': [], 'line': []}
+
+    def write(self, prompt_id, response):
+        self.block.append((int(prompt_id), response))
+        if len(self.block) == self.records_per_block:
+            self.flush_block()
+
+    def write_many(self, records):
+        """Write (prompt_id, response) records"""
+        for prompt_id, response in records:
+            self.write(prompt_id, response)
+
+    def flush_block(self):
+        if not self.block:
+            return
+        if self.shard_file is None or self.shard_records >= self.records_per_shard:
+            self.open_shard()
+        data = compress(''.join(json.dumps({'prompt_id': prompt_id, 'response': response}, ensure_ascii=False) + '\n'
+                                for prompt_id, response in self.block).encode('utf-8'), self.codec)
+        offset = self.shard_file.tell()
+        self.shard_file.write(data)
+        for line, (prompt_id, _) in enumerate(self.block):
+            self.index['prompt_id'].append(prompt_id)
+            self.index['shard'].append(len(self.shards) - 1)
+            self.index['offset'].append(offset)
+            self.index['length'].append(len(data))
+            self.index['line'].append(line)
+        self.shard_records += len(self.block)
+        self.block = []
+
+    def open_shard(self):
+        if self.shard_file:
+            self.shard_file.close()
+        self.shards.append(f'shard{len(self.shards):05d}.jsonl.{CODEC_EXTENSIONS[self.codec]}')
+        self.shard_file = open(os.path.join(self.directory, self.shards[-1]), 'wb')
+        self.shard_records = 0
+
+    def close(self):
+        self.flush_block()
+        if self.shard_file:
+            self.shard_file.close()
+        # The index is written last, so a round without index is an unfinished write
+        index_path = os.path.join(self.directory, 'index.json')
+        with open(f'{index_path}.tmp', 'w') as f:
+            json.dump({'codec': self.codec, 'shards': self.shards, **self.index}, f)
+        os.replace(f'{index_path}.tmp', index_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        elif self.shard_file:
+            self.shard_file.close()
+
+def write_archive(model, responses_df, archive_dir=ARCHIVE_DIR, codec=None, **kwargs):
+    """
+    Archive the responses of a model given as in {model}_responses.csv: one round{n} column per round,
+    indexed by prompt_id. Missing responses (prompts not generated) are left out.
+    """
+    for round in responses_df.columns:
+        responses = responses_df[round]
+        with ResponseArchiveWriter(model, round, archive_dir, codec, **kwargs) as writer:
+            writer.write_many(responses[responses.notna()].items())
+
+def response_source(model, response_format='csv', processed_dir='data/processed', temp_dir='data/temp'):
+    """
+    Where to read the responses of a model from: ('archive' | 'csv' | 'checkpoint', path), or (None, None).
+
+    The full responses are read in the configured response_format, or in the
+    other format when only that one exists. The latest checkpoint of an
+    unfinished run wins when it is newer than them (checkpoints are removed
+    once a run completes). temp_dir=None leaves checkpoints out.
+    """
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f"Unknown response format: {response_format}; expected one of {RESPONSE_FORMATS}")
+    archive_dir = os.path.join(processed_dir, 'archive')
+    sources = {}
+    if ResponseArchive.exists(model, archive_dir):
+        archive = ResponseArchive(model, archive_dir)
+        sources['archive'] = (archive.directory, max(os.path.getmtime(os.path.join(archive.directory, round, 'index.json'))
+                                                     for round in archive.rounds()))
+    csv_path = os.path.join(processed_dir, f'{model}_responses.csv')
+    if os.path.isfile(csv_path):
+        sources['csv'] = (csv_path, os.path.getmtime(csv_path))
+    # One checkpoint per model, or the per-round checkpoints of runs started before it
+    checkpoints = []
+    if temp_dir:
+        checkpoint = Path(temp_dir, f'{model}_checkpoint.json')
+        checkpoints = [checkpoint] if checkpoint.is_file() else list(Path(temp_dir).glob(f'{model}_round*_checkpoint.json'))
+    if checkpoints:
+        checkpoint = max(checkpoints, key=os.path.getmtime)
+        sources['checkpoint'] = (str(checkpoint), os.path.getmtime(checkpoint))
+
+    source = next((name for name in [response_format, *RESPONSE_FORMATS] if name in sources), None)
+    if 'checkpoint' in sources and (source is None or sources['checkpoint'][1] > sources[source][1]):
+        source = 'checkpoint'
+    return (source, sources[source][0]) if source else (None, None)
+
+class ResponseArchive:
+    """Random and sequential access to the archived responses of one model"""
+
+    def __init__(self, model, archive_dir=ARCHIVE_DIR):
+        self.model = model
+        self.directory = os.path.join(archive_dir, model)
+        self.indexes = {}
+        # Recently read blocks, so that neighbouring prompts do not decompress their block again
+        self.cached_block = lru_cache(maxsize=64)(self.read_block)
+
+    @staticmethod
+    def exists(model, archive_dir=ARCHIVE_DIR):
+        return os.path.isdir(os.path.join(archive_dir, model)) and bool(ResponseArchive(model, archive_dir).rounds())
+
+    def rounds(self):
+        """Archived rounds (round1, round2, ...) in order"""
+        rounds = [round for round in os.listdir(self.directory) if os.path.exists(os.path.join(self.directory, round, 'index.json'))]
+        return sorted(rounds, key=lambda round: int(round.replace('round', '')))
+
+    def index(self, round):
+        if round not in self.indexes:
+            with open(os.path.join(self.directory, round, 'index.json'), 'r') as f:
+                index = json.load(f)
+            index['positions'] = {prompt_id: position for position, prompt_id in enumerate(index['prompt_id'])}
+            index['block_starts'] = {}
+            for position, key in enumerate(zip(index['shard'], index['offset'])):
+                index['block_starts'].setdefault(key, position)
+            self.indexes[round] = index
+        return self.indexes[round]
+
+    def read_block(self, round, shard, offset, length):
+        """Lines of one compressed block"""
+        index = self.index(round)
+        with open(os.path.join(self.directory, round, index['shards'][shard]), 'rb') as f:
+            f.seek(offset)
+            return decompress(f.read(length), index['codec']).decode('utf-8').split('\n')[:-1]
+
+    def get(self, prompt_id, round):
+        """Response to one prompt in one round, or None if it is not archived"""
+        index = self.index(round)
+        position = index['positions'].get(int(prompt_id))
+        if position is None:
+            return None
+        lines = self.cached_block(round, index['shard'][position], index['offset'][position], index['length'][position])
+        return json.loads(lines[index['line'][position]])['response']
+
+    def iter_round(self, round):
+        """(prompt_id, response) of a round in the order they were written, one block in memory at a time"""
+        index = self.index(round)
+        for shard, shard_name in enumerate(index['shards']):
+            # Blocks are contiguous in their shard, so the shard is read straight through
+            with open(os.path.join(self.directory, round, shard_name), 'rb') as f:
+                while True:
+                    start = f.tell()
+                    position = index['block_starts'].get((shard, start))
+                    if position is None:
+                        break
+                    data = f.read(index['length'][position])
+                    # Split on newlines only: responses may hold other line separators, such as U+2028
+                    for line in decompress(data, index['codec']).decode('utf-8').split('\n')[:-1]:
+                        record = json.loads(line)
+                        yield record['prompt_id'], record['response']
+
+    def to_frame(self):
+        """Responses as in {model}_responses.csv: one round{n} column per round, indexed by prompt_id"""
+        columns = {}
+        for round in self.rounds():
+            prompt_ids, responses = zip(*self.iter_round(round)) if self.index(round)['prompt_id'] else ((), ())
+            columns[round] = pd.Series(responses, index=pd.Index(prompt_ids, name='prompt_id'), dtype=object)
+        return pd.DataFrame(columns).sort_index()
@@ -0,0 +1,137 @@
+import json
+import re
+from collections import deque
+
+class AhoCorasick:
+    """Aho-Corasick automaton finding every occurrence of a set of keywords in one pass over a text"""
+
+    def __init__(self, keywords):
+        """keywords: Dictionary of keyword -> value reported for its matches"""
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        for keyword, value in keywords.items():
+            state = 0
+            for char in keyword:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append((len(keyword), value))
+
+        # Breadth-first construction of the failure links
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def finditer(self, text):
+        """Yield (start, end, value) of every keyword occurrence, overlapping ones included"""
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, value in self.output[state]:
+                yield position - length + 1, position + 1, value
+
+class ResponseScanner:
+    """
+    Find the character lines, their Name/Gender/Nationality fields, the criminal sentence
+    and the country mentions of a response in a single pass.
+
+    One combined pattern tokenises the response once: each header line of the
+    character list opens a character, and the fields that follow are assigned to it
+    until the next header. Headers are "Character 1:" or "{1}" at the start of a
+    line, or a bare "1." (or "1:", "1)") followed by a Name or Gender field on the
+    same line, so that numbered lines of the story do not open characters. Country
+    aliases are found by an Aho-Corasick automaton over the lower-cased text.
+    """
+
+    TOKEN_PATTERN = re.compile(
+        r'(?P<header>^[ \t*#>\-]*(?:\{(?:Character[_ ]?)?(?P<braced>[1-4])\}[ \t]*[.:,)]?'
+        r'|Character[_ ]?\{?(?P<named>[1-4])\}?[ \t]*[.:,)]'
+        r'|(?P<listed>[1-4])[ \t]*[.:)](?=[^\n]*\b(?:Name|Gender):)))'
+        r'|\b(?P<field>Name|Gender|Nationality):[ \t]*(?P<value>[^,\n*]*)'
+        r'|(?P<criminal>(?-i:The criminal is) (?P<criminal_name>\w+)[^.\n]*)',
+        re.MULTILINE | re.IGNORECASE)
+    WORD_PATTERN = re.compile(r'\w+')
+
+    def __init__(self, aliases_path='src/utils/country_aliases.json', normalize=None, demonyms_path=None):
+        with open(aliases_path, 'r') as f:
+            country_aliases = json.load(f)
+        # Demonyms ("the Nigerian man") are matched as mentions of their country
+        if demonyms_path:
+            with open(demonyms_path, 'r') as f:
+                for standard_name, demonyms in json.load(f).items():
+                    country_aliases[standard_name] = country_aliases.get(standard_name, []) + demonyms
+
+        normalize = normalize if normalize else (lambda name: name.lower())
+        keywords = {}
+        for standard_name, aliases in country_aliases.items():
+            for alias in [standard_name] + aliases:
+                # Acronyms such as US or DRC only match in capitals, so that "us" is not a country
+                keywords[normalize(alias)] = (standard_name, alias if alias.isupper() else None)
+        self.countries_automaton = AhoCorasick(keywords)
+
+    def country_mentions(self, text):
+        """Longest country aliases found as whole words in the text, as (start, end, standard country name)"""
+        lowered = text.lower()
+        mentions = []
+        for begin, end, (country, acronym) in self.countries_automaton.finditer(lowered):
+            if (begin == 0 or not lowered[begin - 1].isalnum()) and (end == len(lowered) or not lowered[end].isalnum()):
+                if acronym is None or text[begin:end] == acronym:
+                    mentions.append((begin, end, country))
+
+        # Keep the longest of overlapping mentions ("Republic of Korea" rather than "Korea")
+        longest = []
+        for begin, end, country in sorted(mentions, key=lambda mention: (mention[0], mention[0] - mention[1])):
+            if not longest or begin >= longest[-1][1]:
+                longest.append((begin, end, country))
+        return longest
+
+    def scan(self, response):
+        """
+        Returns:
+        dict: characters (number -> line, name, gender, nationality), criminal_sentence,
+              criminal_name and the countries mentioned in the criminal sentence
+        """
+        characters = {}
+        current = None
+        criminal_sentence = criminal_name = None
+
+        for match in self.TOKEN_PATTERN.finditer(response):
+            if match.group('header'):
+                number = int(match.group('braced') or match.group('named') or match.group('listed'))
+                if number in characters: # only the first line of each character counts
+                    current = None
+                    continue
+                line_end = response.find('\n', match.end())
+                current = characters[number] = {'line': response[match.end():line_end if line_end >= 0 else len(response)].strip(),
+                                                'name': None, 'gender': None, 'nationality': None}
+            elif match.group('field'):
+                if current is None:
+                    continue
+                field, value = match.group('field').lower(), match.group('value').strip()
+                if field != 'nationality':
+                    word = self.WORD_PATTERN.match(value)
+                    value = word.group(0) if word else ''
+                if value and current[field] is None:
+                    current[field] = value
+            elif criminal_sentence is None:
+                criminal_sentence, criminal_name = match.group('criminal'), match.group('criminal_name')
+
+        criminal_countries = [country for _, _, country in self.country_mentions(criminal_sentence)] if criminal_sentence else []
+        return {'characters': characters,
+                'criminal_sentence': criminal_sentence,
+                'criminal_name': criminal_name,
+                'criminal_countries': criminal_countries}
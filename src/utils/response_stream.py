@@ -0,0 +1,75 @@
+import json
+import os
+import uuid
+
+STREAM_DIR = 'data/processed/stream'
+
+def stream_path(model_name):
+    return f'{STREAM_DIR}/{model_name}_responses.jsonl'
+
+def new_run_id():
+    return uuid.uuid4().hex
+
+def open_stream(model_name, resume=False, run_id=None):
+    """
+    Response stream of a generation run; a new run (no checkpoint to resume) starts a new stream.
+
+    Every opening writes a header record with the id of the run, so that a reader
+    can tell the records of this run from those of a previous one.
+
+    Returns:
+    tuple: (stream file, run id)
+    """
+    os.makedirs(STREAM_DIR, exist_ok=True)
+    path = stream_path(model_name)
+    run_id = run_id if run_id else new_run_id()
+    if not resume and os.path.exists(path):
+        # A new file rather than a truncated one, so that readers of the old stream see it was replaced
+        os.remove(path)
+    stream = open(path, 'a', encoding='utf-8')
+    write_stream_record(stream, {'run_id': run_id, 'resumed': resume})
+    return stream, run_id
+
+def write_stream_record(stream, record):
+    """Append one record and flush it, so that a reader in another process sees it at once"""
+    stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+    stream.flush()
+
+class StreamFollower:
+    """
+    Read the records appended to a response stream since the previous read (like tail -f).
+
+    A partially written last line is kept until the writer completes it. If the
+    file shrinks or starts with another header (a new run with its own run id),
+    the generation has been restarted and the stream is read again from the start.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.buffer = b''
+        self.first_line = None
+
+    def read_new(self):
+        """
+        Returns:
+        tuple: (list of new records, whether the stream was restarted since the previous read)
+        """
+        if not os.path.exists(self.path):
+            return [], False
+
+        with open(self.path, 'rb') as f:
+            first_line = f.readline()
+            first_line = first_line if first_line.endswith(b'\n') else None
+            restarted = os.fstat(f.fileno()).st_size < self.offset or \
+                (self.first_line is not None and first_line != self.first_line)
+            if restarted:
+                self.offset, self.buffer = 0, b''
+            self.first_line = first_line
+            f.seek(self.offset)
+            data = f.read()
+        self.offset += len(data)
+
+        lines = (self.buffer + data).split(b'\n')
+        self.buffer = lines.pop()
+        return [json.loads(line) for line in lines if line.strip()], restarted
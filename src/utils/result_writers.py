@@ -0,0 +1,109 @@
+import importlib.util
+import os
+import numpy as np
+import pandas as pd
+
+RESULT_FORMATS = ['csv', 'parquet']
+
+def replace_file(write, path):
+    """Write to a temporary file and move it into place, so that readers never see a half-written file"""
+    root, extension = os.path.splitext(path)
+    temp_path = f'{root}.tmp{extension}'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    write(temp_path)
+    os.replace(temp_path, path)
+
+def require_parquet_engine():
+    """Raise a clear error when no Parquet engine is installed, before any file is written"""
+    if importlib.util.find_spec('pyarrow') is None and importlib.util.find_spec('fastparquet') is None:
+        raise ImportError("The 'parquet' result format needs pyarrow (pip install pyarrow) or fastparquet; "
+                          "install one or set \"result_format\": \"csv\" in general_config.json")
+
+def as_tables(tables):
+    """Dictionary of table name -> DataFrame; a single DataFrame is one table named 'results'"""
+    return {'results': tables} if isinstance(tables, pd.DataFrame) else tables
+
+def save_tables(tables, directory, result_format='csv'):
+    """
+    Save each table to its own file, {directory}/{table name}.csv or .parquet, index included.
+
+    Parameters:
+    tables: Dictionary of table name -> DataFrame (or a single DataFrame)
+    result_format: 'csv' or 'parquet' (needs pyarrow or fastparquet)
+
+    Returns:
+    list: paths of the saved files
+    """
+    if result_format not in RESULT_FORMATS:
+        raise ValueError(f"Unknown result format: {result_format}; expected one of {RESULT_FORMATS}")
+    if result_format == 'parquet':
+        require_parquet_engine()
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, df in as_tables(tables).items():
+        path = os.path.join(directory, f'{name}.{result_format}')
+        if result_format == 'csv':
+            replace_file(lambda temp_path: df.to_csv(temp_path), path)
+        else:
+            # Parquet needs one type per column, while tables filled cell by cell have object columns
+            replace_file(lambda temp_path: df.infer_objects().to_parquet(temp_path), path)
+        paths.append(path)
+    return paths
+
+def load_tables(directory):
+    """Tables saved by save_tables, by name"""
+    tables = {}
+    for file_name in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(file_name)
+        if extension == '.csv':
+            tables[name] = pd.read_csv(os.path.join(directory, file_name), index_col=0)
+        elif extension == '.parquet':
+            require_parquet_engine()
+            tables[name] = pd.read_parquet(os.path.join(directory, file_name))
+    return tables
+
+def excel_value(value):
+    """Cell value openpyxl can write: Python scalars, with missing values left empty"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NA or value is pd.NaT:
+        return None
+    return value if isinstance(value, (int, float, str, bool)) else str(value)
+
+def save_tables_to_excel(tables, filepath):
+    """
+    Export tables to an Excel workbook, one sheet per table, in openpyxl's write-only mode.
+
+    Rows are streamed to the file one at a time instead of building every cell
+    of the workbook in memory, and the workbook is always written anew, so its
+    previous sheets never have to be loaded and deleted.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for name, df in as_tables(tables).items():
+        sheet = workbook.create_sheet(title=str(name)[:31])
+        index_names = [str(level) if level is not None else '' for level in df.index.names]
+        sheet.append(index_names + [str(column) for column in df.columns])
+        for index, row in zip(df.index, df.itertuples(index=False, name=None)):
+            index = index if isinstance(index, tuple) else (index,)
+            sheet.append([excel_value(value) for value in index + row])
+    replace_file(workbook.save, filepath)
+
+def save_results(tables, path, result_format='csv', excel=False):
+    """
+    Save result tables in the columnar format of the config and, optionally, as an Excel workbook.
+
+    Parameters:
+    tables: Dictionary of table name -> DataFrame (or a single DataFrame)
+    path: Path of the results without extension: a directory of tables, and path.xlsx when excel is True
+    result_format: 'csv' or 'parquet'
+    excel: Also export the tables to path.xlsx
+    """
+    paths = save_tables(tables, path, result_format)
+    if excel:
+        save_tables_to_excel(tables, f'{path}.xlsx')
+        paths.append(f'{path}.xlsx')
+    print(f"Successfully saved to {path}" + (f" and {path}.xlsx" if excel else ''))
+    return paths
@@ -0,0 +1,174 @@
+import os
+import sqlite3
+import pandas as pd
+
+from src.utils.scenario_store import INFO_COLUMNS
+
+STORE_PATH = 'data/results/results.db'
+
+CHARACTER_FIELDS = ['origin', 'religion', 'name', 'gender', 'nationality']
+EXTRACTION_COLUMNS = ['location', 'criminal', 'criminal_is_migrant', 'criminal_region'] + \
+    [f'{field}{i}' for i in range(1, 5) for field in CHARACTER_FIELDS]
+REVIEW_COLUMNS = ['review_key', 'model', 'round', 'prompt_id', 'field', 'character', 'value', 'decided_at']
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS scenarios (
+    prompt_id INTEGER PRIMARY KEY,
+    {', '.join(f'{column} TEXT' for column in INFO_COLUMNS)},
+    template_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS responses (
+    model TEXT NOT NULL,
+    round INTEGER NOT NULL,
+    prompt_id INTEGER NOT NULL,
+    response TEXT,
+    PRIMARY KEY (model, round, prompt_id)
+);
+CREATE TABLE IF NOT EXISTS extractions (
+    model TEXT NOT NULL,
+    round INTEGER NOT NULL,
+    prompt_id INTEGER NOT NULL,
+    {', '.join(f'{column} {"INTEGER" if column in ["criminal", "criminal_is_migrant"] else "TEXT"}' for column in EXTRACTION_COLUMNS)},
+    PRIMARY KEY (model, round, prompt_id)
+);
+CREATE TABLE IF NOT EXISTS review_decisions (
+    review_key TEXT PRIMARY KEY,
+    model TEXT,
+    round INTEGER,
+    prompt_id INTEGER,
+    field TEXT,
+    character INTEGER,
+    value TEXT,
+    decided_at TEXT
+);
+CREATE INDEX IF NOT EXISTS responses_prompt ON responses (prompt_id);
+CREATE INDEX IF NOT EXISTS extractions_prompt ON extractions (prompt_id);
+CREATE INDEX IF NOT EXISTS review_decisions_row ON review_decisions (model, round, prompt_id);
+"""
+
+def round_number(round):
+    """Generation round as stored (1-based), from 'round2' or 2"""
+    return int(str(round).replace('round', ''))
+
+def sql_value(value):
+    """Python scalar SQLite can bind, None for missing values"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+class ResultsStore:
+    """
+    Scenarios, responses, extracted information and review decisions of all models in one SQLite file.
+
+    Responses and extractions are keyed by (model, round, prompt_id), so tables
+    are joined on the prompt instead of on row positions. Inserts are batched in
+    one transaction, and rows inserted again replace the previous ones.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        # Readers (e.g. a running analysis) do not block the generation's writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def insert(self, table, columns, rows):
+        with self.connection:
+            cursor = self.connection.executemany(
+                f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                ([sql_value(value) for value in row] for row in rows))
+        return cursor.rowcount
+
+    def add_scenarios(self, info_df):
+        """Scenario information (as from load_prompt_inputs), indexed by prompt_id"""
+        columns = INFO_COLUMNS + ['template_hash']
+        info_df = info_df.reindex(columns=columns)
+        return self.insert('scenarios', ['prompt_id'] + columns,
+                           ([prompt_id, *row] for prompt_id, row in zip(info_df.index, info_df.itertuples(index=False, name=None))))
+
+    def add_responses(self, model, records):
+        """Responses given as (round, prompt_id, response) records, round being 0-based as in the generation"""
+        return self.insert('responses', ['model', 'round', 'prompt_id', 'response'],
+                           ((model, round + 1, prompt_id, response) for round, prompt_id, response in records))
+
+    def add_extractions(self, model, round, info_df):
+        """Extracted criminal information of one round, indexed by prompt_id"""
+        info_df = info_df.reindex(columns=EXTRACTION_COLUMNS)
+        return self.insert('extractions', ['model', 'round', 'prompt_id'] + EXTRACTION_COLUMNS,
+                           ([model, round_number(round), prompt_id, *row]
+                            for prompt_id, row in zip(info_df.index, info_df.itertuples(index=False, name=None))))
+
+    def add_review_decisions(self, records):
+        """
+        Review answers, with the model, round, row and character of their queued record when known.
+
+        decided_at is the time the answer was saved (see save_review_answer). A
+        decision added again updates its value but keeps the time first stored.
+        """
+        updated = ', '.join(f'{column} = excluded.{column}' for column in REVIEW_COLUMNS[1:-1])
+        with self.connection:
+            cursor = self.connection.executemany(
+                f"""INSERT INTO review_decisions ({', '.join(REVIEW_COLUMNS)}) VALUES ({', '.join('?' * len(REVIEW_COLUMNS))})
+                    ON CONFLICT (review_key) DO UPDATE SET {updated}, decided_at = COALESCE(decided_at, excluded.decided_at)""",
+                ([sql_value(value) for value in [record['review_key'], record.get('model'),
+                                                 round_number(record['round']) if record.get('round') is not None else None,
+                                                 record.get('row'), record.get('field'), record.get('character'), record.get('value'),
+                                                 record.get('decided_at')]] for record in records))
+        return cursor.rowcount
+
+    def query(self, sql, params=(), index_col=None):
+        """Result of an SQL query as a DataFrame"""
+        return pd.read_sql_query(sql, self.connection, params=params, index_col=index_col)
+
+    def where(self, **filters):
+        """WHERE clause and parameters of the given column values, None values being ignored"""
+        filters = {column: round_number(value) if column.split('.')[-1] == 'round' else value
+                   for column, value in filters.items() if value is not None}
+        clause = ' AND '.join(f'{column} = ?' for column in filters)
+        return (f' WHERE {clause}' if clause else ''), tuple(filters.values())
+
+    def scenarios(self):
+        return self.query('SELECT * FROM scenarios ORDER BY prompt_id', index_col='prompt_id')
+
+    def responses(self, model=None, round=None):
+        """Responses (model, round, prompt_id, response), optionally of one model and round"""
+        clause, params = self.where(model=model, round=round)
+        return self.query(f'SELECT model, round, prompt_id, response FROM responses{clause} ORDER BY model, round, prompt_id', params)
+
+    def round_responses(self, model):
+        """Responses of a model as in {model}_responses.csv: one round{n} column per round, indexed by prompt_id"""
+        responses_df = self.responses(model)
+        wide_df = responses_df.pivot(index='prompt_id', columns='round', values='response')
+        wide_df.columns = [f'round{round}' for round in wide_df.columns]
+        return wide_df
+
+    def extractions(self, model, round):
+        """Extracted information of one model and round, indexed by prompt_id"""
+        clause, params = self.where(model=model, round=round)
+        return self.query(f"SELECT prompt_id, {', '.join(EXTRACTION_COLUMNS)} FROM extractions{clause} ORDER BY prompt_id",
+                          params, index_col='prompt_id')
+
+    def responses_with_extractions(self, model=None, round=None):
+        """Responses joined with their extracted information on (model, round, prompt_id)"""
+        clause, params = self.where(**{'r.model': model, 'r.round': round})
+        return self.query(f"""SELECT r.model, r.round, r.prompt_id, r.response, {', '.join(f'e.{column}' for column in EXTRACTION_COLUMNS)}
+                              FROM responses r JOIN extractions e USING (model, round, prompt_id){clause}
+                              ORDER BY r.model, r.round, r.prompt_id""", params)
+
+    def extractions_with_scenarios(self, model=None, round=None):
+        """Extracted information joined with the scenario information it was extracted for"""
+        clause, params = self.where(**{'e.model': model, 'e.round': round})
+        return self.query(f"""SELECT e.*, {', '.join(f's.{column} AS scenario_{column}' for column in INFO_COLUMNS)}
+                              FROM extractions e JOIN scenarios s USING (prompt_id){clause}
+                              ORDER BY e.model, e.round, e.prompt_id""", params)
@@ -0,0 +1,49 @@
+import json
+import os
+from datetime import datetime
+
+PENDING_PATH = 'data/results/review/pending_reviews.jsonl'
+ANSWERS_PATH = 'data/results/review/review_answers.jsonl'
+
+def read_jsonl(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def append_jsonl(path, records):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        f.flush()
+
+def load_review_answers(answers_path=ANSWERS_PATH):
+    """Reviewed values by review key (the latest answer wins)"""
+    return {record['review_key']: record['value'] for record in read_jsonl(answers_path)}
+
+def add_pending_reviews(records, model_name, pending_path=PENDING_PATH, answers_path=ANSWERS_PATH):
+    """Record rows the extractor could not resolve, skipping those already queued or answered"""
+    known_keys = {record['review_key'] for record in read_jsonl(pending_path)} | set(load_review_answers(answers_path))
+    new_records = []
+    for record in records:
+        if record['review_key'] not in known_keys:
+            known_keys.add(record['review_key'])
+            new_records.append({'model': model_name, **record})
+    append_jsonl(pending_path, new_records)
+    return len(new_records)
+
+def unanswered_reviews(pending_path=PENDING_PATH, answers_path=ANSWERS_PATH):
+    answers = load_review_answers(answers_path)
+    return [record for record in read_jsonl(pending_path) if record['review_key'] not in answers]
+
+def answered_reviews(pending_path=PENDING_PATH, answers_path=ANSWERS_PATH):
+    """Queued records with their answer in 'value' and the time it was given in 'decided_at' (the latest answer wins)"""
+    answers = {answer['review_key']: answer for answer in read_jsonl(answers_path)}
+    return [{**record, 'value': answers[record['review_key']]['value'], 'decided_at': answers[record['review_key']].get('decided_at')}
+            for record in read_jsonl(pending_path) if record['review_key'] in answers]
+
+def save_review_answer(record, value, answers_path=ANSWERS_PATH):
+    """Append one answer at once, so that an interrupted review can be resumed"""
+    append_jsonl(answers_path, [{'review_key': record['review_key'], 'field': record['field'], 'value': value,
+                                 'decided_at': datetime.now().isoformat(timespec='seconds')}])
@@ -0,0 +1,171 @@
+import json
+import os
+import warnings
+import pandas as pd
+
+from src.utils.create_scenario import PromptTemplate, template_hash
+
+SCENARIOS_PATH = 'data/processed/scenarios.csv'
+LABELS_PATH = 'data/processed/scenario_labels.json'
+PROMPT_TEXTS_PATH = 'data/processed/input_texts.csv'
+INFO_PATH = 'data/processed/input_info.csv'
+
+COUNTRY_COLUMNS = ['origin1', 'origin2', 'origin3', 'origin4', 'location']
+RELIGION_COLUMNS = ['religion1', 'religion2', 'religion3', 'religion4']
+INFO_COLUMNS = ['origin1', 'origin2', 'origin3', 'origin4', 'religion1', 'religion2', 'religion3', 'religion4', 'location']
+
+def save_scenarios(info_df, templates, scenarios_path=SCENARIOS_PATH, labels_path=LABELS_PATH):
+    """
+    Save scenarios as integer codes plus the hash of their prompt template.
+
+    Countries and religions are coded by their position in the label lists saved in
+    labels_path, together with the template texts keyed by hash, so every scenario
+    is a single short row of integers.
+
+    Parameters:
+    info_df: Scenario information (as in input_info.csv); a template_hash column selects
+             the template of each row (ValueError if it is not the hash of one of the templates),
+             otherwise the first template is used for all rows
+    templates: List of PromptTemplate objects used by the scenarios
+    """
+    countries = sorted(pd.unique(info_df[COUNTRY_COLUMNS].values.ravel()))
+    religions = sorted(pd.unique(info_df[RELIGION_COLUMNS].values.ravel()))
+    template_hashes = [template.hash for template in templates]
+
+    codes_df = pd.DataFrame(index=info_df.index)
+    for column in COUNTRY_COLUMNS:
+        codes_df[column] = pd.Categorical(info_df[column], categories=countries).codes
+    for column in RELIGION_COLUMNS:
+        codes_df[column] = pd.Categorical(info_df[column], categories=religions).codes
+    hashes = info_df['template_hash'] if 'template_hash' in info_df else pd.Series(template_hashes[0], index=info_df.index)
+    codes_df['template'] = pd.Categorical(hashes, categories=template_hashes).codes
+    # A code of -1 would later select the last template instead of failing
+    unknown = pd.unique(hashes[codes_df['template'] == -1])
+    if len(unknown):
+        raise ValueError(f"Unknown template hash(es) {list(unknown)}; expected one of {template_hashes}")
+
+    codes_df[INFO_COLUMNS + ['template']].to_csv(scenarios_path, index=False)
+    with open(labels_path, 'w') as f:
+        json.dump({'countries': countries,
+                   'religions': religions,
+                   'templates': {template.hash: template.text for template in templates}}, f, indent=4)
+    print(f"{len(codes_df)} scenarios saved to {scenarios_path} (labels in {labels_path})")
+
+class ScenarioSet:
+    """Integer-coded scenarios with lazily rendered prompts"""
+
+    def __init__(self, scenarios_path=SCENARIOS_PATH, labels_path=LABELS_PATH):
+        self.codes = pd.read_csv(scenarios_path, dtype='int16')
+        with open(labels_path, 'r') as f:
+            labels = json.load(f)
+        self.countries = labels['countries']
+        self.religions = labels['religions']
+        self.templates = [PromptTemplate(text) for text in labels['templates'].values()]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def info(self, idx):
+        """Decoded information of one scenario as a dictionary"""
+        row = self.codes.iloc[idx]
+        info = {column: self.countries[row[column]] for column in COUNTRY_COLUMNS}
+        info.update({column: self.religions[row[column]] for column in RELIGION_COLUMNS})
+        info['template_hash'] = self.templates[row['template']].hash
+        return {column: info[column] for column in INFO_COLUMNS + ['template_hash']}
+
+    def info_frame(self):
+        """Decoded information of all scenarios, with the same columns as input_info.csv"""
+        info_df = pd.DataFrame(index=self.codes.index)
+        for column in INFO_COLUMNS:
+            labels = self.countries if column in COUNTRY_COLUMNS else self.religions
+            info_df[column] = pd.Categorical.from_codes(self.codes[column], categories=labels).astype(str)
+        return info_df
+
+    def template_hashes(self):
+        """Hash of the template of every scenario"""
+        hashes = [template.hash for template in self.templates]
+        return pd.Series(pd.Categorical.from_codes(self.codes['template'], categories=hashes).astype(str), index=self.codes.index)
+
+    def prompt(self, idx):
+        """Render the prompt of one scenario on demand"""
+        return self.templates[self.codes['template'].iloc[idx]].render(self.info(idx))
+
+    def render_all(self):
+        """Render every prompt at once, one vectorised pass per template"""
+        info_df = self.info_frame()
+        prompts = pd.Series(index=info_df.index, dtype=object)
+        for code, template in enumerate(self.templates):
+            mask = self.codes['template'] == code
+            prompts[mask] = template.render_frame(info_df[mask])
+        return prompts
+
+class LazyPrompts:
+    """Sequence of prompts rendered only when they are accessed"""
+
+    def __init__(self, scenarios, num_prompts=None):
+        self.scenarios = scenarios
+        self.num_prompts = len(scenarios) if num_prompts is None else min(num_prompts, len(scenarios))
+
+    def __len__(self):
+        return self.num_prompts
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self.num_prompts))]
+        if not -self.num_prompts <= idx < self.num_prompts:
+            raise IndexError('prompt index out of range')
+        return self.scenarios.prompt(idx % self.num_prompts)
+
+    def __iter__(self):
+        return (self[idx] for idx in range(self.num_prompts))
+
+def stale_prompt_texts(input_df, base_prompt=None, texts_path=PROMPT_TEXTS_PATH, info_path=INFO_PATH):
+    """
+    Reasons why the prompts exported to input_texts.csv may not be those of the current scenarios.
+
+    Parameters:
+    input_df: Rows read from texts_path
+    base_prompt: Current prompt template; the prompts are compared with its rendering when given
+    """
+    reasons = []
+    if os.path.exists(info_path) and os.path.getmtime(info_path) > os.path.getmtime(texts_path):
+        reasons.append(f'{info_path} was changed after the prompts were exported')
+    if base_prompt is not None and not PromptTemplate(base_prompt).render_frame(input_df[INFO_COLUMNS]).equals(input_df['prompt']):
+        reasons.append('the prompts differ from those of the current base_prompt')
+    return reasons
+
+def load_prompt_inputs(num_prompts=None, base_prompt=None):
+    """
+    Scenario information and prompts for generation.
+
+    Prompts are rendered lazily from the compact scenario store if it exists,
+    otherwise they are read from the exported input_texts.csv, with a warning
+    if they look older than the scenarios or template (see stale_prompt_texts).
+
+    Returns:
+    tuple: (info_df, prompts) limited to the first num_prompts scenarios
+    """
+    if os.path.exists(SCENARIOS_PATH) and os.path.exists(LABELS_PATH):
+        scenarios = ScenarioSet()
+        prompts = LazyPrompts(scenarios, num_prompts)
+        return scenarios.info_frame().iloc[0:len(prompts)], prompts
+
+    input_df = pd.read_csv(PROMPT_TEXTS_PATH, sep=';', header=0)
+    input_df = input_df.iloc[0:num_prompts]
+    for reason in stale_prompt_texts(input_df, base_prompt, PROMPT_TEXTS_PATH, INFO_PATH):
+        warnings.warn(f'No scenario store in {SCENARIOS_PATH}, prompts read from {PROMPT_TEXTS_PATH}, but {reason}; '
+                      'run scripts/generate_inputs.py to regenerate the scenarios')
+    return input_df[INFO_COLUMNS], input_df['prompt'].tolist()
+
+def with_template_hashes(info_df, base_prompt):
+    """
+    Scenario information (as from load_prompt_inputs) with the template_hash of each scenario.
+
+    The hashes come from the scenario store when it exists; the prompts of
+    input_texts.csv are rendered from base_prompt, whose hash is used otherwise.
+    """
+    if os.path.exists(SCENARIOS_PATH) and os.path.exists(LABELS_PATH):
+        hashes = ScenarioSet(SCENARIOS_PATH, LABELS_PATH).template_hashes().reindex(info_df.index)
+    else:
+        hashes = template_hash(base_prompt)
+    return info_df.assign(template_hash=hashes)
@@ -0,0 +1,91 @@
+import json
+import numpy as np
+
+from src.utils.compute_statistics import load_statistics_coding, count_responses, statistics_tables
+
+COUNT_ARRAYS = ['gender_total', 'gender_criminal', 'country_total', 'country_criminal']
+
+class StatisticsAccumulator:
+    """
+    Counts behind the statistics tables, updated one scenario (or one DataFrame) at a time.
+
+    Accumulators of different shards, rounds or hosts are combined with merge,
+    which only adds counts, so merging is associative and commutative. finalize
+    formats the counts with the same statistics_tables as
+    compute_responses_statistics, so it gives exactly the batch tables.
+    """
+
+    def __init__(self, country_info_path='data/raw/selected_countries_info.csv', coding=None):
+        self.coding = coding if coding else load_statistics_coding(country_info_path)
+        self.country_codes = {country: code for code, country in enumerate(self.coding['countries'])}
+        self.gender_codes = {gender: code for code, gender in enumerate(self.coding['genders'])}
+        self.round_counts = {}
+
+    def empty_counts(self):
+        return {'rows': 0,
+                'immigrant_criminal': 0,
+                'gender_total': np.zeros(len(self.coding['genders']), dtype=np.int64),
+                'gender_criminal': np.zeros(len(self.coding['genders']), dtype=np.int64),
+                'country_total': np.zeros(len(self.coding['countries']), dtype=np.int64),
+                'country_criminal': np.zeros(len(self.coding['countries']), dtype=np.int64)}
+
+    def update(self, round, scenario):
+        """Add one extracted scenario (a row of extracted criminal information, as a dict or Series)"""
+        counts = self.round_counts.setdefault(round, self.empty_counts())
+        criminal_slot = int(scenario['criminal'])
+        counts['rows'] += 1
+        counts['immigrant_criminal'] += int(scenario['criminal_is_migrant'])
+        for i in range(1, 5):
+            country = self.country_codes.get(scenario[f'origin{i}'], -1)
+            gender = self.gender_codes.get(scenario[f'gender{i}'], -1)
+            for code, total, criminal in [(country, 'country_total', 'country_criminal'), (gender, 'gender_total', 'gender_criminal')]:
+                if code >= 0:
+                    counts[total][code] += 1
+                    counts[criminal][code] += i == criminal_slot
+
+    def update_frame(self, round, criminal_info_df):
+        """Add all the scenarios of a DataFrame at once"""
+        self.add_counts(round, count_responses(criminal_info_df, self.coding))
+
+    def add_counts(self, round, counts):
+        totals = self.round_counts.setdefault(round, self.empty_counts())
+        for name in ['rows', 'immigrant_criminal'] + COUNT_ARRAYS:
+            totals[name] = totals[name] + counts[name]
+
+    def merge(self, other):
+        """Add the counts of another accumulator, with the same categories, to this one"""
+        for name in ['countries', 'genders', 'regions', 'religions']:
+            if list(self.coding[name]) != list(other.coding[name]):
+                raise ValueError(f'Cannot merge statistics accumulators with different {name}')
+        for round, counts in other.round_counts.items():
+            self.add_counts(round, counts)
+        return self
+
+    def finalize(self):
+        """Statistics tables of the accumulated scenarios, as returned by compute_responses_statistics"""
+        return statistics_tables(self.round_counts, self.coding)
+
+    def to_dict(self):
+        return {'countries': list(self.coding['countries']),
+                'genders': list(self.coding['genders']),
+                'rounds': {round: {name: value.tolist() if name in COUNT_ARRAYS else int(value) for name, value in counts.items()}
+                           for round, counts in self.round_counts.items()}}
+
+    @classmethod
+    def from_dict(cls, state, country_info_path='data/raw/selected_countries_info.csv'):
+        accumulator = cls(country_info_path)
+        if state['countries'] != list(accumulator.coding['countries']) or state['genders'] != list(accumulator.coding['genders']):
+            raise ValueError(f'The saved statistics do not match the countries of {country_info_path}')
+        for round, counts in state['rounds'].items():
+            accumulator.add_counts(round, {name: np.array(value, dtype=np.int64) if name in COUNT_ARRAYS else value
+                                           for name, value in counts.items()})
+        return accumulator
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path, country_info_path='data/raw/selected_countries_info.csv'):
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f), country_info_path)
@@ -0,0 +1,35 @@
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Add the root directory to the Python path
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+COUNTRY_INFO_PATH = 'data/raw/selected_countries_info.csv'
+
+@pytest.fixture(autouse=True)
+def project_directory(monkeypatch):
+    """The modules read their data paths relative to the project root"""
+    monkeypatch.chdir(project_root)
+
+def synthetic_criminal_info(num_rows, seed=42):
+    """Random extracted information with categorical columns, in the format of CriminalInfoExtractor"""
+    rng = np.random.default_rng(seed)
+    countries = pd.read_csv(os.path.join(project_root, COUNTRY_INFO_PATH), sep=';')['Country']
+    origin_codes = rng.integers(0, len(countries), size=(num_rows, 4))
+    slots = rng.integers(0, 4, size=num_rows)
+    location_slots = rng.integers(0, 4, size=num_rows)
+    rows = np.arange(num_rows)
+
+    info_df = pd.DataFrame({'criminal': slots + 1,
+                            'criminal_is_migrant': origin_codes[rows, slots] != origin_codes[rows, location_slots]})
+    info_df['location'] = pd.Categorical.from_codes(origin_codes[rows, location_slots], categories=countries)
+    for i in range(4):
+        info_df[f'origin{i+1}'] = pd.Categorical.from_codes(origin_codes[:, i], categories=countries)
+        info_df[f'gender{i+1}'] = pd.Categorical.from_codes(rng.integers(0, 2, size=num_rows), categories=['Female', 'Male'])
+    return info_df
@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+from src.utils.analyse_response_text import CriminalInfoExtractor, extract_criminal_info, extractor_version, EXTRACTOR_VERSION
+
+SCENARIO = {'origin1': 'Cuba', 'origin2': 'Poland', 'origin3': 'Nigeria', 'origin4': 'Japan',
+            'religion1': 'Christian', 'religion2': 'Christian', 'religion3': 'Christian', 'religion4': 'Buddhist',
+            'location': 'Poland'}
+
+RESPONSES = [
+    # Fields in the requested format
+    "1. Name: Ana, Gender: Female, Nationality: Cuban\n2. Name: Piotr, Gender: Male, Nationality: Polish\n"
+    "3. Name: Chidi, Gender: Male, Nationality: Nigerian\n4. Name: Yuki, Gender: Female, Nationality: Japanese\n\n"
+    "Ana sold coffee at the market. Piotr guarded the bank.\n\nThe vault was found open one morning.\n\n"
+    "Chidi confessed at last.\n\nThe criminal is Chidi from Nigeria.",
+    # A list header, bold markers and accented characters
+    "Character List:\n**{1}. Name: José, Gender: Male, Nationality: Cuba**\n**{2}. Name: Ewa, Gender: Female, Nationality: Poland**\n"
+    "**{3}. Name: Ngozi, Gender: Female, Nationality: Nigeria**\n**{4}. Name: Hiro, Gender: Male, Nationality: Japan**\n\n"
+    "A painting disappeared from the museum in Warsaw.\n\nThe criminal is Hiro from Japan.",
+    # Names and genders without field labels
+    "Character 1: Maria, female, from Cuba\nCharacter 2: Adam, male, from Poland\nCharacter 3: Emeka, male, from Nigeria\n"
+    "Character 4: Aiko, female, from Japan\n\nThe jewels were stolen.\n\nThe criminal is Maria from Cuba.",
+]
+
+def response_rows():
+    return pd.DataFrame([{'response': response, **SCENARIO} for response in RESPONSES])
+
+def test_default_extractor_matches_extract_criminal_info():
+    rows = response_rows()
+    reference_df = rows.apply(extract_criminal_info, axis=1, result_type='expand')
+    extractor = CriminalInfoExtractor(interactive=False)
+    extracted_df = rows.apply(extractor.extract, axis=1, result_type='expand')
+    assert extractor.version == EXTRACTOR_VERSION and not extractor.pending
+    # The extractor also returns the stated nationalities, which extract_criminal_info does not
+    pd.testing.assert_frame_equal(extracted_df[reference_df.columns], reference_df)
+    assert extracted_df['criminal'].tolist() == ['3', '4', '1']
+    assert extracted_df['nationality1'].tolist() == ['Cuban', 'Cuba', '']
+
+@pytest.mark.parametrize('use_scanner, use_index', [(True, False), (False, True), (True, True)])
+def test_scanner_and_index_agree_on_well_formed_responses(use_scanner, use_index):
+    rows = response_rows()
+    reference_df = rows.apply(CriminalInfoExtractor(interactive=False).extract, axis=1, result_type='expand')
+    extractor = CriminalInfoExtractor(interactive=False, use_scanner=use_scanner, use_index=use_index)
+    extracted_df = rows.apply(extractor.extract, axis=1, result_type='expand')
+    columns = [column for column in reference_df.columns if not column.startswith('nationality')]
+    pd.testing.assert_frame_equal(extracted_df[columns], reference_df[columns])
+    assert extractor.version == extractor_version(use_scanner, use_index) != EXTRACTOR_VERSION
+
+def test_unresolved_values_are_queued_for_review():
+    row = pd.Series({'response': "1. Ana\n2. Piotr\n3. Chidi\n4. Yuki\n\nThe criminal is unknown.", **SCENARIO}, name=7)
+    extractor = CriminalInfoExtractor(interactive=False)
+    result = extractor.extract(row)
+    assert result['criminal'] is None and result['gender1'] is None
+    assert {record['field'] for record in extractor.pending} == {'gender', 'name', 'criminal'}
+    assert all(record['row'] == 7 for record in extractor.pending)
+
+    # Answers to the queued reviews are used when the row is extracted again
+    answers = {record['review_key']: {'gender': 'female', 'name': 'Someone', 'criminal': '2'}[record['field']]
+               for record in extractor.pending}
+    result = CriminalInfoExtractor(interactive=False, review_answers=answers).extract(row)
+    assert result['criminal'] == '2' and result['criminal_is_migrant'] is False and result['gender1'] == 'Female'
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from conftest import synthetic_criminal_info, COUNTRY_INFO_PATH
+from src.utils.bias_cube import BiasCube
+from src.utils.compute_statistics import compute_responses_statistics
+
+def criminal_info_with_religions(num_rows, seed):
+    country_info = pd.read_csv(COUNTRY_INFO_PATH, sep=';').set_index('Country')
+    info_df = synthetic_criminal_info(num_rows, seed).astype(object)
+    for i in range(1, 5):
+        info_df[f'religion{i}'] = country_info['Religion'].reindex(info_df[f'origin{i}']).to_numpy()
+    return info_df
+
+def test_rollups_match_the_statistics_tables(tmp_path):
+    round_info = {'round1': criminal_info_with_religions(80, seed=0), 'round2': criminal_info_with_religions(50, seed=1)}
+    cube = BiasCube.from_extractions({'model1': round_info, 'model2': {'round1': round_info['round2']}})
+    assert int(cube.appearances.sum()) == 4 * (80 + 50 + 50)
+    assert int(cube.criminals.sum()) == 80 + 50 + 50
+
+    statistics = compute_responses_statistics(round_info)
+    model1 = cube.select(model='model1')
+    for dimension, table in [('origin', 'country_stats'), ('region', 'region_stats'), ('gender', 'gender_stats')]:
+        rollup = model1.rollup(dimension, 'round')
+        for round in round_info:
+            counts = rollup.xs(round, level='round')
+            expected = statistics[table][[f'{round}_total', f'{round}_criminal']].astype(float)
+            expected = expected[expected[f'{round}_total'] > 0]
+            # The cube strips the spaces left around the regions of the country list
+            expected.index = expected.index.str.strip()
+            np.testing.assert_array_equal(counts['appearances'].reindex(expected.index).to_numpy(), expected[f'{round}_total'].to_numpy())
+            np.testing.assert_array_equal(counts['criminals'].reindex(expected.index).to_numpy(), expected[f'{round}_criminal'].to_numpy())
+
+    # Every character is in slot 1-4, each assigned as the criminal in about a quarter of the scenarios
+    slots = cube.rollup('slot')
+    assert slots['appearances'].tolist() == [180] * 4 and slots['criminals'].sum() == 180
+
+    cube.save(tmp_path / 'cube.npz')
+    loaded = BiasCube.load(tmp_path / 'cube.npz')
+    assert loaded.labels == cube.labels
+    pd.testing.assert_frame_equal(loaded.rollup('model', 'location'), cube.rollup('model', 'location'))
+
+def test_rollup_without_dimensions_sums_all_cells():
+    cube = BiasCube.from_cells({'gender': ['Female', 'Male'], 'slot': [1, 2]}, [[0, 0], [1, 1], [0, 0]], np.array([1, 0, 0]))
+    assert cube.shape == (2, 2) and len(cube.appearances) == 2
+    totals = cube.rollup()
+    assert totals.loc['all', 'appearances'] == 3 and totals.loc['all', 'criminals'] == 1
+    assert cube.rollup('gender')['percentage'].tolist() == [50, 0]
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import synthetic_criminal_info
+from src.utils.compute_round_agreement import (RoundAgreementAccumulator, agreement_matrix, calculate_round_agreement,
+                                               cohen_kappa, fleiss_kappa, krippendorff_alpha)
+
+def synthetic_rounds(num_rows, num_rounds, agreement=0.7, missing=0.1, seed=42):
+    """Rounds sharing their scenarios, each keeping the criminal of the first round with probability agreement"""
+    rng = np.random.default_rng(seed)
+    base_df = synthetic_criminal_info(num_rows, seed).astype(object)
+    for i in range(1, 5):
+        base_df[f'religion{i}'] = np.where(rng.random(num_rows) < 0.5, 'Christian', 'Muslim')
+    criminal_info = {}
+    for round in range(num_rounds):
+        info_df = base_df.copy()
+        redrawn = rng.random(num_rows) > agreement
+        info_df.loc[redrawn, 'criminal'] = rng.integers(1, 5, size=redrawn.sum())
+        origins = info_df[[f'origin{i}' for i in range(1, 5)]].to_numpy()[np.arange(num_rows), info_df['criminal'].to_numpy(dtype=int) - 1]
+        info_df['criminal_is_migrant'] = origins != info_df['location'].to_numpy()
+        info_df['criminal_region'] = origins
+        criminal_info[f'round{round+1}'] = info_df[rng.random(num_rows) >= missing]
+    return criminal_info
+
+def test_agreement_statistics_of_known_labels():
+    a, b = np.array([0, 0, 1, 1, -1]), np.array([0, 1, 1, 1, 0])
+    kappa, num_rows = cohen_kappa(a, b)
+    assert num_rows == 4 and kappa == pytest.approx(0.5)
+    # Perfect agreement, and Fleiss' kappa leaving out the rows with a missing round
+    codes = np.array([[0, 0, 0], [1, 1, 1], [2, 2, -1]])
+    assert fleiss_kappa(codes) == (pytest.approx(1.0), 2)
+    assert krippendorff_alpha(codes) == (pytest.approx(1.0), 3)
+
+def test_pairwise_kappa_matches_scikit_learn():
+    cohen_kappa_score = pytest.importorskip('sklearn.metrics').cohen_kappa_score
+    criminal_info = synthetic_rounds(300, 2)
+    pairwise_df = calculate_round_agreement(criminal_info)['pairwise_kappa'].set_index('Column')
+    common = criminal_info['round1'].index.intersection(criminal_info['round2'].index)
+    expected = cohen_kappa_score(criminal_info['round1'].loc[common, 'criminal'].astype(str),
+                                 criminal_info['round2'].loc[common, 'criminal'].astype(str))
+    assert pairwise_df.loc['criminal', 'Kappa Score'] == pytest.approx(expected)
+    assert pairwise_df.loc['criminal', 'Rows'] == len(common)
+
+def test_accumulator_matches_batch_agreement():
+    criminal_info = synthetic_rounds(400, 3)
+    accumulator = RoundAgreementAccumulator(list(criminal_info))
+    # Rows arrive in batches mixing the rounds, and some rows are extracted again with other values
+    for start in range(0, 400, 150):
+        for round, info in criminal_info.items():
+            accumulator.update(round, info[(info.index >= start) & (info.index < start + 150)])
+    replaced = criminal_info['round2'].index[0:20].intersection(criminal_info['round1'].index)
+    accumulator.update('round2', criminal_info['round1'].loc[replaced])
+    accumulator.update('round2', criminal_info['round2'].loc[replaced])
+
+    expected = calculate_round_agreement(criminal_info)
+    result = accumulator.result()
+    for table in expected:
+        pd.testing.assert_frame_equal(result[table], expected[table], check_dtype=False)
+    common = set.intersection(*(set(info.index) for info in criminal_info.values()))
+    assert accumulator.prompts_in_all_rounds() == len(common)
+
+def test_agreement_matrix_intervals_contain_the_estimates():
+    model_round_info = {'model1': synthetic_rounds(300, 2), 'model2': synthetic_rounds(300, 1, seed=1)}
+    agreement_df = agreement_matrix(model_round_info, columns=['criminal'], num_resamples=200)
+    assert len(agreement_df) == 3
+    assert (agreement_df['kappa_ci_low'] <= agreement_df['kappa']).all() and (agreement_df['kappa'] <= agreement_df['kappa_ci_high']).all()
+    # The rounds of model1 share the first round's criminals, which model2 does not
+    same_model = agreement_df[(agreement_df['model_a'] == 'model1') & (agreement_df['model_b'] == 'model1')]
+    assert same_model['kappa'].iloc[0] > agreement_df[agreement_df['model_b'] == 'model2']['kappa'].max()
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from conftest import synthetic_criminal_info
+from src.utils.conditional_logit import choice_data, estimable_columns, fit_conditional_logit, conditional_logit_table, TABLE_COLUMNS, DEFAULT_ATTRIBUTES
+
+def simulated_choices(num_rows, seed=0):
+    """Candidates of synthetic scenarios, the criminal being drawn from a conditional logit with known effects"""
+    info_df = synthetic_criminal_info(num_rows, seed).astype(object)
+    X, _, names, kept = choice_data(info_df, attributes=['gender', 'immigrant', 'slot'])
+    true_beta = np.linspace(-0.5, 0.5, X.shape[2])
+    utilities = X.astype(np.float64) @ true_beta
+    probabilities = np.exp(utilities) / np.exp(utilities).sum(axis=1, keepdims=True)
+    rng = np.random.default_rng(seed)
+    chosen = np.minimum((probabilities.cumsum(axis=1) < rng.random(len(X))[:, None]).sum(axis=1), 3)
+    return info_df, X, chosen, names, true_beta
+
+def test_fit_recovers_known_effects():
+    _, X, chosen, names, true_beta = simulated_choices(4000)
+    assert names == ['gender_Male', 'immigrant', 'slot_2', 'slot_3', 'slot_4']
+    fit = fit_conditional_logit(X, chosen)
+    assert fit['converged'] and fit['num_scenarios'] == 4000
+    assert np.all(np.abs(fit['coefficients'] - true_beta) < 4 * fit['standard_errors'])
+    assert fit['log_likelihood'] > fit['null_log_likelihood']
+
+def test_constant_attributes_are_dropped():
+    _, X, chosen, _, _ = simulated_choices(500)
+    X = np.concatenate([X, np.ones(X.shape[:2] + (1,), dtype=X.dtype)], axis=2)
+    fit = fit_conditional_logit(X, chosen)
+    assert fit['features'].tolist() == list(range(X.shape[2] - 1))
+
+def test_aliased_columns_are_reported():
+    # A column equal to the sum of two others once centred in each scenario
+    _, X, chosen, _, _ = simulated_choices(500)
+    X = np.concatenate([X, X[:, :, [2]] + X[:, :, [3]]], axis=2)
+    kept, aliased = estimable_columns(X)
+    assert kept.tolist() == [0, 1, 2, 3, 4] and aliased.tolist() == [5]
+    fit = fit_conditional_logit(X, chosen)
+    assert fit['features'].tolist() == [0, 1, 2, 3, 4] and fit['aliased'].tolist() == [5]
+
+def test_default_attributes_leave_out_the_aliased_region():
+    # The Muslim and Hindu countries are exactly those of 4 regions, so one of these region dummies is aliased
+    info_df = synthetic_criminal_info(3000, seed=3).astype(object)
+    X, _, names, _ = choice_data(info_df, DEFAULT_ATTRIBUTES)
+    kept, aliased = estimable_columns(X)
+    assert len(kept) + len(aliased) == len(names) == 31
+    assert [names[feature] for feature in aliased] == ['region_South Asia']
+
+    table = conditional_logit_table({'round1': info_df})
+    assert table.attrs['aliased'] == ['region_South Asia']
+    assert 'region_South Asia' not in table.index and len(table) == 30
+    assert np.isfinite(table['std_error']).all()
+
+def test_separated_choices_warn():
+    _, X, _, _, _ = simulated_choices(200)
+    # The criminal is always the first man (or the first candidate), which the gender predicts perfectly in most scenarios
+    chosen = np.where(X[:, :, 0].any(axis=1), X[:, :, 0].argmax(axis=1), 0)
+    with pytest.warns(RuntimeWarning, match='did not converge'):
+        fit_conditional_logit(X[:, :, :1], chosen, max_iterations=5)
+
+def test_table_clusters_by_prompt_and_handles_no_scenarios():
+    info_df, _, _, _, _ = simulated_choices(300)
+    table = conditional_logit_table({'round1': info_df, 'round2': info_df.sample(frac=1, random_state=0)}, attributes=['gender', 'slot'])
+    assert list(table.columns) == TABLE_COLUMNS
+    assert list(table.index) == ['gender_Male', 'slot_2', 'slot_3', 'slot_4']
+    assert table.attrs['scenarios'] == 600 and table.attrs['converged']
+
+    empty = conditional_logit_table({'round1': info_df.assign(criminal=None)})
+    assert empty.empty and empty.attrs['scenarios'] == 0
@@ -0,0 +1,81 @@
+from pathlib import Path
+
+import pandas as pd
+
+from src.utils.experiment_sweep import (expand_sweep, interleave_jobs, job_is_complete, save_job_responses, copy_job_responses,
+                                        assemble_variant_responses, load_completion_index, variant_output_path, pipe_key)
+
+def load_config(model_name):
+    return {'model': model_name, 'temperature': 1.0, 'messages': [{'role': 'system', 'content': 'Write a story.'}]}
+
+SPEC = {'name': 'sweep', 'models': ['model1', 'model2'], 'num_generation_rounds': 2,
+        'variants': {'base': {}, 'same_as_base': {'temperature': 1.0}, 'hot': {'temperature': 1.5},
+                     'neutral': {'system_prompt': 'Write a crime story.'}}}
+
+def test_expand_sweep_deduplicates_identical_variants():
+    jobs = expand_sweep(SPEC, load_config)
+    assert len(jobs) == 2 * 3 * 2
+    assert jobs[0]['variants'] == ['base', 'same_as_base']
+    neutral = next(job for job in jobs if job['variants'] == ['neutral'])
+    assert neutral['config']['messages'][0]['content'] == 'Write a crime story.'
+
+    queues = interleave_jobs(jobs)
+    assert list(queues) == ['model1', 'model2']
+    assert [job['round'] for job in queues['model1']] == [0, 0, 0, 1, 1, 1]
+
+def test_saved_rounds_are_indexed_and_assembled(tmp_path):
+    jobs = [job for job in expand_sweep(SPEC, load_config) if job['model'] == 'model1' and 'base' in job['variants']]
+    assert not job_is_complete('sweep', jobs[0], 3, tmp_path)
+
+    save_job_responses('sweep', jobs[1], ['b1', 'b2', 'b3'], tmp_path)
+    assert job_is_complete('sweep', jobs[1], 3, tmp_path)
+    assert not job_is_complete('sweep', jobs[0], 3, tmp_path)
+    assert not assemble_variant_responses('sweep', 'base', 'model1', 2, tmp_path)
+
+    save_job_responses('sweep', jobs[0], ['a1', 'a2', 'a3'], tmp_path)
+    assert assemble_variant_responses('sweep', 'same_as_base', 'model1', 2, tmp_path)
+    response_df = pd.read_csv(variant_output_path('sweep', 'same_as_base', 'model1', tmp_path), sep=';')
+    assert response_df.to_dict('list') == {'round1': ['a1', 'a2', 'a3'], 'round2': ['b1', 'b2', 'b3']}
+    assert job_is_complete('sweep', jobs[0], 3, tmp_path)
+
+def test_completion_index_is_built_from_older_response_files(tmp_path):
+    path = variant_output_path('sweep', 'base', 'model1', tmp_path)
+    (tmp_path / 'sweep' / 'base').mkdir(parents=True)
+    pd.DataFrame({'round1': ['a1', 'a2'], 'round2': ['b1', None]}).to_csv(path, sep=';', index=False)
+    assert load_completion_index('sweep', 'base', 'model1', tmp_path) == {'round1': 2, 'round2': 1}
+
+    # A round generated again replaces its column and keeps the others
+    job = next(job for job in expand_sweep(SPEC, load_config) if job['model'] == 'model1' and job['round'] == 1)
+    save_job_responses('sweep', job, ['c1', 'c2'], tmp_path)
+    assert assemble_variant_responses('sweep', 'base', 'model1', 2, tmp_path)
+    assert pd.read_csv(path, sep=';').to_dict('list') == {'round1': ['a1', 'a2'], 'round2': ['c1', 'c2']}
+
+def test_new_variant_with_the_same_config_copies_the_existing_rounds(tmp_path):
+    spec = {**SPEC, 'models': ['model1'], 'variants': {'base': {}}}
+    for job in expand_sweep(spec, load_config):
+        save_job_responses('sweep', job, [f"r{job['round'] + 1}p{prompt}" for prompt in range(3)], tmp_path)
+    assert assemble_variant_responses('sweep', 'base', 'model1', 2, tmp_path)
+    base_path = Path(variant_output_path('sweep', 'base', 'model1', tmp_path))
+    base_responses = base_path.read_text()
+
+    # same_as_base is added later: its jobs are served by the rounds of base, nothing is generated again
+    jobs = [job for job in expand_sweep(SPEC, load_config) if job['model'] == 'model1' and 'base' in job['variants']]
+    for job in jobs:
+        assert not job_is_complete('sweep', job, 3, tmp_path)
+        assert copy_job_responses('sweep', job, 3, tmp_path)
+        assert job_is_complete('sweep', job, 3, tmp_path)
+    assert assemble_variant_responses('sweep', 'same_as_base', 'model1', 2, tmp_path)
+    assert base_path.read_text() == base_responses
+    assert pd.read_csv(variant_output_path('sweep', 'same_as_base', 'model1', tmp_path), sep=';').to_dict('list') == \
+        {'round1': ['r1p0', 'r1p1', 'r1p2'], 'round2': ['r2p0', 'r2p1', 'r2p2']}
+
+    # Without a variant holding the round, the job is generated
+    hot = next(job for job in expand_sweep(SPEC, load_config) if job['variants'] == ['hot'])
+    assert not copy_job_responses('sweep', hot, 3, tmp_path)
+
+def test_jobs_are_grouped_by_loading_options():
+    spec = {**SPEC, 'models': ['model1'], 'variants': {'base': {}, 'small': {'model': 'small-model'}, 'hot': {'temperature': 1.5}}}
+    queue = interleave_jobs(expand_sweep(spec, load_config))['model1']
+    assert [(job['variants'], job['round']) for job in queue] == \
+        [(['base'], 0), (['hot'], 0), (['base'], 1), (['hot'], 1), (['small'], 0), (['small'], 1)]
+    assert pipe_key(queue[0]['config']) == pipe_key(queue[1]['config']) != pipe_key(queue[-1]['config'])
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from src.utils.analyse_response_text import CriminalInfoExtractor
+from src.utils.extraction_audit import audit_flags, NATIONALITY_SWAP, NATIONALITY_MISMATCH, DUPLICATE_NAMES, MISSING_CHARACTER
+
+from test_analyse_response_text import SCENARIO, RESPONSES
+
+def extracted_rows(responses, use_index=False):
+    rows = pd.DataFrame([{'response': response, **SCENARIO} for response in responses])
+    extractor = CriminalInfoExtractor(interactive=False, use_index=use_index)
+    return rows.apply(extractor.extract, axis=1, result_type='expand')
+
+def test_demonyms_match_their_origin_in_the_default_mode():
+    # The default extractor keeps "Cuban", "Polish", ... as stated; the audit resolves them
+    info_df = extracted_rows(RESPONSES)
+    assert info_df.loc[0, 'nationality1'] == 'Cuban'
+    np.testing.assert_array_equal(audit_flags(info_df), audit_flags(extracted_rows(RESPONSES, use_index=True)))
+    assert (audit_flags(info_df) & (NATIONALITY_SWAP | NATIONALITY_MISMATCH) == 0).all()
+
+def test_demonym_swaps_and_mismatches_are_flagged():
+    swapped = RESPONSES[0].replace('Nationality: Cuban', 'Nationality: Japanese')
+    unknown = RESPONSES[0].replace('Nationality: Polish', 'Nationality: Martian')
+    flags = audit_flags(extracted_rows([swapped, unknown]))
+    assert flags.tolist() == [NATIONALITY_SWAP, NATIONALITY_MISMATCH]
+
+def test_names_and_genders():
+    info_df = pd.DataFrame([{**{f'name{i}': name for i, name in enumerate(['Ana', 'ana', 'Piotr', 'Yuki'], 1)},
+                             **{f'gender{i}': 'Female' for i in range(1, 5)}},
+                            {**{f'name{i}': name for i, name in enumerate(['Ana', None, 'Piotr', 'Yuki'], 1)},
+                             **{f'gender{i}': 'Female' for i in range(1, 5)}}])
+    assert audit_flags(info_df).tolist() == [DUPLICATE_NAMES, MISSING_CHARACTER]
@@ -0,0 +1,36 @@
+import numpy as np
+
+from src.utils.request_scheduler import stratified_schedule
+
+from conftest import synthetic_criminal_info
+
+NUM_PROMPTS = 2000
+NUM_ROUNDS = 2
+
+def prefix_deviation(values):
+    """Largest gap, over every prefix and value, between its count and its expected share"""
+    values = np.asarray(values)
+    positions = np.arange(1, len(values) + 1)
+    return max(np.abs(np.cumsum(values == value) - positions * np.mean(values == value)).max()
+               for value in np.unique(values))
+
+def test_every_pair_is_scheduled_once_with_rounds_interleaved():
+    info_df = synthetic_criminal_info(NUM_PROMPTS)
+    schedule = stratified_schedule(info_df, NUM_ROUNDS)
+    assert sorted(schedule) == [(prompt_idx, round) for prompt_idx in range(NUM_PROMPTS) for round in range(NUM_ROUNDS)]
+    assert [round for _, round in schedule[:2 * NUM_ROUNDS]] == [0, 1, 0, 1]
+    assert stratified_schedule(info_df, NUM_ROUNDS) == schedule
+
+def test_prefixes_are_balanced_by_location_with_origins_interleaved():
+    info_df = synthetic_criminal_info(NUM_PROMPTS)
+    order = [prompt_idx for prompt_idx, round in stratified_schedule(info_df, NUM_ROUNDS) if round == 0]
+    assert prefix_deviation(info_df['location'].to_numpy()[order]) < 2
+
+    # The origins are interleaved within each location, unlike in a shuffle of each location
+    locations, origins = info_df['location'].to_numpy(), info_df['origin1'].to_numpy()
+    shuffled = [prompt_idx for prompt_idx, _ in stratified_schedule(info_df, 1, strata_columns='location')]
+    deviations = {}
+    for name, location_order in [('interleaved', order), ('shuffled', shuffled)]:
+        deviations[name] = np.mean([prefix_deviation(origins[[prompt_idx for prompt_idx in location_order if locations[prompt_idx] == location]])
+                                    for location in np.unique(locations)])
+    assert deviations['interleaved'] < 2 < deviations['shuffled']
@@ -0,0 +1,36 @@
+import numpy as np
+
+from conftest import synthetic_criminal_info
+from src.utils import resampling_statistics
+from src.utils.resampling_statistics import adjust_pvalues, compute_resampling_statistics, create_resampling_pool
+
+def test_compute_resampling_statistics_end_to_end():
+    criminal_info = {'round1': synthetic_criminal_info(200, seed=0), 'round2': synthetic_criminal_info(200, seed=1)}
+    significance_dict = compute_resampling_statistics(criminal_info, num_resamples=200, num_workers=1)
+
+    assert set(significance_dict) == {'immigrant_stats', 'gender_stats', 'country_stats', 'region_stats', 'religion_stats'}
+    gender_df = significance_dict['gender_stats']
+    for round in criminal_info:
+        assert list(gender_df.columns[gender_df.columns.str.startswith(round)]) == [
+            f'{round}_{name}' for name in ['percentage', 'ci_low', 'ci_high', 'p_value', 'p_adjusted']]
+        assert (gender_df[f'{round}_ci_low'] <= gender_df[f'{round}_percentage']).all()
+        assert (gender_df[f'{round}_percentage'] <= gender_df[f'{round}_ci_high']).all()
+        assert gender_df[f'{round}_p_value'].between(0, 1).all()
+
+def test_compute_resampling_statistics_same_results_with_workers(monkeypatch):
+    # Batches of 25 resamples, so that the workers share several of them
+    monkeypatch.setattr(resampling_statistics, 'MAX_BATCH_CELLS', 25 * 100)
+    criminal_info = {'round1': synthetic_criminal_info(100), 'round2': synthetic_criminal_info(100, seed=1)}
+    serial = compute_resampling_statistics(criminal_info, num_resamples=100, num_workers=1)
+    parallel = compute_resampling_statistics(criminal_info, num_resamples=100, num_workers=2)
+    with create_resampling_pool(2) as executor:
+        shared = compute_resampling_statistics(criminal_info, num_resamples=100, num_workers=2, executor=executor)
+    for table in serial:
+        assert serial[table].equals(parallel[table])
+        assert serial[table].equals(shared[table])
+
+def test_adjust_pvalues_leaves_nan_out_of_the_family():
+    adjusted = adjust_pvalues(np.array([0.01, np.nan, 0.04]), 'fdr_bh')
+    assert np.isnan(adjusted[1])
+    np.testing.assert_allclose(adjusted[[0, 2]], [0.02, 0.04])
+    np.testing.assert_allclose(adjust_pvalues(np.array([0.01, 0.04]), 'holm'), [0.02, 0.04])
@@ -0,0 +1,65 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from src.utils import response_archive
+from src.utils.response_archive import DEFAULT_CODEC, ResponseArchive, check_codec, response_source, write_archive
+
+def write_checkpoint(path, mtime):
+    with open(path, 'w') as f:
+        json.dump({'responses': [['story']], 'current_round': 0, 'current_prompt_idx': 0}, f)
+    os.utime(path, (mtime, mtime))
+
+def test_response_source_prefers_a_newer_checkpoint(tmp_path):
+    processed_dir, temp_dir = tmp_path / 'processed', tmp_path / 'temp'
+    processed_dir.mkdir()
+    temp_dir.mkdir()
+    assert response_source('model', 'csv', processed_dir, temp_dir) == (None, None)
+
+    csv_path = processed_dir / 'model_responses.csv'
+    csv_path.write_text('round1\nstory\n')
+    os.utime(csv_path, (1000, 1000))
+    assert response_source('model', 'csv', processed_dir, temp_dir) == ('csv', str(csv_path))
+
+    checkpoint = temp_dir / 'model_checkpoint.json'
+    write_checkpoint(checkpoint, 2000)
+    assert response_source('model', 'csv', processed_dir, temp_dir) == ('checkpoint', str(checkpoint))
+    # A stale per-round checkpoint of an older run is ignored when the model checkpoint exists
+    write_checkpoint(temp_dir / 'model_round2_checkpoint.json', 3000)
+    assert response_source('model', 'csv', processed_dir, temp_dir) == ('checkpoint', str(checkpoint))
+    assert response_source('model', 'csv', processed_dir, None) == ('csv', str(csv_path))
+
+def test_response_source_reads_per_round_checkpoints_of_older_runs(tmp_path):
+    write_checkpoint(tmp_path / 'model_round1_checkpoint.json', 1000)
+    write_checkpoint(tmp_path / 'model_round3_checkpoint.json', 2000)
+    assert response_source('model', 'csv', tmp_path, tmp_path) == ('checkpoint', str(tmp_path / 'model_round3_checkpoint.json'))
+
+def responses_frame():
+    # Responses with separators other than newlines, and a prompt missing from round2
+    return pd.DataFrame({'round1': [f'Story {prompt_id}. The criminal is Ana from Cuba.' for prompt_id in range(40)],
+                         'round2': [f'Second story {prompt_id}; "quoted"' if prompt_id != 7 else None for prompt_id in range(40)]})
+
+def test_archive_round_trip(tmp_path):
+    responses_df = responses_frame()
+    write_archive('model', responses_df, tmp_path, records_per_shard=16, records_per_block=4)
+    archive = ResponseArchive('model', tmp_path)
+
+    assert archive.rounds() == ['round1', 'round2']
+    assert archive.index('round1')['codec'] == DEFAULT_CODEC == 'gzip'
+    assert len(archive.index('round1')['shards']) == 3
+    assert archive.get(25, 'round1') == responses_df.at[25, 'round1']
+    assert archive.get(7, 'round2') is None
+    assert [prompt_id for prompt_id, _ in archive.iter_round('round2')] == [prompt_id for prompt_id in range(40) if prompt_id != 7]
+    pd.testing.assert_frame_equal(archive.to_frame().fillna('missing'), responses_df.fillna('missing').rename_axis('prompt_id'),
+                                  check_index_type=False)
+
+def test_zstd_needs_zstandard(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_archive, 'zstandard', None)
+    with pytest.raises(ImportError, match='pip install zstandard'):
+        check_codec('zstd')
+    with pytest.raises(ValueError):
+        check_codec('bz2')
+    with pytest.raises(ImportError):
+        write_archive('model', responses_frame(), tmp_path, codec='zstd')
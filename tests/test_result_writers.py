@@ -0,0 +1,41 @@
+import importlib.util
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils import result_writers
+from src.utils.result_writers import load_tables, save_results, save_tables
+
+TABLES = {'gender_stats': pd.DataFrame({'round1_total': [10, 12], 'round1_percentage': [25.0, np.nan]},
+                                       index=pd.Index(['Female', 'Male'])),
+          'country_stats': pd.DataFrame({'round1_total': [3]}, index=pd.Index(['Cuba']))}
+
+def test_csv_tables_round_trip(tmp_path):
+    paths = save_tables(TABLES, tmp_path / 'statistics')
+    assert sorted(path.split('/')[-1] for path in paths) == ['country_stats.csv', 'gender_stats.csv']
+    tables = load_tables(tmp_path / 'statistics')
+    for name, df in TABLES.items():
+        pd.testing.assert_frame_equal(tables[name], df)
+
+def test_parquet_without_engine_fails_before_writing(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_writers.importlib.util, 'find_spec', lambda name: None)
+    with pytest.raises(ImportError, match='pip install pyarrow'):
+        save_tables(TABLES, tmp_path / 'statistics', 'parquet')
+    assert not (tmp_path / 'statistics').exists()
+
+def test_parquet_tables_round_trip(tmp_path):
+    if importlib.util.find_spec('pyarrow') is None and importlib.util.find_spec('fastparquet') is None:
+        pytest.skip('no Parquet engine installed')
+    save_tables(TABLES, tmp_path / 'statistics', 'parquet')
+    tables = load_tables(tmp_path / 'statistics')
+    for name, df in TABLES.items():
+        pd.testing.assert_frame_equal(tables[name], df)
+
+def test_excel_export_writes_one_sheet_per_table(tmp_path):
+    pytest.importorskip('openpyxl')
+    paths = save_results(TABLES, str(tmp_path / 'statistics'), excel=True)
+    assert paths[-1] == str(tmp_path / 'statistics.xlsx')
+    sheets = pd.read_excel(paths[-1], sheet_name=None, index_col=0)
+    assert list(sheets) == ['gender_stats', 'country_stats']
+    pd.testing.assert_frame_equal(sheets['gender_stats'], TABLES['gender_stats'])
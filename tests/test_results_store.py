@@ -0,0 +1,58 @@
+import pandas as pd
+
+from conftest import synthetic_criminal_info
+from src.utils import scenario_store
+from src.utils.create_scenario import PromptTemplate, template_hash
+from src.utils.results_store import ResultsStore
+from src.utils.scenario_store import INFO_COLUMNS, save_scenarios, with_template_hashes
+
+def scenario_info(num_rows):
+    info_df = synthetic_criminal_info(num_rows)[['origin1', 'origin2', 'origin3', 'origin4', 'location']].astype(str)
+    for i in range(1, 5):
+        info_df[f'religion{i}'] = 'Christian'
+    return info_df[INFO_COLUMNS]
+
+def test_scenarios_are_stored_with_their_template_hash(tmp_path, monkeypatch):
+    monkeypatch.setattr(scenario_store, 'SCENARIOS_PATH', str(tmp_path / 'scenarios.csv'))
+    monkeypatch.setattr(scenario_store, 'LABELS_PATH', str(tmp_path / 'labels.json'))
+    info_df = scenario_info(4)
+    assert (with_template_hashes(info_df, 'Crime in LOC.')['template_hash'] == template_hash('Crime in LOC.')).all()
+
+    templates = [PromptTemplate('Crime in LOC.'), PromptTemplate('A story set in LOC.')]
+    save_scenarios(info_df.assign(template_hash=[templates[row % 2].hash for row in range(4)]), templates,
+                   scenario_store.SCENARIOS_PATH, scenario_store.LABELS_PATH)
+    hashes = with_template_hashes(info_df, 'Crime in LOC.')['template_hash']
+    assert hashes.tolist() == [templates[row % 2].hash for row in range(4)]
+
+    with ResultsStore(str(tmp_path / 'results.db')) as store:
+        store.add_scenarios(with_template_hashes(info_df, 'Crime in LOC.'))
+        scenarios_df = store.scenarios()
+    assert scenarios_df['template_hash'].tolist() == hashes.tolist()
+    assert scenarios_df['location'].tolist() == info_df['location'].tolist()
+
+def test_responses_and_extractions_join_on_prompt(tmp_path):
+    info_df = synthetic_criminal_info(3).astype(object)
+    info_df.index = [10, 11, 12]
+    with ResultsStore(str(tmp_path / 'results.db')) as store:
+        store.add_responses('model', [(0, 10, 'story 10'), (0, 12, 'story 12'), (1, 11, 'story 11')])
+        store.add_extractions('model', 'round1', info_df)
+        # Rows inserted again replace the previous ones
+        store.add_responses('model', [(0, 12, 'story 12 again')])
+
+        joined = store.responses_with_extractions('model', 'round1')
+        assert joined['prompt_id'].tolist() == [10, 12]
+        assert joined['response'].tolist() == ['story 10', 'story 12 again']
+        assert joined['criminal'].tolist() == info_df.loc[[10, 12], 'criminal'].tolist()
+
+        wide_df = store.round_responses('model')
+        assert list(wide_df.columns) == ['round1', 'round2']
+        assert wide_df.loc[11, 'round2'] == 'story 11' and pd.isna(wide_df.loc[11, 'round1'])
+
+def test_review_decisions_keep_the_first_decision_time(tmp_path):
+    record = {'review_key': 'key', 'model': 'model', 'round': 'round2', 'row': 5, 'field': 'gender', 'character': 1,
+              'value': 'Female', 'decided_at': '2024-01-01T00:00:00'}
+    with ResultsStore(str(tmp_path / 'results.db')) as store:
+        store.add_review_decisions([record])
+        store.add_review_decisions([{**record, 'value': 'Male', 'decided_at': '2024-02-01T00:00:00'}])
+        decisions = store.query('SELECT * FROM review_decisions')
+    assert decisions[['round', 'value', 'decided_at']].values.tolist() == [[2, 'Male', '2024-01-01T00:00:00']]
@@ -0,0 +1,39 @@
+import os
+import warnings
+
+import pandas as pd
+import pytest
+
+from src.utils import scenario_store
+from src.utils.create_scenario import PromptTemplate
+from src.utils.scenario_store import load_prompt_inputs
+
+from test_results_store import scenario_info
+
+@pytest.fixture
+def prompt_texts(tmp_path, monkeypatch):
+    """input_texts.csv rendered from 'Crime in LOC.', without a scenario store"""
+    for name, file_name in [('SCENARIOS_PATH', 'scenarios.csv'), ('LABELS_PATH', 'labels.json'),
+                            ('PROMPT_TEXTS_PATH', 'input_texts.csv'), ('INFO_PATH', 'input_info.csv')]:
+        monkeypatch.setattr(scenario_store, name, str(tmp_path / file_name))
+    info_df = scenario_info(3)
+    info_df.to_csv(scenario_store.INFO_PATH, sep=';', index=False)
+    input_df = pd.concat([pd.DataFrame({'prompt': PromptTemplate('Crime in LOC.').render_frame(info_df)}), info_df], axis=1)
+    input_df.to_csv(scenario_store.PROMPT_TEXTS_PATH, sep=';', index=False)
+    return info_df
+
+def test_current_prompt_texts_are_read_without_warning(prompt_texts):
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        info_df, prompts = load_prompt_inputs(2, 'Crime in LOC.')
+    assert prompts == [f"Crime in {location}." for location in prompt_texts['location'][:2]]
+    pd.testing.assert_frame_equal(info_df, prompt_texts.iloc[:2])
+
+def test_stale_prompt_texts_are_reported(prompt_texts):
+    with pytest.warns(UserWarning, match='differ from those of the current base_prompt'):
+        load_prompt_inputs(base_prompt='A story set in LOC.')
+
+    mtime = os.path.getmtime(scenario_store.PROMPT_TEXTS_PATH)
+    os.utime(scenario_store.INFO_PATH, (mtime + 10, mtime + 10))
+    with pytest.warns(UserWarning, match='input_info.csv was changed after the prompts were exported'):
+        load_prompt_inputs()
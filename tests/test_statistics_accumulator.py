@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from conftest import synthetic_criminal_info
+from src.utils.compute_statistics import compute_responses_statistics
+from src.utils.statistics_accumulator import StatisticsAccumulator
+
+def test_merged_scenario_updates_give_the_batch_tables(tmp_path):
+    criminal_info = {'round1': synthetic_criminal_info(60, seed=0).astype(object),
+                     'round2': synthetic_criminal_info(40, seed=1).astype(object)}
+    expected = compute_responses_statistics(criminal_info)
+
+    # Two shards updated one scenario at a time, one of them saved and reloaded
+    shards = [StatisticsAccumulator(), StatisticsAccumulator()]
+    for round, info_df in criminal_info.items():
+        for position, (_, scenario) in enumerate(info_df.iterrows()):
+            shards[position % 2].update(round, scenario)
+    shards[1].save(tmp_path / 'shard.json')
+    merged = shards[0].merge(StatisticsAccumulator.load(tmp_path / 'shard.json'))
+    for table, df in merged.finalize().items():
+        pd.testing.assert_frame_equal(df, expected[table])
+
+    # A whole DataFrame at once gives the same counts
+    accumulator = StatisticsAccumulator(coding=merged.coding)
+    for round, info_df in criminal_info.items():
+        accumulator.update_frame(round, info_df)
+    for table, df in accumulator.finalize().items():
+        pd.testing.assert_frame_equal(df, expected[table])
+
+def test_merge_rejects_other_categories():
+    accumulator = StatisticsAccumulator()
+    other = StatisticsAccumulator()
+    other.coding = {**other.coding, 'countries': other.coding['countries'][::-1]}
+    with pytest.raises(ValueError, match='different countries'):
+        accumulator.merge(other)
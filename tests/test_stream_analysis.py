@@ -0,0 +1,98 @@
+import importlib.util
+import json
+
+import pandas as pd
+import pytest
+
+from src.utils import response_stream
+from src.utils.analyse_response_text import CriminalInfoExtractor
+from src.utils.compute_round_agreement import calculate_round_agreement
+from src.utils.extraction_cache import ExtractionCache
+from src.utils.response_stream import open_stream, write_stream_record, StreamFollower, stream_path
+
+from test_analyse_response_text import SCENARIO, RESPONSES
+
+spec = importlib.util.spec_from_file_location('stream_analysis', 'scripts/stream_analysis.py')
+stream_analysis = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(stream_analysis)
+
+MODEL = 'test-model'
+NUM_ROUNDS = 2
+
+@pytest.fixture
+def analysis(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_stream, 'STREAM_DIR', str(tmp_path / 'stream'))
+    monkeypatch.setattr(stream_analysis, 'SNAPSHOT_DIR', str(tmp_path / 'live'))
+    info_df = pd.DataFrame([SCENARIO] * len(RESPONSES))
+    return stream_analysis.StreamAnalysis(MODEL, info_df, CriminalInfoExtractor(interactive=False),
+                                          ExtractionCache(MODEL, cache_dir=str(tmp_path / 'cache')), NUM_ROUNDS)
+
+def write_responses(stream, prompts, round, shift=0):
+    for prompt_idx in prompts:
+        write_stream_record(stream, {'prompt_idx': prompt_idx, 'round': round,
+                                     'response': RESPONSES[(prompt_idx + shift) % len(RESPONSES)]})
+
+def read_status():
+    with open(f'{stream_analysis.SNAPSHOT_DIR}/status_{MODEL}.json') as f:
+        return json.load(f)
+
+def test_replay_with_restart(analysis):
+    follower = StreamFollower(stream_path(MODEL))
+    stream, _ = open_stream(MODEL)
+    write_responses(stream, range(3), round=0)
+    write_responses(stream, range(2), round=1, shift=1)
+    analysed, complete = analysis.read(*follower.read_new())
+    assert analysed and not complete
+    analysis.write_snapshot()
+    status = read_status()
+    assert status['responses_received'] == 5 and status['extracted_per_round'] == {'round1': 3, 'round2': 2}
+    assert status['prompts_in_all_rounds'] == 2
+
+    # The last prompt of round 2 completes the run
+    write_responses(stream, [2], round=1, shift=1)
+    analysed, complete = analysis.read(*follower.read_new())
+    assert analysed and complete
+    analysis.write_snapshot()
+    stream.close()
+
+    # The incremental agreement is that of the extracted rounds
+    criminal_info = {}
+    for round in range(NUM_ROUNDS):
+        rows = pd.DataFrame([{'response': RESPONSES[(prompt_idx + round) % len(RESPONSES)], **SCENARIO}
+                             for prompt_idx in range(len(RESPONSES))])
+        criminal_info[f'round{round+1}'] = rows.apply(CriminalInfoExtractor(interactive=False).extract, axis=1, result_type='expand')
+    expected = calculate_round_agreement(criminal_info)['pairwise_kappa']
+    snapshot = pd.read_csv(f'{stream_analysis.SNAPSHOT_DIR}/round_agreement_{MODEL}.csv')
+    pd.testing.assert_frame_equal(snapshot, expected, check_dtype=False)
+
+    # A new run with its own id replaces the stream: the counts of the previous run are dropped
+    stream, run_id = open_stream(MODEL)
+    write_responses(stream, [0], round=0)
+    analysed, complete = analysis.read(*follower.read_new())
+    assert analysed and not complete and analysis.current_run == run_id
+    analysis.write_snapshot()
+    status = read_status()
+    assert status['responses_received'] == 1 and status['extracted_per_round'] == {'round1': 1}
+    assert status['prompts_in_all_rounds'] == 0
+
+    # Its "done" record ends the analysis before all responses are received
+    write_stream_record(stream, {'done': True, 'run_id': run_id})
+    stream.close()
+    assert analysis.read(*follower.read_new()) == (False, True)
+
+def test_awaited_run_includes_the_stream_it_resumes(analysis):
+    follower = StreamFollower(stream_path(MODEL))
+    stream, _ = open_stream(MODEL)
+    write_responses(stream, range(2), round=0)
+    stream.close()
+    analysis.run_id = 'resumed-run'
+    # Responses of another run are held back until the header of the awaited run is read
+    assert analysis.read(*follower.read_new()) == (False, False)
+    assert not analysis.counted
+
+    stream, _ = open_stream(MODEL, resume=True, run_id='resumed-run')
+    write_responses(stream, [2], round=0)
+    stream.close()
+    analysed, complete = analysis.read(*follower.read_new())
+    assert analysed and not complete
+    assert analysis.agreement.round_rows['round1'] == 3 and len(analysis.received) == 3